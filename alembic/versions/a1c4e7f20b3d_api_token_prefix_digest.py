@@ -0,0 +1,38 @@
+"""API token prefix lookup and HMAC digest
+
+Revision ID: a1c4e7f20b3d
+Revises: 3e29ca2e8fcf
+Create Date: 2025-08-04 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c4e7f20b3d'
+down_revision: Union[str, Sequence[str], None] = '3e29ca2e8fcf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing tokens keep their bcrypt hash until they are re-hashed on first use
+    op.add_column('api_tokens', sa.Column('token_prefix', sa.String(length=16), nullable=True))
+    op.add_column('api_tokens', sa.Column('token_digest', sa.String(length=64), nullable=True))
+    op.alter_column('api_tokens', 'token_hash', existing_type=sa.String(length=255), nullable=True)
+    op.create_index(op.f('ix_api_tokens_token_prefix'), 'api_tokens', ['token_prefix'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Tokens already moved to the digest scheme cannot be restored to bcrypt
+    op.execute("UPDATE api_tokens SET is_active = false WHERE token_hash IS NULL")
+    op.execute("UPDATE api_tokens SET token_hash = '' WHERE token_hash IS NULL")
+    op.drop_index(op.f('ix_api_tokens_token_prefix'), table_name='api_tokens')
+    op.alter_column('api_tokens', 'token_hash', existing_type=sa.String(length=255), nullable=False)
+    op.drop_column('api_tokens', 'token_digest')
+    op.drop_column('api_tokens', 'token_prefix')
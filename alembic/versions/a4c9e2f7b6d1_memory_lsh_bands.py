@@ -0,0 +1,39 @@
+"""Find near-duplicate memories by MinHash LSH band keys
+
+Revision ID: a4c9e2f7b6d1
+Revises: f3b8d1e6a925
+Create Date: 2025-09-12 09:41:27.308115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.db.partitioning import partition_count
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c9e2f7b6d1'
+down_revision: Union[str, Sequence[str], None] = 'f3b8d1e6a925'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing memories stay NULL, which matches nothing, until
+    # `python -m app.db.compaction backfill` bands them in batches
+    op.execute("ALTER TABLE memories ADD COLUMN IF NOT EXISTS lsh_bands bigint[]")
+
+    # Partitioned tables don't support CONCURRENTLY
+    concurrently = "" if partition_count(op.get_bind()) else "CONCURRENTLY "
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"CREATE INDEX {concurrently}IF NOT EXISTS idx_memories_lsh_bands ON memories USING gin (lsh_bands)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS idx_memories_lsh_bands")
+    op.execute("ALTER TABLE memories DROP COLUMN IF EXISTS lsh_bands")
@@ -0,0 +1,56 @@
+"""Expire memories by TTL and per-namespace retention rules
+
+Revision ID: b5d0f3a8c2e7
+Revises: a4c9e2f7b6d1
+Create Date: 2025-09-15 14:06:52.481930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.db.partitioning import partition_count
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d0f3a8c2e7'
+down_revision: Union[str, Sequence[str], None] = 'a4c9e2f7b6d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TABLE memories ADD COLUMN IF NOT EXISTS expires_at timestamptz")
+
+    op.create_table(
+        'retention_rules',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('namespace', sa.String(length=255), nullable=False),
+        sa.Column('max_age_days', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_retention_rules_id'), 'retention_rules', ['id'], unique=False)
+    op.create_index('idx_retention_rules_user_namespace', 'retention_rules', ['user_id', 'namespace'], unique=True)
+
+    # Partitioned tables don't support CONCURRENTLY
+    concurrently = "" if partition_count(op.get_bind()) else "CONCURRENTLY "
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"CREATE INDEX {concurrently}IF NOT EXISTS idx_memories_expires_at "
+            "ON memories (expires_at) WHERE expires_at IS NOT NULL"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS idx_memories_expires_at")
+    op.drop_index('idx_retention_rules_user_namespace', table_name='retention_rules')
+    op.drop_index(op.f('ix_retention_rules_id'), table_name='retention_rules')
+    op.drop_table('retention_rules')
+    op.execute("ALTER TABLE memories DROP COLUMN IF EXISTS expires_at")
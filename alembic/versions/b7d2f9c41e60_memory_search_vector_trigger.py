@@ -0,0 +1,56 @@
+"""Maintain memories.search_vector with a trigger
+
+Revision ID: b7d2f9c41e60
+Revises: a1c4e7f20b3d
+Create Date: 2025-08-11 09:40:18.553920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2f9c41e60'
+down_revision: Union[str, Sequence[str], None] = 'a1c4e7f20b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A generated column can't be used: array_to_string() is only STABLE
+    op.execute("""
+        CREATE OR REPLACE FUNCTION memories_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := to_tsvector('english', NEW.text || ' ' || array_to_string(NEW.tags, ' '));
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER memories_search_vector
+        BEFORE INSERT OR UPDATE OF text, tags ON memories
+        FOR EACH ROW EXECUTE FUNCTION memories_search_vector_update()
+    """)
+
+    # Rows whose follow-up UPDATE never ran; walk the id range in batches
+    conn = op.get_bind()
+    max_id = conn.execute(sa.text("SELECT coalesce(max(id), 0) FROM memories")).scalar_one()
+    for start in range(0, max_id, BACKFILL_BATCH_SIZE):
+        conn.execute(
+            sa.text(
+                "UPDATE memories SET search_vector = to_tsvector('english', text || ' ' || array_to_string(tags, ' ')) "
+                "WHERE id > :start AND id <= :end AND search_vector IS NULL"
+            ),
+            {"start": start, "end": start + BACKFILL_BATCH_SIZE},
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS memories_search_vector ON memories")
+    op.execute("DROP FUNCTION IF EXISTS memories_search_vector_update()")
@@ -0,0 +1,33 @@
+"""Optionally hash partition memories on namespace
+
+Revision ID: c5e81a3d7f94
+Revises: b7d2f9c41e60
+Create Date: 2025-08-18 14:05:47.219604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.config import settings
+from app.db.partitioning import partition_memories, unpartition_memories
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e81a3d7f94'
+down_revision: Union[str, Sequence[str], None] = 'b7d2f9c41e60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Opt-in: a no-op unless MEMORY_PARTITIONS is set. Later installs can
+    # convert with `python -m app.db.partitioning partition`.
+    if settings.memory_partitions:
+        partition_memories(op.get_bind(), settings.memory_partitions)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    unpartition_memories(op.get_bind())
@@ -0,0 +1,172 @@
+"""Maintain per-namespace memory and tag counts with triggers
+
+Revision ID: c6f2a8e1d493
+Revises: b5d0f3a8c2e7
+Create Date: 2025-09-22 10:17:36.804215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6f2a8e1d493'
+down_revision: Union[str, Sequence[str], None] = 'b5d0f3a8c2e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Memories a statement added (+1) and removed (-1); an update removes the old
+# version and adds the new one, so only changed tags count
+CHANGES = {
+    "INSERT": "SELECT user_id, uid, namespace, tags, 1 AS sign FROM new_rows",
+    "UPDATE": (
+        "SELECT user_id, uid, namespace, tags, -1 AS sign FROM old_rows "
+        "UNION ALL SELECT user_id, uid, namespace, tags, 1 FROM new_rows"
+    ),
+    "DELETE": "SELECT user_id, uid, namespace, tags, -1 AS sign FROM old_rows",
+}
+
+# Counts only go up by upsert and down by plain UPDATE, so deleting a user,
+# which cascades to its memories and counts in no set order, never inserts
+# rows for it. Rows are upserted in key order, so concurrent batches lock
+# them in the same order.
+APPLY_CHANGES = """
+        WITH changes AS ({changes}),
+        tag_deltas AS (
+            SELECT c.user_id, c.uid, c.namespace, t.tag, sum(c.sign) AS delta
+            FROM changes c CROSS JOIN LATERAL (SELECT DISTINCT unnest(c.tags) AS tag) t
+            WHERE c.user_id IS NOT NULL
+            GROUP BY 1, 2, 3, 4 HAVING sum(c.sign) <> 0
+        ),
+        added AS (
+            INSERT INTO tag_counts AS t (user_id, uid, namespace, tag, memory_count)
+            SELECT user_id, uid, namespace, tag, delta FROM tag_deltas WHERE delta > 0 ORDER BY 1, 2, 3, 4
+            ON CONFLICT (user_id, uid, namespace, tag) DO UPDATE SET memory_count = t.memory_count + excluded.memory_count
+            RETURNING t.user_id, t.uid, t.namespace, t.xmax = 0 AS created
+        ),
+        removed AS (
+            UPDATE tag_counts t SET memory_count = t.memory_count + d.delta
+            FROM tag_deltas d
+            WHERE d.delta < 0 AND t.user_id = d.user_id AND t.uid = d.uid AND t.namespace = d.namespace AND t.tag = d.tag
+            RETURNING t.*
+        ),
+        namespace_deltas AS (
+            SELECT user_id, uid, namespace, sum(memories) AS memories, sum(tags) AS tags
+            FROM (
+                SELECT user_id, uid, namespace, sign AS memories, 0 AS tags FROM changes WHERE user_id IS NOT NULL
+                UNION ALL SELECT user_id, uid, namespace, 0, 1 FROM added WHERE created
+                UNION ALL SELECT user_id, uid, namespace, 0, -1 FROM removed WHERE memory_count <= 0
+            ) d
+            GROUP BY 1, 2, 3 HAVING sum(memories) <> 0 OR sum(tags) <> 0
+        ),
+        created AS (
+            INSERT INTO namespace_stats AS s (user_id, uid, namespace, memory_count, tag_count)
+            SELECT user_id, uid, namespace, memories, tags FROM namespace_deltas WHERE memories > 0 ORDER BY 1, 2, 3
+            ON CONFLICT (user_id, uid, namespace) DO UPDATE SET
+                memory_count = s.memory_count + excluded.memory_count,
+                tag_count = s.tag_count + excluded.tag_count,
+                updated_at = now()
+        ),
+        updated AS (
+            UPDATE namespace_stats s SET
+                memory_count = s.memory_count + d.memories, tag_count = s.tag_count + d.tags, updated_at = now()
+            FROM namespace_deltas d
+            WHERE d.memories <= 0 AND s.user_id = d.user_id AND s.uid = d.uid AND s.namespace = d.namespace
+        )
+        SELECT array_agg(r) INTO emptied FROM removed r WHERE r.memory_count <= 0;
+
+        -- A row can't be modified twice in one statement, so tags no memory
+        -- has any more are deleted in a second one
+        DELETE FROM tag_counts t USING unnest(emptied) e
+        WHERE t.user_id = e.user_id AND t.uid = e.uid AND t.namespace = e.namespace AND t.tag = e.tag
+            AND t.memory_count <= 0;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'namespace_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('uid', sa.String(length=255), nullable=False),
+        sa.Column('namespace', sa.String(length=255), nullable=False),
+        sa.Column('memory_count', sa.BigInteger(), nullable=False),
+        sa.Column('tag_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'uid', 'namespace')
+    )
+    op.create_table(
+        'tag_counts',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('uid', sa.String(length=255), nullable=False),
+        sa.Column('namespace', sa.String(length=255), nullable=False),
+        # Byte order, so prefix matches are a range of the primary key
+        sa.Column('tag', sa.Text(collation='C'), nullable=False),
+        sa.Column('memory_count', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'uid', 'namespace', 'tag')
+    )
+    op.execute(
+        "CREATE INDEX idx_tag_counts_facets ON tag_counts (user_id, uid, namespace, memory_count DESC, tag)"
+    )
+
+    branches = "\n    ELS".join(
+        f"IF TG_OP = '{operation}' THEN{APPLY_CHANGES.format(changes=changes)}"
+        for operation, changes in CHANGES.items()
+    )
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION memories_stats_update() RETURNS trigger AS $$
+        DECLARE
+            emptied tag_counts[];
+        BEGIN
+            {branches}
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    # Statement triggers see every row of a batch or COPY at once; transition
+    # tables need one trigger per event
+    for operation, tables in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+    ):
+        op.execute(f"""
+            CREATE TRIGGER memories_stats_{operation.lower()}
+            AFTER {operation} ON memories REFERENCING {tables}
+            FOR EACH STATEMENT EXECUTE FUNCTION memories_stats_update()
+        """)
+
+    # Count the existing memories; the triggers' lock on memories holds off
+    # writes until this commits, so none are missed or counted twice
+    op.execute("""
+        INSERT INTO tag_counts (user_id, uid, namespace, tag, memory_count)
+        SELECT m.user_id, m.uid, m.namespace, t.tag, count(*)
+        FROM memories m CROSS JOIN LATERAL (SELECT DISTINCT unnest(m.tags) AS tag) t
+        WHERE m.user_id IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """)
+    op.execute("""
+        INSERT INTO namespace_stats (user_id, uid, namespace, memory_count, tag_count)
+        SELECT m.user_id, m.uid, m.namespace, m.memories, coalesce(t.tags, 0)
+        FROM (
+            SELECT user_id, uid, namespace, count(*) AS memories FROM memories
+            WHERE user_id IS NOT NULL GROUP BY 1, 2, 3
+        ) m
+        LEFT JOIN (
+            SELECT user_id, uid, namespace, count(*) AS tags FROM tag_counts GROUP BY 1, 2, 3
+        ) t USING (user_id, uid, namespace)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for operation in ("insert", "update", "delete"):
+        op.execute(f"DROP TRIGGER IF EXISTS memories_stats_{operation} ON memories")
+    op.execute("DROP FUNCTION IF EXISTS memories_stats_update()")
+    op.drop_table('tag_counts')
+    op.drop_table('namespace_stats')
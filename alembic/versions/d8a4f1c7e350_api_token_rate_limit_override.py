@@ -0,0 +1,58 @@
+"""Make the API token rate limit an optional override of the plan tier
+
+Tokens still at the old column default of 5 requests per hour are cleared,
+so they follow their user's plan. The default can't be told apart from a
+limit of 5 set on purpose, so such overrides are cleared too; the ids of
+cleared tokens are logged, and
+
+    alembic -x keep_token_limits=true upgrade head
+
+leaves every limit as it is.
+
+Revision ID: d8a4f1c7e350
+Revises: c6f2a8e1d493
+Create Date: 2025-09-29 09:41:08.226193
+
+"""
+import logging
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import context, op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8a4f1c7e350'
+down_revision: Union[str, Sequence[str], None] = 'c6f2a8e1d493'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger(f"alembic.runtime.migration.{revision}")
+
+# Every token used to be created with this limit unless one was given
+OLD_DEFAULT_LIMIT = 5
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if context.get_x_argument(as_dictionary=True).get("keep_token_limits") == "true":
+        logger.info("Keeping rate_limit_per_hour of API tokens at %d", OLD_DEFAULT_LIMIT)
+        return
+
+    clear = f"UPDATE api_tokens SET rate_limit_per_hour = NULL WHERE rate_limit_per_hour = {OLD_DEFAULT_LIMIT}"
+    if context.is_offline_mode():
+        op.execute(clear)
+        return
+
+    cleared = op.get_bind().execute(sa.text(clear + " RETURNING id")).scalars().all()
+    if cleared:
+        logger.info(
+            "Cleared rate_limit_per_hour = %d of API tokens %s; set it again on any meant to keep it",
+            OLD_DEFAULT_LIMIT,
+            ", ".join(str(token_id) for token_id in sorted(cleared)),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(f"UPDATE api_tokens SET rate_limit_per_hour = {OLD_DEFAULT_LIMIT} WHERE rate_limit_per_hour IS NULL")
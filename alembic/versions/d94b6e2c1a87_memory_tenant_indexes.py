@@ -0,0 +1,67 @@
+"""Tenant-scoped indexes for query_memories
+
+Revision ID: d94b6e2c1a87
+Revises: c5e81a3d7f94
+Create Date: 2025-08-25 11:22:09.871350
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.db.partitioning import partition_count
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd94b6e2c1a87'
+down_revision: Union[str, Sequence[str], None] = 'c5e81a3d7f94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Superseded by the tenant indexes; ix_memories_id duplicated the primary key
+OLD_INDEXES = {
+    'idx_uid_namespace': 'ON memories USING btree (uid, namespace)',
+    'idx_created_at': 'ON memories USING btree (created_at)',
+    'idx_search_vector': 'ON memories USING gin (search_vector)',
+    'ix_memories_id': 'ON memories USING btree (id)',
+}
+NEW_INDEXES = {
+    'idx_memories_tenant_created': 'ON memories USING btree (user_id, uid, namespace, created_at DESC, id DESC)',
+    'idx_memories_tenant_search': 'ON memories USING gin (user_id, namespace, search_vector)',
+}
+
+
+# Without btree_gin (Postgres built without contrib) the GIN can't hold the
+# tenant columns; the planner then combines it with idx_memories_tenant_created
+FALLBACK_SEARCH_INDEX = 'ON memories USING gin (search_vector)'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    create = dict(NEW_INDEXES)
+    bind = op.get_bind()
+    has_btree_gin = bind.exec_driver_sql(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gin'"
+    ).first()
+    if has_btree_gin:
+        # GIN operator classes for the plain columns of idx_memories_tenant_search
+        op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    else:
+        create['idx_memories_tenant_search'] = FALLBACK_SEARCH_INDEX
+    _swap_indexes(create=create, drop=OLD_INDEXES)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _swap_indexes(create=OLD_INDEXES, drop=NEW_INDEXES)
+
+
+def _swap_indexes(create: dict, drop: dict) -> None:
+    # Build without blocking writes where Postgres allows it; partitioned
+    # tables don't support CONCURRENTLY
+    concurrently = "" if partition_count(op.get_bind()) else "CONCURRENTLY "
+    with op.get_context().autocommit_block():
+        for name, definition in create.items():
+            op.execute(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} {definition}")
+        for name in drop:
+            op.execute(f"DROP INDEX {concurrently}IF EXISTS {name}")
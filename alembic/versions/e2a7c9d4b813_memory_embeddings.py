@@ -0,0 +1,34 @@
+"""Optionally add memories.embedding for semantic search
+
+Revision ID: e2a7c9d4b813
+Revises: d94b6e2c1a87
+Create Date: 2025-09-01 09:41:18.305127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.config import settings
+from app.db.embeddings import disable_embeddings, enable_embeddings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a7c9d4b813'
+down_revision: Union[str, Sequence[str], None] = 'd94b6e2c1a87'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Opt-in: a no-op unless EMBEDDING_DIMENSIONS is set, since it needs the
+    # pgvector extension. Existing memories are embedded by
+    # `python -m app.db.embeddings backfill`.
+    if settings.embedding_dimensions:
+        enable_embeddings(op.get_bind(), settings.embedding_dimensions)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    disable_embeddings(op.get_bind())
@@ -0,0 +1,48 @@
+"""Deduplicate memories by a hash of their content
+
+Revision ID: f3b8d1e6a925
+Revises: e2a7c9d4b813
+Create Date: 2025-09-08 10:12:44.617203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.db.partitioning import partition_count
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d1e6a925'
+down_revision: Union[str, Sequence[str], None] = 'e2a7c9d4b813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing memories stay NULL, which never conflicts, until
+    # `python -m app.db.dedup` hashes and merges them in batches
+    op.execute("ALTER TABLE memories ADD COLUMN IF NOT EXISTS content_hash bytea")
+
+    # Tags of both, in order of first appearance
+    op.execute("""
+        CREATE OR REPLACE FUNCTION memory_merge_tags(a varchar[], b varchar[]) RETURNS varchar[] AS $$
+            SELECT ARRAY(SELECT tag FROM unnest(a || b) WITH ORDINALITY AS t(tag, n) GROUP BY tag ORDER BY min(n))
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    """)
+
+    # Partitioned tables don't support CONCURRENTLY
+    concurrently = "" if partition_count(op.get_bind()) else "CONCURRENTLY "
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"CREATE UNIQUE INDEX {concurrently}IF NOT EXISTS idx_memories_content_hash "
+            "ON memories (user_id, uid, namespace, content_hash)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS idx_memories_content_hash")
+    op.execute("DROP FUNCTION IF EXISTS memory_merge_tags(varchar[], varchar[])")
+    op.execute("ALTER TABLE memories DROP COLUMN IF EXISTS content_hash")
@@ -0,0 +1,55 @@
+"""Middleware that times API token requests and records them as ApiUsage."""
+
+import time
+from datetime import datetime, timezone
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.usage import usage_recorder
+
+# Recorded for requests that matched no route
+UNMATCHED_ENDPOINT = "(unmatched)"
+
+
+class UsageMiddleware:
+    """
+    Record endpoint, status and latency of every request made with an API token.
+
+    The endpoint is the path template of the route that matched, with path
+    parameters left as {name}, so ids in paths don't each get their own
+    series. The token is read from request.state, where the get_api_token dependency
+    leaves it. Recording only enqueues, so it adds no database work to the
+    request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            api_token = scope.get("state", {}).get("api_token")
+            if api_token is not None:
+                route = scope.get("route")
+                usage_recorder.record(
+                    user_id=api_token.user_id,
+                    token_id=api_token.id,
+                    endpoint=getattr(route, "path", UNMATCHED_ENDPOINT)[:100],
+                    response_status=status_code,
+                    response_time_ms=int((time.perf_counter() - started) * 1000),
+                    created_at=datetime.now(timezone.utc),
+                )
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 import secrets
 from datetime import datetime, timedelta, timezone
@@ -12,7 +13,8 @@ from app.schemas.ai import (
 )
 from app.deps import get_db
 from app.crud.users import get_user_by_email, create_user
-from app.utils.security import hash_api_token
+from app.crud.api_tokens import create_api_token
+from app.utils.security import generate_api_token
 from app.db.models import ApiToken
 
 router = APIRouter()
@@ -23,7 +25,7 @@ async def register_ai_user(
     namespace: str = Query(..., description="Namespace for the AI user"),
     uid: str = Query(..., description="User identifier"),
     token: Optional[str] = Query(None, description="Optional API token (will be generated if not provided)"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Register AI user via GET request
@@ -37,13 +39,13 @@ async def register_ai_user(
     email = f"{uid}@{namespace}.ai"
 
     # Check if user already exists
-    existing_user = get_user_by_email(db, email)
+    existing_user = await get_user_by_email(db, email)
     if existing_user:
         # User exists, check if they have an active token
-        active_token = db.query(ApiToken).filter(
+        active_token = await db.scalar(select(ApiToken).where(
             ApiToken.user_id == existing_user.id,
             ApiToken.is_active.is_(True)
-        ).first()
+        ).limit(1))
 
         if active_token:
             return AIRegistrationResponse(
@@ -59,13 +61,13 @@ async def register_ai_user(
 
     # Generate token if not provided
     if not token:
-        token = secrets.token_urlsafe(32)
+        token = generate_api_token()
 
     # Create user if doesn't exist
     if not existing_user:
         # Generate a random password for AI users
         temp_password = secrets.token_urlsafe(16)
-        user = create_user(
+        user = await create_user(
             db,
             email=email,
             password=temp_password,
@@ -77,22 +79,17 @@ async def register_ai_user(
 
     # Create API token
     try:
-        token_hash = hash_api_token(token)
         expires_at = datetime.now(timezone.utc) + timedelta(days=365)  # 1 year expiry for AI tokens
 
-        api_token = ApiToken(
-            user_id=user.id,
+        await create_api_token(
+            db,
+            user_id=user.id,  # type: ignore
             token_name=f"AI Token for {uid}",
-            token_hash=token_hash,
+            token=token,
             permissions={"memory": ["read", "write"]},
-            rate_limit_per_hour=1000,  # Higher limit for AI
-            expires_at=expires_at,
-            is_active=True
+            expires_at=expires_at
         )
 
-        db.add(api_token)
-        db.commit()
-
         return AIRegistrationResponse(
             data=AIRegistrationData(
                 uid=uid,
@@ -114,7 +111,7 @@ async def register_ai_user(
 @router.get("/token/validate", response_model=AITokenResponse)
 async def validate_ai_token(
     token: str = Query(..., description="API token to validate"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Validate AI token via GET request
@@ -123,15 +120,15 @@ async def validate_ai_token(
     """
 
     try:
-        from app.deps import validate_api_token
-        api_token = validate_api_token(token, db)
+        from app.deps import validate_api_token, token_rate_limit
+        api_token = await validate_api_token(token, db)
 
         return AITokenResponse(
             data=AITokenData(
                 token_name=api_token.token_name, # type: ignore
                 user_id=api_token.user_id, # type: ignore
                 permissions=api_token.permissions, # type: ignore
-                rate_limit_per_hour=api_token.rate_limit_per_hour, # type: ignore
+                rate_limit_per_hour=token_rate_limit(api_token),
                 expires_at=api_token.expires_at, # type: ignore
                 last_used_at=api_token.last_used_at, # type: ignore
                 is_active=api_token.is_active # type: ignore
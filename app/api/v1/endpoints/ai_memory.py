@@ -1,6 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Literal, Optional, Tuple
+
+import orjson
 
 from app.schemas.memory import (
     MemoryResponse,
@@ -8,21 +12,45 @@ from app.schemas.memory import (
     MemoryCreateRequest,
     MemoryQueryRequest,
     MemoryData,
+    MemoryBatchItemResult,
+    MemoryBatchResponse,
+    MemoryBatchResult,
+    NearDuplicateAction,
+    NamespaceStatsData,
+    NamespaceStatsResponse,
+    TagCountData,
+    TagCountListResponse,
+    parse_batch_items,
 )
-from app.deps import get_db, validate_api_token
-from app.crud.memory import create_memory, query_memories
+from app.deps import get_db, get_api_token, authenticate_api_token, enforce_rate_limit, read_memory_batch
+from app.db.models import ApiToken
+from app.crud.memory import create_memory, create_memories, query_memories
+from app.crud.memory_stats import complete_tags, get_namespace_stats, get_tag_counts
+from app.db.routing import ReadScope, read_router
+from app.services.memory_transfer import export_filename, stream_export
+from app.services.embeddings import SemanticSearchDisabledError
+from app.services.idempotency import REPLAYED_HEADER, run_idempotent
+from app.services.near_duplicates import NearDuplicateError
+from app.services.query_cache import etag_is_current, query_cache
+from app.utils.pagination import InvalidCursorError
+from app.utils.responses import matching_etag, render_memory_list
 
 router = APIRouter()
 
 
 @router.get("/save", response_model=MemoryResponse)
 async def save_memory_ai(
+    response: Response,
     uid: str = Query(..., description="User or session identifier"),
     token: str = Query(..., description="API token"),
     text: str = Query(..., description="Memory text content"),
     namespace: Optional[str] = Query(None, description="Memory namespace"),
     tags: Optional[str] = Query(None, description="Comma-separated tags"),
-    db: Session = Depends(get_db),
+    ttl: Optional[int] = Query(None, description="Seconds until the memory expires", ge=1),
+    on_near_duplicate: NearDuplicateAction = Query("keep", description="Keep, merge or reject saves like a memory"),
+    idempotency_key: Optional[str] = Query(None, description="Client key for safe retries", max_length=255),
+    db: AsyncSession = Depends(get_db),
+    api_token: ApiToken = Depends(get_api_token),
 ):
     """
     Save memory via GET request (AI/LLM integration)
@@ -32,10 +60,14 @@ async def save_memory_ai(
     - **text**: Memory text content
     - **namespace**: Optional namespace (defaults to uid)
     - **tags**: Optional comma-separated tags
-    """
+    - **ttl**: Optional seconds until the memory expires, e.g. for session context
+    - **on_near_duplicate**: `keep` saves anyway, `merge` updates the most similar memory
+      with the new text and tags, `reject` answers 409 naming it
+    - **idempotency_key**: Optional; retries with the same key return the first response
 
-    # Validate API token
-    api_token = validate_api_token(token, db)
+    Saving text the uid already has in the namespace (ignoring case and
+    spacing) returns that memory, with the new tags added.
+    """
 
     # Parse tags
     parsed_tags = []
@@ -52,42 +84,125 @@ async def save_memory_ai(
         namespace=namespace,
         text=text,
         tags=parsed_tags,
+        created_by=f"ai_token:{token[:8]}...",  # Truncated token for audit
+        ttl=ttl
+    )
+
+    async def save() -> bytes:
+        try:
+            memory = await create_memory(
+                db, memory_data, user_id=api_token.user_id, on_near_duplicate=on_near_duplicate # type: ignore
+            )
+
+            return MemoryResponse(
+                data=MemoryData(
+                    id=memory.id, # type: ignore
+                    uid=memory.uid, # type: ignore
+                    namespace=memory.namespace, # type: ignore
+                    text=memory.text, # type: ignore
+                    tags=memory.tags, # type: ignore
+                    created_by=memory.created_by, # type: ignore
+                    created_at=memory.created_at, # type: ignore
+                    updated_at=memory.updated_at, # type: ignore
+                    expires_at=memory.expires_at, # type: ignore
+                ),
+                success=True
+            ).model_dump_json().encode()
+        except NearDuplicateError as e:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=str(e)
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to save memory: {str(e)}"
+            )
+
+    fingerprint = orjson.dumps([memory_data.model_dump(mode="json"), on_near_duplicate])
+    body, replayed = await run_idempotent(api_token.user_id, idempotency_key, fingerprint, save) # type: ignore
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return Response(body, media_type="application/json", headers=response.headers)
+
+
+@router.post("/save/batch", response_model=MemoryBatchResponse)
+async def save_memory_batch_ai(
+    response: Response,
+    token: str = Query(..., description="API token"),
+    raw_items: list = Depends(read_memory_batch),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: AsyncSession = Depends(get_db),
+    api_token: ApiToken = Depends(authenticate_api_token),
+):
+    """
+    Save many memories in one request (AI/LLM integration)
+
+    - **token**: API token for authentication
+    - **body**: JSON array or NDJSON (`application/x-ndjson`) of memories with
+      `uid`, `text` and optional `namespace` (defaults to uid), `tags` and `ttl`
+    - **Idempotency-Key** header: optional; retries with the same key return the first response
+
+    Every saved item counts against the token's hourly rate limit. Invalid
+    items are reported by index and don't stop the rest from being saved.
+    Items with text the uid already has in the namespace are merged into that
+    memory and get its id.
+    """
+
+    # Set namespace default
+    raw_items = [
+        {**raw, "namespace": raw.get("uid")} if isinstance(raw, dict) and not raw.get("namespace") else raw
+        for raw in raw_items
+    ]
+    items, positions, results = parse_batch_items(
+        raw_items,
         created_by=f"ai_token:{token[:8]}..."  # Truncated token for audit
     )
 
-    try:
-        memory = create_memory(db, memory_data, user_id=api_token.user_id) # type: ignore
-
-        return MemoryResponse(
-            data=MemoryData(
-                id=memory.id, # type: ignore
-                uid=memory.uid, # type: ignore
-                namespace=memory.namespace, # type: ignore
-                text=memory.text, # type: ignore
-                tags=memory.tags, # type: ignore
-                created_by=memory.created_by, # type: ignore
-                created_at=memory.created_at, # type: ignore
-                updated_at=memory.updated_at, # type: ignore
-            ),
-            success=True
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to save memory: {str(e)}"
-        )
+    await enforce_rate_limit(api_token, response, cost=max(len(items), 1))
+
+    async def save() -> bytes:
+        try:
+            ids = await create_memories(db, items, user_id=api_token.user_id) # type: ignore
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to save memories: {str(e)}"
+            )
+
+        items_results = results + [
+            MemoryBatchItemResult(index=index, id=memory_id) for index, memory_id in zip(positions, ids)
+        ]
+        items_results.sort(key=lambda result: result.index)
+
+        return MemoryBatchResponse(
+            data=MemoryBatchResult(saved=len(ids), failed=len(items_results) - len(ids), items=items_results),
+            success=len(ids) == len(items_results)
+        ).model_dump_json().encode()
+
+    body, replayed = await run_idempotent(
+        api_token.user_id, idempotency_key, orjson.dumps(raw_items), save # type: ignore
+    )
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return Response(body, media_type="application/json", headers=response.headers)
 
 
 @router.get("/query", response_model=MemoryListResponse)
 async def query_memory_ai(
+    response: Response,
     uid: str = Query(..., description="User or session identifier"),
-    token: str = Query(..., description="API token"),
     namespace: Optional[str] = Query(None, description="Memory namespace"),
     tags: Optional[str] = Query(None, description="Comma-separated tags to filter by"),
     query: Optional[str] = Query(None, description="Full-text search query"),
+    search_mode: Literal["plain", "websearch", "prefix"] = Query("plain", description="How query is parsed"),
+    retrieval: Literal["keyword", "semantic", "hybrid"] = Query("keyword", description="How query is matched"),
+    within_days: Optional[int] = Query(None, description="Only memories created in the last this many days", ge=1),
     limit: int = Query(10, description="Maximum number of results", ge=1, le=100),
     offset: int = Query(0, description="Offset for pagination", ge=0),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    if_none_match: Optional[str] = Header(None),
+    api_token: ApiToken = Depends(get_api_token),
 ):
     """
     Query memories via GET request (AI/LLM integration)
@@ -97,12 +212,17 @@ async def query_memory_ai(
     - **namespace**: Optional namespace filter
     - **tags**: Optional comma-separated tags to filter by
     - **query**: Optional full-text search query
+    - **search_mode**: `plain` words, `websearch` syntax ("phrase", or, -word) or word `prefix`es
+    - **retrieval**: `keyword` full-text search, `semantic` embedding similarity, or `hybrid` (both, rank-fused)
+    - **within_days**: Only memories created in the last this many days
     - **limit**: Maximum number of results (1-100)
     - **offset**: Offset for pagination
-    """
+    - **cursor**: next_cursor of the previous page; takes precedence over offset
 
-    # Validate API token
-    api_token = validate_api_token(token, db)
+    Responses carry an ETag; polling with it in If-None-Match gets an empty
+    304, without running the query, until a memory in the namespace is saved,
+    updated or deleted, or one in the response expires.
+    """
 
     # Parse tags
     parsed_tags = []
@@ -119,33 +239,171 @@ async def query_memory_ai(
         namespace=namespace,
         tags=parsed_tags,
         query=query,
+        search_mode=search_mode,
+        retrieval=retrieval,
+        within_days=within_days,
         limit=limit,
-        offset=offset
+        offset=offset,
+        cursor=cursor
     )
 
+    async def run_query(with_expiry: bool) -> Tuple[bytes, Optional[datetime]]:
+        memories, next_cursor, search, expires = await read_router.run(
+            ReadScope(api_token.user_id, uid, namespace), # type: ignore
+            query_memories,
+            query_request,
+            user_id=api_token.user_id,
+            with_expiry=with_expiry,
+        )
+        return render_memory_list(memories, next_cursor, search), expires
+
     try:
-        memories = query_memories(db, query_request, user_id=api_token.user_id) # type: ignore
-
-        memory_data = [
-            MemoryData(
-                id=memory.id, # type: ignore
-                uid=memory.uid, # type: ignore
-                namespace=memory.namespace, # type: ignore
-                text=memory.text, # type: ignore
-                tags=memory.tags, # type: ignore
-                created_by=memory.created_by, # type: ignore
-                created_at=memory.created_at, # type: ignore
-                updated_at=memory.updated_at, # type: ignore
-            )
-            for memory in memories
-        ]
+        key = await query_cache.key(api_token.user_id, query_request) # type: ignore
+        if key is not None:
+            # Clients may keep the response, but must check it is still current
+            response.headers["Cache-Control"] = "private, no-cache"
+            tag = matching_etag(if_none_match, lambda tag: etag_is_current(key, tag))
+            if tag is not None:
+                response.headers["ETag"] = tag
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=response.headers)
+
+        body, tag = await query_cache.get_or_set(key, run_query, tagged=True)
+        if tag is not None:
+            response.headers["ETag"] = tag
 
-        return MemoryListResponse(
-            data=memory_data,
-            success=True
+        # Returned responses don't pick up headers set by dependencies, so copy
+        # the rate limit headers over
+        return Response(body, media_type="application/json", headers=response.headers)
+    except (InvalidCursorError, SemanticSearchDisabledError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to query memories: {str(e)}"
         )
+
+
+@router.get("/export")
+async def export_memory_ai(
+    response: Response,
+    uid: str = Query(..., description="User or session identifier"),
+    namespace: Optional[str] = Query(None, description="Namespace to export, all if omitted"),
+    gzip: bool = Query(False, description="Compress the export with gzip"),
+    api_token: ApiToken = Depends(get_api_token),
+):
+    """
+    Stream all memories of a uid as NDJSON, one memory per line (AI/LLM integration)
+
+    - **uid**: User or session identifier
+    - **token**: API token for authentication
+    - **namespace**: Optional namespace; all namespaces of the uid if omitted
+    - **gzip**: Compress the export with gzip
+    """
+
+    # Returned responses don't pick up headers set by dependencies, so copy
+    # the rate limit headers over
+    return StreamingResponse(
+        stream_export(uid, namespace, user_id=api_token.user_id, compress=gzip), # type: ignore
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={
+            **response.headers,
+            "Content-Disposition": f'attachment; filename="{export_filename(uid, namespace, gzip)}"',
+        },
+    )
+
+
+@router.get("/stats", response_model=NamespaceStatsResponse)
+async def namespace_stats_ai(
+    uid: str = Query(..., description="User or session identifier"),
+    namespace: Optional[str] = Query(None, description="Memory namespace"),
+    api_token: ApiToken = Depends(get_api_token),
+):
+    """
+    Count the memories and distinct tags of a uid in a namespace (AI/LLM integration)
+
+    - **uid**: User or session identifier
+    - **token**: API token for authentication
+    - **namespace**: Optional namespace, defaults to uid
+
+    Counts are kept up to date as memories are written, so this doesn't
+    grow slower with the namespace; expired memories count until the reaper
+    deletes them.
+    """
+
+    namespace = namespace or uid
+    stats = await read_router.run(
+        ReadScope(api_token.user_id, uid, namespace), # type: ignore
+        get_namespace_stats,
+        api_token.user_id,
+        uid,
+        namespace,
+    )
+    return NamespaceStatsResponse(
+        data=NamespaceStatsData.model_validate(stats) if stats else
+        NamespaceStatsData(uid=uid, namespace=namespace, memory_count=0, tag_count=0),
+        success=True
+    )
+
+
+@router.get("/tags", response_model=TagCountListResponse)
+async def tag_counts_ai(
+    uid: str = Query(..., description="User or session identifier"),
+    namespace: Optional[str] = Query(None, description="Memory namespace"),
+    limit: int = Query(20, description="Maximum number of tags", ge=1, le=100),
+    api_token: ApiToken = Depends(get_api_token),
+):
+    """
+    The most used tags of a uid in a namespace, with how many memories have each (AI/LLM integration)
+
+    - **uid**: User or session identifier
+    - **token**: API token for authentication
+    - **namespace**: Optional namespace, defaults to uid
+    - **limit**: Maximum number of tags (1-100)
+    """
+
+    namespace = namespace or uid
+    tags = await read_router.run(
+        ReadScope(api_token.user_id, uid, namespace), # type: ignore
+        get_tag_counts,
+        api_token.user_id,
+        uid,
+        namespace,
+        limit,
+    )
+    return TagCountListResponse(data=[TagCountData.model_validate(tag) for tag in tags], success=True)
+
+
+@router.get("/tags/complete", response_model=TagCountListResponse)
+async def complete_tags_ai(
+    uid: str = Query(..., description="User or session identifier"),
+    prefix: str = Query(..., description="Start of the tag", min_length=1),
+    namespace: Optional[str] = Query(None, description="Memory namespace"),
+    limit: int = Query(10, description="Maximum number of tags", ge=1, le=100),
+    api_token: ApiToken = Depends(get_api_token),
+):
+    """
+    Tags of a uid in a namespace starting with prefix, for autocomplete (AI/LLM integration)
+
+    - **uid**: User or session identifier
+    - **token**: API token for authentication
+    - **prefix**: Start of the tag, case-sensitive
+    - **namespace**: Optional namespace, defaults to uid
+    - **limit**: Maximum number of tags (1-100)
+
+    Tags come in code point order, with how many memories have each.
+    """
+
+    namespace = namespace or uid
+    tags = await read_router.run(
+        ReadScope(api_token.user_id, uid, namespace), # type: ignore
+        complete_tags,
+        api_token.user_id,
+        uid,
+        namespace,
+        prefix,
+        limit,
+    )
+    return TagCountListResponse(data=[TagCountData.model_validate(tag) for tag in tags], success=True)
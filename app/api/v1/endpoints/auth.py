@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
 from app.schemas.auth import (
@@ -20,7 +20,7 @@ router = APIRouter()
 
 
 @router.post("/login", response_model=LoginResponse)
-async def login(request: LoginRequest, db: Session = Depends(get_db)):
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_db)):
     """
     Authenticate user
 
@@ -29,7 +29,7 @@ async def login(request: LoginRequest, db: Session = Depends(get_db)):
     """
 
     # Authenticate user
-    user = authenticate_user(db, request.email, request.password)
+    user = await authenticate_user(db, request.email, request.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -56,7 +56,7 @@ async def login(request: LoginRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/register", response_model=RegisterResponse)
-async def register(request: RegisterRequest, db: Session = Depends(get_db)):
+async def register(request: RegisterRequest, db: AsyncSession = Depends(get_db)):
     """
     Register new user
 
@@ -66,7 +66,7 @@ async def register(request: RegisterRequest, db: Session = Depends(get_db)):
     """
 
     # Check if user already exists
-    existing_user = get_user_by_email(db, request.email)
+    existing_user = await get_user_by_email(db, request.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -75,7 +75,7 @@ async def register(request: RegisterRequest, db: Session = Depends(get_db)):
 
     # Create new user
     try:
-        user = create_user(db, request.email, request.password, request.name, plan="free")
+        user = await create_user(db, request.email, request.password, request.name, plan="free")
     except IntegrityError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
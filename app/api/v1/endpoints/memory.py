@@ -1,5 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Optional, Tuple
+
+import orjson
 
 from app.schemas.memory import (
     MemoryResponse,
@@ -7,10 +12,36 @@ from app.schemas.memory import (
     MemoryCreateRequest,
     MemoryQueryRequest,
     MemoryData,
+    MemoryBatchItemResult,
+    MemoryBatchResponse,
+    MemoryBatchResult,
+    NearDuplicateAction,
+    MemoryImportResponse,
+    MemoryImportResult,
+    NamespaceStatsData,
+    NamespaceStatsResponse,
+    RetentionRuleData,
+    RetentionRuleListResponse,
+    RetentionRuleRequest,
+    RetentionRuleResponse,
+    TagCountData,
+    TagCountListResponse,
+    parse_batch_items,
 )
-from app.deps import get_db, get_current_active_user
-from app.crud.memory import create_memory, query_memories
+from app.deps import get_db, get_current_active_user, read_memory_batch
+from app.crud.memory import create_memory, create_memories, query_memories
+from app.crud.memory_stats import complete_tags, get_namespace_stats, get_tag_counts
+from app.crud.retention_rules import delete_retention_rule, get_retention_rules, set_retention_rule
+from app.db.routing import ReadScope, read_router
+from app.services.embeddings import SemanticSearchDisabledError
+from app.services.idempotency import REPLAYED_HEADER, run_idempotent
+from app.services.near_duplicates import NearDuplicateError
+from app.services.query_cache import query_cache
+from app.utils.pagination import InvalidCursorError
+from app.utils.responses import render_memory_list
 from app.db.models import User
+from app.schemas.base import ApiResponse
+from app.services.memory_transfer import MemoryImportError, export_filename, import_memories, stream_export
 
 router = APIRouter()
 
@@ -18,72 +49,321 @@ router = APIRouter()
 @router.post("/save", response_model=MemoryResponse)
 async def save_memory_post(
     request: MemoryCreateRequest,
-    db: Session = Depends(get_db),
+    response: Response,
+    on_near_duplicate: NearDuplicateAction = Query("keep", description="Keep, merge or reject saves like a memory"),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Save memory via POST request (for web interface)
+
+    Text the uid already has in the namespace (ignoring case and spacing) is
+    merged into that memory, and on_near_duplicate says what to do about
+    similar text. Retries with the same Idempotency-Key header return the
+    first response.
     """
 
     # Set created_by to current user
     request.created_by = f"user:{current_user.id}"
 
+    async def save() -> bytes:
+        try:
+            memory = await create_memory(
+                db, request, user_id=current_user.id, on_near_duplicate=on_near_duplicate # type: ignore
+            )
+
+            return MemoryResponse(
+                data=MemoryData(
+                    id=memory.id, # type: ignore
+                    uid=memory.uid, # type: ignore
+                    namespace=memory.namespace, # type: ignore
+                    text=memory.text, # type: ignore
+                    tags=memory.tags, # type: ignore
+                    created_by=memory.created_by, # type: ignore
+                    created_at=memory.created_at, # type: ignore
+                    updated_at=memory.updated_at, # type: ignore
+                    expires_at=memory.expires_at, # type: ignore
+                ),
+                success=True
+            ).model_dump_json().encode()
+        except NearDuplicateError as e:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=str(e)
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to save memory: {str(e)}"
+            )
+
+    fingerprint = orjson.dumps([request.model_dump(mode="json"), on_near_duplicate])
+    body, replayed = await run_idempotent(current_user.id, idempotency_key, fingerprint, save) # type: ignore
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return Response(body, media_type="application/json", headers=response.headers)
+
+
+@router.post("/save/batch", response_model=MemoryBatchResponse)
+async def save_memory_batch_post(
+    response: Response,
+    raw_items: list = Depends(read_memory_batch),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Save many memories in one request (for web interface)
+
+    Takes a JSON array or NDJSON (`application/x-ndjson`) of memories; invalid
+    items are reported by index and don't stop the rest from being saved.
+    Retries with the same Idempotency-Key header return the first response.
+    """
+
+    items, positions, results = parse_batch_items(raw_items, created_by=f"user:{current_user.id}")
+
+    async def save() -> bytes:
+        try:
+            ids = await create_memories(db, items, user_id=current_user.id) # type: ignore
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to save memories: {str(e)}"
+            )
+
+        items_results = results + [
+            MemoryBatchItemResult(index=index, id=memory_id) for index, memory_id in zip(positions, ids)
+        ]
+        items_results.sort(key=lambda result: result.index)
+
+        return MemoryBatchResponse(
+            data=MemoryBatchResult(saved=len(ids), failed=len(items_results) - len(ids), items=items_results),
+            success=len(ids) == len(items_results)
+        ).model_dump_json().encode()
+
+    body, replayed = await run_idempotent(
+        current_user.id, idempotency_key, orjson.dumps(raw_items), save # type: ignore
+    )
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return Response(body, media_type="application/json", headers=response.headers)
+
+
+@router.post("/query", response_model=MemoryListResponse)
+async def query_memory_post(
+    request: MemoryQueryRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Query memories via POST request (for web interface)
+    """
+
+    async def run_query(with_expiry: bool) -> Tuple[bytes, Optional[datetime]]:
+        memories, next_cursor, search, expires = await read_router.run(
+            ReadScope(current_user.id, request.uid, request.namespace), # type: ignore
+            query_memories,
+            request,
+            user_id=current_user.id,
+            with_expiry=with_expiry,
+        )
+        return render_memory_list(memories, next_cursor, search), expires
+
     try:
-        memory = create_memory(db, request, user_id=current_user.id) # type: ignore
-
-        return MemoryResponse(
-            data=MemoryData(
-                id=memory.id, # type: ignore
-                uid=memory.uid, # type: ignore
-                namespace=memory.namespace, # type: ignore
-                text=memory.text, # type: ignore
-                tags=memory.tags, # type: ignore
-                created_by=memory.created_by, # type: ignore
-                created_at=memory.created_at, # type: ignore
-                updated_at=memory.updated_at, # type: ignore
-            ),
-            success=True
+        key = await query_cache.key(current_user.id, request) # type: ignore
+        body, _ = await query_cache.get_or_set(key, run_query)
+        return Response(body, media_type="application/json")
+    except (InvalidCursorError, SemanticSearchDisabledError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to save memory: {str(e)}"
+            detail=f"Failed to query memories: {str(e)}"
         )
 
 
-@router.post("/query", response_model=MemoryListResponse)
-async def query_memory_post(
-    request: MemoryQueryRequest,
-    db: Session = Depends(get_db),
+@router.get("/export")
+async def export_memory(
+    uid: str = Query(..., description="User or session identifier"),
+    namespace: Optional[str] = Query(None, description="Namespace to export, all if omitted"),
+    gzip: bool = Query(False, description="Compress the export with gzip"),
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    Query memories via POST request (for web interface)
+    Stream all memories of a uid as NDJSON, one memory per line
     """
 
-    try:
-        memories = query_memories(db, request, user_id=current_user.id) # type: ignore
-
-        memory_data = [
-            MemoryData(
-                id=memory.id, # type: ignore
-                uid=memory.uid, # type: ignore
-                namespace=memory.namespace, # type: ignore
-                text=memory.text, # type: ignore
-                tags=memory.tags, # type: ignore
-                created_by=memory.created_by, # type: ignore
-                created_at=memory.created_at, # type: ignore
-                updated_at=memory.updated_at, # type: ignore
-            )
-            for memory in memories
-        ]
+    return StreamingResponse(
+        stream_export(uid, namespace, user_id=current_user.id, compress=gzip), # type: ignore
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(uid, namespace, gzip)}"'},
+    )
+
+
+@router.post("/import", response_model=MemoryImportResponse)
+async def import_memory(
+    request: Request,
+    uid: Optional[str] = Query(None, description="Replace the uid of every imported memory"),
+    namespace: Optional[str] = Query(None, description="Replace the namespace of every imported memory"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Import memories from an NDJSON body, plain or gzipped, as produced by /export
 
-        return MemoryListResponse(
-            data=memory_data,
-            success=True
+    Rows are committed in chunks; if a line is rejected, the chunks before it
+    stay imported and the error says how many memories that was.
+    """
+
+    try:
+        imported = await import_memories(
+            db, request.stream(), user_id=current_user.id, uid=uid, namespace=namespace # type: ignore
+        )
+    except MemoryImportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to query memories: {str(e)}"
+            detail=f"Failed to import memories: {str(e)}"
         )
+
+    return MemoryImportResponse(
+        data=MemoryImportResult(imported=imported),
+        success=True
+    )
+
+
+@router.get("/stats", response_model=NamespaceStatsResponse)
+async def namespace_stats(
+    uid: str = Query(..., description="User or session identifier"),
+    namespace: Optional[str] = Query(None, description="Memory namespace, defaults to uid"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Count the memories and distinct tags of a uid in a namespace
+
+    Expired memories count until the reaper deletes them.
+    """
+
+    namespace = namespace or uid
+    stats = await read_router.run(
+        ReadScope(current_user.id, uid, namespace), # type: ignore
+        get_namespace_stats,
+        current_user.id,
+        uid,
+        namespace,
+    )
+    return NamespaceStatsResponse(
+        data=NamespaceStatsData.model_validate(stats) if stats else
+        NamespaceStatsData(uid=uid, namespace=namespace, memory_count=0, tag_count=0),
+        success=True
+    )
+
+
+@router.get("/tags", response_model=TagCountListResponse)
+async def tag_counts(
+    uid: str = Query(..., description="User or session identifier"),
+    namespace: Optional[str] = Query(None, description="Memory namespace, defaults to uid"),
+    limit: int = Query(20, description="Maximum number of tags", ge=1, le=100),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    The most used tags of a uid in a namespace, with how many memories have each
+    """
+
+    namespace = namespace or uid
+    tags = await read_router.run(
+        ReadScope(current_user.id, uid, namespace), # type: ignore
+        get_tag_counts,
+        current_user.id,
+        uid,
+        namespace,
+        limit,
+    )
+    return TagCountListResponse(data=[TagCountData.model_validate(tag) for tag in tags], success=True)
+
+
+@router.get("/tags/complete", response_model=TagCountListResponse)
+async def complete_tag(
+    uid: str = Query(..., description="User or session identifier"),
+    prefix: str = Query(..., description="Start of the tag, case-sensitive", min_length=1),
+    namespace: Optional[str] = Query(None, description="Memory namespace, defaults to uid"),
+    limit: int = Query(10, description="Maximum number of tags", ge=1, le=100),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Tags of a uid in a namespace starting with prefix, in code point order, for autocomplete
+    """
+
+    namespace = namespace or uid
+    tags = await read_router.run(
+        ReadScope(current_user.id, uid, namespace), # type: ignore
+        complete_tags,
+        current_user.id,
+        uid,
+        namespace,
+        prefix,
+        limit,
+    )
+    return TagCountListResponse(data=[TagCountData.model_validate(tag) for tag in tags], success=True)
+
+
+@router.get("/retention", response_model=RetentionRuleListResponse)
+async def list_retention_rules(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    List the retention rules of your namespaces
+    """
+
+    rules = await get_retention_rules(db, user_id=current_user.id) # type: ignore
+    return RetentionRuleListResponse(
+        data=[RetentionRuleData.model_validate(rule) for rule in rules],
+        success=True
+    )
+
+
+@router.put("/retention", response_model=RetentionRuleResponse)
+async def set_namespace_retention(
+    request: RetentionRuleRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Set how long memories of a namespace are kept
+
+    Older memories are hidden from queries right away and deleted by the
+    background reaper.
+    """
+
+    rule = await set_retention_rule(db, current_user.id, request.namespace, request.max_age_days) # type: ignore
+    return RetentionRuleResponse(
+        data=RetentionRuleData.model_validate(rule),
+        success=True
+    )
+
+
+@router.delete("/retention", response_model=ApiResponse)
+async def delete_namespace_retention(
+    namespace: str = Query(..., description="Namespace whose rule to delete"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Keep the memories of a namespace until they are deleted or their ttl passes
+    """
+
+    if not await delete_retention_rule(db, current_user.id, namespace): # type: ignore
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Retention rule not found"
+        )
+
+    return ApiResponse(data=None, success=True)
@@ -1,30 +1,51 @@
-from sqlalchemy.orm import Session
+import logging
+from prometheus_client import Counter
+from sqlalchemy import DateTime, Integer, column, or_, select, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from typing import Optional
 from datetime import datetime
 
+from app.config import settings
 from app.db.models import ApiToken
-from app.utils.security import hash_api_token
+from app.services.rate_limiter import rate_limiter
+from app.services.token_cache import token_cache
+from app.utils.security import (
+    api_token_prefix,
+    digest_api_token,
+    verify_api_token_async,
+    verify_api_token_digest,
+)
 
+logger = logging.getLogger(__name__)
 
-def create_api_token(
-    db: Session,
+LEGACY_TOKEN_LOOKUPS = Counter(
+    "ajimemo_api_token_legacy_lookups",
+    "Bcrypt scans for tokens without a digest, by outcome",
+    ["result"],  # upgraded, miss, limited
+)
+
+LEGACY_SCAN_KEY = "legacy-token-scan"
+
+
+async def create_api_token(
+    db: AsyncSession,
     user_id: int,
     token_name: str,
     token: str,
     permissions: Optional[dict] = None,
-    rate_limit_per_hour: int = 5,
+    rate_limit_per_hour: Optional[int] = None,
     expires_at: Optional[datetime] = None
 ) -> ApiToken:
     """Create a new API token."""
     if permissions is None:
         permissions = {}
 
-    token_hash = hash_api_token(token)
-
     api_token = ApiToken(
         user_id=user_id,
         token_name=token_name,
-        token_hash=token_hash,
+        token_prefix=api_token_prefix(token),
+        token_digest=digest_api_token(token),
         permissions=permissions,
         rate_limit_per_hour=rate_limit_per_hour,
         expires_at=expires_at,
@@ -32,38 +53,128 @@ def create_api_token(
     )
 
     db.add(api_token)
-    db.commit()
-    db.refresh(api_token)
+    await db.commit()
+    await db.refresh(api_token)
+
+    # The token may have been tried before it existed
+    await token_cache.evict(api_token.token_digest)  # type: ignore
 
     return api_token
 
 
-def get_token_by_hash(db: Session, token_hash: str) -> Optional[ApiToken]:
-    """Get API token by hash."""
-    return db.query(ApiToken).filter(
-        ApiToken.token_hash == token_hash,
+async def get_token_by_value(db: AsyncSession, token: str) -> Optional[ApiToken]:
+    """Get an active API token, with its user, by its plaintext value."""
+    candidates = await db.scalars(select(ApiToken).where(
+        ApiToken.token_prefix == api_token_prefix(token),
         ApiToken.is_active.is_(True)
-    ).first()
+    ).options(joinedload(ApiToken.user)))
+
+    for api_token in candidates:
+        if verify_api_token_digest(token, api_token.token_digest):  # type: ignore
+            return api_token
+
+    if settings.api_token_legacy_fallback:
+        return await upgrade_legacy_token(db, token)
+
+    return None
+
+
+async def upgrade_legacy_token(db: AsyncSession, token: str) -> Optional[ApiToken]:
+    """
+    Find a token issued before prefix/digest lookup and re-hash it.
+
+    Legacy rows only carry a bcrypt hash, so every one of them is tried, the
+    most recently used first. Scans are limited to api_token_legacy_scans_per_hour
+    across workers, and a token that matched nothing is cached as missing so
+    retries don't repeat the scan. Once a token validates it is moved to the
+    new scheme and never scanned again.
+    """
+    legacy_hashes = (await db.execute(select(ApiToken.id, ApiToken.token_hash).where(
+        ApiToken.token_digest.is_(None),
+        ApiToken.token_hash.is_not(None),
+        ApiToken.is_active.is_(True)
+    ).order_by(
+        ApiToken.last_used_at.desc().nulls_last(), ApiToken.id.desc()
+    ))).all()
+
+    if not legacy_hashes:
+        return None
+
+    if not (await rate_limiter.hit(LEGACY_SCAN_KEY, settings.api_token_legacy_scans_per_hour)).allowed:
+        LEGACY_TOKEN_LOOKUPS.labels("limited").inc()
+        logger.warning("Legacy API token scan skipped, over %d per hour", settings.api_token_legacy_scans_per_hour)
+        return None
+
+    # The scan is slow, so concurrent retries of a bad token shouldn't repeat it
+    await token_cache.set_missing(digest_api_token(token))
+
+    for token_id, token_hash in legacy_hashes:
+        if await verify_api_token_async(token, token_hash):
+            api_token = await db.scalar(
+                select(ApiToken).where(ApiToken.id == token_id).options(joinedload(ApiToken.user))
+            )
+            if api_token is None or not api_token.is_active:
+                break
+            if api_token.token_digest is None:  # not upgraded by a concurrent request
+                api_token.token_prefix = api_token_prefix(token)  # type: ignore
+                api_token.token_digest = digest_api_token(token)  # type: ignore
+                api_token.token_hash = None  # type: ignore
+                await db.commit()
+                LEGACY_TOKEN_LOOKUPS.labels("upgraded").inc()
+                logger.info("Re-hashed legacy API token %s", api_token.id)
+            # Replace the miss cached before the scan
+            await token_cache.evict(api_token.token_digest)  # type: ignore
+            return api_token
+
+    LEGACY_TOKEN_LOOKUPS.labels("miss").inc()
+    logger.info("Legacy API token scan found no match among %d candidates", len(legacy_hashes))
+    return None
+
+
+async def bulk_touch_tokens(db: AsyncSession, last_used: dict[int, datetime]) -> None:
+    """Set last_used_at on many API tokens in one statement."""
+    if not last_used:
+        return
+
+    rows = values(
+        column("id", Integer),
+        column("last_used_at", DateTime(timezone=True)),
+        name="v"
+    ).data(list(last_used.items()))
+
+    await db.execute(
+        update(ApiToken)
+        .where(
+            ApiToken.id == rows.c.id,
+            or_(ApiToken.last_used_at.is_(None), ApiToken.last_used_at < rows.c.last_used_at)
+        )
+        .values(last_used_at=rows.c.last_used_at)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
 
 
-def get_user_tokens(db: Session, user_id: int) -> list[ApiToken]:
+async def get_user_tokens(db: AsyncSession, user_id: int) -> list[ApiToken]:
     """Get all active tokens for a user."""
-    return db.query(ApiToken).filter(
+    result = await db.scalars(select(ApiToken).where(
         ApiToken.user_id == user_id,
         ApiToken.is_active.is_(True)
-    ).all()
+    ))
+    return list(result.all())
 
 
-def deactivate_token(db: Session, token_id: int, user_id: int) -> bool:
+async def deactivate_token(db: AsyncSession, token_id: int, user_id: int) -> bool:
     """Deactivate an API token."""
-    token = db.query(ApiToken).filter(
+    token = await db.scalar(select(ApiToken).where(
         ApiToken.id == token_id,
         ApiToken.user_id == user_id
-    ).first()
+    ))
 
     if token:
         token.is_active = False  # type: ignore
-        db.commit()
+        await db.commit()
+        if token.token_digest is not None:
+            await token_cache.evict(token.token_digest)  # type: ignore
         return True
 
     return False
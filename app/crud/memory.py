@@ -1,150 +1,799 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, func, text
-from typing import List, Optional
+import hashlib
+import math
+import re
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import (
+    DateTime, Float, Row, Select, Subquery, and_, bindparam, case, cast, column, delete, func, literal, or_, select,
+    table, text, tuple_, update
+)
+from sqlalchemy.dialects.postgresql import Insert, insert
+from sqlalchemy.exc import IntegrityError
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from app.config import settings
+from app.db.models import Memory, RetentionRule
+from app.jobs import enqueue
+from app.schemas.memory import (
+    MemoryCreateRequest, MemoryData, MemoryQueryRequest, MemorySearchInfo, NearDuplicateAction
+)
+from app.services.embeddings import embedding_text, get_embedder
+from app.services.near_duplicates import NearDuplicateError, lsh_bands, shingles, similarity
+from app.services.query_cache import query_cache
+from app.utils.pagination import CREATED, FUSED, RANK, SIMILARITY, decode_cursor, encode_cursor
+
+# The columns of a MemoryData, in its field order; reads select only these
+MEMORY_COLUMNS = tuple(getattr(Memory, field) for field in MemoryData.model_fields)
+
+# Memories of a user that are the same memory, after the user_id
+DUPLICATE_KEY = (Memory.uid, Memory.namespace, Memory.content_hash)
+
+# Staging table of copy_memories
+COPY_TABLE = "memories_copy"
+
+
+async def create_memory(
+    db: AsyncSession,
+    memory_data: MemoryCreateRequest,
+    user_id: Optional[int] = None,
+    on_near_duplicate: NearDuplicateAction = "keep",
+) -> Memory:
+    """
+    Create a new memory entry
 
-from app.db.models import Memory
-from app.schemas.memory import MemoryCreateRequest, MemoryQueryRequest
+    If the uid already has a memory with the same content in the namespace,
+    that one is returned instead, with the new tags added to it. With
+    on_near_duplicate set, a memory at least near_duplicate_threshold alike
+    is found first: "merge" gives it the new text and adds the new tags,
+    "reject" raises NearDuplicateError. With memory_indexing_deferred the
+    embedding is left to an index_memories job.
+    """
+    values = {
+        "user_id": user_id,
+        "uid": memory_data.uid,
+        "namespace": memory_data.namespace,
+        "text": memory_data.text,
+        "tags": memory_data.tags,
+        "created_by": memory_data.created_by,
+        "content_hash": content_hash(memory_data.text),
+        "lsh_bands": lsh_bands(memory_data.text),
+        "expires_at": expiry(memory_data.ttl),
+    }
+
+    if on_near_duplicate != "keep":
+        match = await find_near_duplicate(db, values)
+        if match is not None:
+            existing, score = match
+            if on_near_duplicate == "reject":
+                raise NearDuplicateError(existing.id, score)
+            return await _merge_into(db, existing, values)
+
+    return await _insert(db, values)
+
+
+async def _insert(db: AsyncSession, values: dict) -> Memory:
+    """Insert a memory, or add its tags to the memory with the same content."""
+    if not settings.memory_indexing_deferred:
+        _add_embeddings([values])
+
+    # search_vector is filled in by a trigger
+    memory = await _commit_returning(db, _merge_duplicates(insert(Memory).values(**values)).returning(Memory))
+    await query_cache.invalidate(values["user_id"], [(values["uid"], values["namespace"])])
+    await _index_later(values["user_id"], [values["namespace"]], [memory.id])  # type: ignore
+    return memory
 
 
-def create_memory(db: Session, memory_data: MemoryCreateRequest, user_id: Optional[int] = None) -> Memory:
+async def create_memories(
+    db: AsyncSession,
+    items: List[MemoryCreateRequest],
+    user_id: Optional[int] = None
+) -> List[int]:
     """
-    Create a new memory entry
+    Create many memory entries in one transaction
+
+    Returns the new ids in the order of items. Items with the same content as
+    each other or as an existing memory are merged like in create_memory and
+    get the id of the memory they were merged into. With
+    memory_indexing_deferred, LSH keys and embeddings are left to
+    index_memories jobs.
+    """
+    index = not settings.memory_indexing_deferred
+    rows = [
+        {
+            "user_id": user_id,
+            "uid": item.uid,
+            "namespace": item.namespace,
+            "text": item.text,
+            "tags": item.tags,
+            "created_by": item.created_by,
+            "expires_at": expiry(item.ttl),
+        }
+        for item in items
+    ]
+    if not rows:
+        return []
+
+    if len(rows) >= settings.memory_batch_copy_threshold:
+        ids = await copy_memories(db, rows, index)
+    else:
+        unique, positions = _prepare_rows(rows, index)
+        # Sent as multi-row INSERT ... VALUES ... ON CONFLICT statements;
+        # existing memories come back in place of new ones, so rows are
+        # matched up by their conflict key rather than by position
+        result = await db.execute(_merge_duplicates(insert(Memory)).returning(*DUPLICATE_KEY, Memory.id), unique)
+        ids = _ids_in_order(unique, positions, result.all())
+
+    await db.commit()
+    await query_cache.invalidate(user_id, [(row["uid"], row["namespace"]) for row in rows])
+    await _index_later(user_id, [row["namespace"] for row in rows], ids)
+    return ids
+
+
+async def copy_memories(db: AsyncSession, rows: List[dict], index: bool = True) -> List[int]:
+    """
+    COPY rows into memories, merging duplicates like create_memories
+
+    Rows are COPYed into a temporary table, with ids taken from the sequence
+    beforehand, and moved over with INSERT ... SELECT ... ON CONFLICT.
+    Every row must have the same keys. Returns the id of each row. Does not
+    commit, so the caller invalidates cached queries once it has.
     """
-    memory = Memory(
-        user_id=user_id,
-        uid=memory_data.uid,
-        namespace=memory_data.namespace,
-        text=memory_data.text,
-        tags=memory_data.tags,
-        created_by=memory_data.created_by,
+    unique, positions = _prepare_rows(rows, index)
+    result = await db.scalars(
+        text("SELECT nextval(pg_get_serial_sequence('memories', 'id')) FROM generate_series(1, :n)"),
+        {"n": len(unique)},
     )
+    records = [(memory_id, *row.values()) for memory_id, row in zip(result.all(), unique)]
+    columns = ["id", *unique[0]]
+
+    # Dropped at commit; a second COPY in the same transaction starts afresh
+    await db.execute(text(f"DROP TABLE IF EXISTS pg_temp.{COPY_TABLE}"))
+    await db.execute(text(f"CREATE TEMPORARY TABLE {COPY_TABLE} (LIKE memories INCLUDING DEFAULTS) ON COMMIT DROP"))
+
+    # COPY runs on the session's connection, inside its transaction
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(COPY_TABLE, records=records, columns=columns)
+
+    staged = table(COPY_TABLE, *(column(name) for name in columns))
+    statement = insert(Memory).from_select(columns, select(*staged.c))
+    result = await db.execute(_merge_duplicates(statement).returning(*DUPLICATE_KEY, Memory.id))
+    return _ids_in_order(unique, positions, result.all())
+
+
+def expiry(ttl: Optional[int]) -> Optional[datetime]:
+    """expires_at of a memory saved now with a ttl in seconds."""
+    return datetime.now(timezone.utc) + timedelta(seconds=ttl) if ttl else None
+
+
+def content_hash(text: str) -> bytes:
+    """
+    Digest of a memory's text for deduplication
+
+    Texts that differ only in Unicode normalisation form, case or whitespace
+    have the same digest.
+    """
+    normalized = " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+    return hashlib.sha256(normalized.encode()).digest()
+
+
+async def find_near_duplicate(db: AsyncSession, values: dict) -> Optional[Tuple[Row, float]]:
+    """
+    The memory of the uid in the namespace most like a new one, with its
+    similarity, if any is at least near_duplicate_threshold alike
+
+    values are the columns of the new memory, including content_hash and
+    lsh_bands. Only the newest near_duplicate_candidates memories sharing a
+    band key, or the content hash, are compared; ties go to the newest.
+    """
+    candidates = (await db.execute(
+        select(Memory.id, Memory.text, Memory.tags, Memory.content_hash)
+        .where(
+            Memory.user_id == values["user_id"],
+            Memory.uid == values["uid"],
+            Memory.namespace == values["namespace"],
+            or_(Memory.lsh_bands.op("&&")(values["lsh_bands"]), Memory.content_hash == values["content_hash"]),
+            *live_filters(values["user_id"], values["namespace"]),
+        )
+        .order_by(Memory.created_at.desc(), Memory.id.desc())
+        .limit(settings.near_duplicate_candidates)
+    )).all()
+
+    new = shingles(values["text"])
+    best = None
+    for candidate in candidates:
+        if candidate.content_hash == values["content_hash"]:
+            score = 1.0
+        else:
+            score = similarity(new, shingles(candidate.text))
+        if score >= settings.near_duplicate_threshold and (best is None or score > best[1]):
+            best = (candidate, score)
+    return best
+
+
+async def _merge_into(db: AsyncSession, existing: Row, values: dict) -> Memory:
+    """
+    Give a near duplicate the text of a new memory and add its tags
+
+    If another memory of the uid already has that text, one that expired or
+    wasn't among the candidates compared, the new memory is saved as an
+    exact duplicate of it instead.
+    """
+    merged = {key: values[key] for key in ("text", "content_hash", "lsh_bands", "expires_at")}
+    merged["tags"] = list(dict.fromkeys([*existing.tags, *values["tags"]]))
+    if not settings.memory_indexing_deferred:
+        _add_embeddings([merged])
+
+    # search_vector is refreshed by a trigger. In a savepoint, so a clash on
+    # idx_memories_content_hash undoes only the update
+    try:
+        async with db.begin_nested():
+            memory = await db.scalar(
+                update(Memory)
+                .where(Memory.id == existing.id, Memory.namespace == values["namespace"])
+                .values(**merged)
+                .returning(Memory)
+                .execution_options(populate_existing=True)
+            )
+    except IntegrityError:
+        return await _insert(db, values)
+    await db.commit()
+
+    await query_cache.invalidate(values["user_id"], [(values["uid"], values["namespace"])])
+    await _index_later(values["user_id"], [values["namespace"]], [existing.id])
+    return memory  # type: ignore
+
 
-    db.add(memory)
-    db.commit()
+def _prepare_rows(rows: List[dict], index: bool = True) -> Tuple[List[dict], List[int]]:
+    """
+    Hash rows and merge those with the same content, as ON CONFLICT can't
+    update a row twice in one statement; with index, LSH keys and embeddings
+    are added to the rest
 
-    # Update search vector for full-text search
-    db.execute(
-        text(
-            "UPDATE memories SET search_vector = to_tsvector('english', text || ' ' || array_to_string(tags, ' ')) WHERE id = :id"
-        ),
-        {"id": memory.id}
+    Returns the unique rows and, for each row, the position of its unique row.
+    """
+    unique: List[dict] = []
+    positions: List[int] = []
+    seen: dict = {}
+    for row in rows:
+        row.setdefault("content_hash", content_hash(row["text"]))
+        key = (row["uid"], row["namespace"], row["content_hash"])
+        if key in seen:
+            first = unique[seen[key]]
+            first["tags"] = list(dict.fromkeys([*first["tags"], *row["tags"]]))
+        else:
+            seen[key] = len(unique)
+            unique.append(row)
+        positions.append(seen[key])
+
+    if index:
+        for row in unique:
+            row.setdefault("lsh_bands", lsh_bands(row["text"]))
+        _add_embeddings(unique)
+    return unique, positions
+
+
+def _merge_duplicates(statement: Insert) -> Insert:
+    """
+    ON CONFLICT clause of memory inserts: a memory whose content the uid
+    already has in the namespace keeps its id and gains the new tags
+
+    The conflict target is idx_memories_content_hash. Memories without a
+    user never conflict, since its NULLs are distinct. The expiry of the
+    latest save wins, so saving again with a ttl extends it, and without one
+    keeps the memory for good.
+    """
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[Memory.user_id, *DUPLICATE_KEY],
+        set_={
+            "tags": func.memory_merge_tags(Memory.tags, excluded.tags),
+            "expires_at": excluded.expires_at,
+            "updated_at": case((Memory.tags.op("@>")(excluded.tags), Memory.updated_at), else_=func.now()),
+        },
     )
-    db.commit()
 
-    db.refresh(memory)
-    return memory
 
+def _ids_in_order(unique: List[dict], positions: List[int], returned: Sequence[Row]) -> List[int]:
+    ids = {tuple(row[:-1]): row.id for row in returned}
+    unique_ids = [ids[(row["uid"], row["namespace"], row["content_hash"])] for row in unique]
+    return [unique_ids[position] for position in positions]
 
-def query_memories(
-    db: Session,
-    query_request: MemoryQueryRequest,
-    user_id: Optional[int] = None
-) -> List[Memory]:
+
+def _add_embeddings(rows: List[dict]) -> None:
+    """Set "embedding" on memory rows from their text and tags, if semantic search is enabled."""
+    if not settings.embedding_dimensions or not rows:
+        return
+    vectors = get_embedder().embed([embedding_text(row["text"], row["tags"]) for row in rows])
+    for row, vector in zip(rows, vectors):
+        row["embedding"] = vector
+
+
+async def _index_later(user_id: Optional[int], namespaces: List[str], ids: List[int]) -> None:
+    """Queue index_memories jobs for saved memories, one per namespace, if indexing is deferred."""
+    if not settings.memory_indexing_deferred:
+        return
+    by_namespace: dict = {}
+    for namespace, memory_id in zip(namespaces, ids):
+        by_namespace.setdefault(namespace, {})[memory_id] = None
+    for namespace, namespace_ids in by_namespace.items():
+        await enqueue("index_memories", user_id=user_id, namespace=namespace, ids=list(namespace_ids))
+
+
+async def index_memories(db: AsyncSession, namespace: str, ids: List[int]) -> int:
     """
-    Query memories based on filters
+    Fill in the LSH keys of memories that have none and recompute their
+    embeddings, for saves that left them to a job. Returns how many memories
+    were indexed; deleted ones are skipped.
     """
-    query = db.query(Memory)
+    rows = (await db.execute(
+        select(Memory.id, Memory.text, Memory.tags, Memory.lsh_bands)
+        .where(Memory.id.in_(ids), Memory.namespace == namespace)
+    )).all()
+    if not rows:
+        return 0
+
+    indexed = [{"text": row.text, "tags": row.tags} for row in rows]
+    _add_embeddings(indexed)
+    params = [
+        {"b_id": row.id, "b_lsh_bands": row.lsh_bands or lsh_bands(row.text), "b_embedding": values.get("embedding")}
+        for row, values in zip(rows, indexed)
+    ]
+    columns = {"lsh_bands": bindparam("b_lsh_bands")}
+    if settings.embedding_dimensions:
+        columns["embedding"] = bindparam("b_embedding", type_=Memory.embedding.type)
+
+    # Core executemany, one statement for the batch
+    memories = Memory.__table__
+    await db.execute(
+        update(memories)
+        .where(memories.c.id == bindparam("b_id"), memories.c.namespace == namespace)
+        .values(columns),
+        params,
+    )
+    await db.commit()
+    return len(rows)
+
 
-    # Filter by uid and namespace
-    filters = [Memory.uid == query_request.uid]
+def memory_query(query_request: MemoryQueryRequest, user_id: Optional[int] = None) -> Tuple[Select, str]:
+    """
+    Build the statement behind query_memories
 
-    if query_request.namespace:
-        filters.append(Memory.namespace == query_request.namespace)
+    Returns the statement, selecting MEMORY_COLUMNS and the sort value of each
+    memory, and the cursor kind of its ordering. Shared with
+    scripts/bench/explain_check.py so the plans checked there are the ones
+    the API runs.
+    """
+    # Filter by uid and namespace; namespace is the partition key and always set
+    filters = [Memory.uid == query_request.uid, Memory.namespace == query_request.namespace]
 
     # Filter by user if provided
     if user_id:
         filters.append(Memory.user_id == user_id)
 
-    # Apply basic filters
-    query = query.filter(and_(*filters))
+    filters += live_filters(user_id, query_request.namespace)  # type: ignore
 
     # Filter by tags if provided
     if query_request.tags:
         # Use PostgreSQL array overlap operator
-        query = query.filter(Memory.tags.op('&&')(query_request.tags))
+        filters.append(Memory.tags.op('&&')(query_request.tags))
 
-    # Full-text search if query provided
+    if query_request.within_days:
+        filters.append(Memory.created_at >= func.now() - timedelta(days=query_request.within_days))
+
+    # Searches are ordered by relevance, everything else by creation date
+    # (newest first); id breaks ties so cursors are exact
     if query_request.query:
-        search_query = func.plainto_tsquery('english', query_request.query)
-        query = query.filter(Memory.search_vector.op('@@')(search_query))
+        build, cursor_kind = SEARCHES[query_request.retrieval]
+        query, sort_value, memory_id = build(query_request, filters)
+    else:
+        sort_value, memory_id = Memory.created_at, Memory.id
+        query = select(*MEMORY_COLUMNS, sort_value.label("sort_value")).where(and_(*filters))
+        cursor_kind = CREATED
+
+    # Apply pagination: continue after the cursor, or skip offset rows
+    if query_request.cursor:
+        value, last_id = decode_cursor(query_request.cursor, cursor_kind)
+        query = query.where(tuple_(sort_value, memory_id) < tuple_(value, last_id))
+    else:
+        query = query.offset(query_request.offset)
+
+    # One extra row tells whether there is a next page
+    query = query.order_by(sort_value.desc(), memory_id.desc()).limit(query_request.limit + 1)
+
+    return query, cursor_kind
+
+
+def live_filters(user_id: Optional[int], namespace: Optional[str] = None) -> list:
+    """
+    Filters hiding memories that have expired, by ttl or by the retention
+    rule of their namespace, but haven't been reaped yet
+
+    For one namespace the rule is looked up by an uncorrelated subquery, run
+    once per statement, so its cutoff bounds the created_at range scanned;
+    otherwise each memory is checked against the rule of its namespace.
+    """
+    # Expired memories stay until the reaper deletes them
+    filters = [or_(Memory.expires_at.is_(None), Memory.expires_at > func.now())]
+    max_age = func.make_interval(0, 0, 0, RetentionRule.max_age_days)
+    if user_id and namespace:
+        cutoff = func.now() - (
+            select(max_age)
+            .where(RetentionRule.user_id == user_id, RetentionRule.namespace == namespace)
+            .scalar_subquery()
+        )
+        filters.append(Memory.created_at >= func.coalesce(cutoff, cast(literal("-infinity"), DateTime(timezone=True))))
+    elif user_id:
+        filters.append(~select(RetentionRule.id).where(
+            RetentionRule.user_id == Memory.user_id,
+            RetentionRule.namespace == Memory.namespace,
+            Memory.created_at < func.now() - max_age,
+        ).exists())
+    return filters
+
+
+def _keyword_query(query_request: MemoryQueryRequest, filters: list) -> Tuple[Select, Any, Any]:
+    """
+    Two-phase full-text search: fetch the newest matches, at most
+    search_candidate_cap of them, then rank only those with ts_rank_cd
 
-        # Order by relevance (ts_rank)
-        query = query.order_by(
-            func.ts_rank(Memory.search_vector, search_query).desc()
+    Ranking reads every matching tsvector, so without the cap a common word
+    in a large namespace ranks the whole namespace.
+    """
+    cap = settings.search_candidate_cap
+    search_query = _tsquery(query_request)
+
+    matches = (
+        select(*MEMORY_COLUMNS, Memory.search_vector)
+        .where(and_(*filters), Memory.search_vector.op('@@')(search_query))
+        .order_by(Memory.created_at.desc(), Memory.id.desc())
+    )
+    candidates = _candidates(matches, cap, lambda c: (c.created_at.desc(), c.id.desc()))
+
+    rank = func.ts_rank_cd(candidates.c.search_vector, search_query, settings.search_rank_normalization)
+    half_life = settings.search_recency_half_life_days * 86400
+    if half_life:
+        # rank * 0.5 ^ (age / half_life), in log space where age becomes the
+        # creation time; same order, but not tied to now(), so cursors hold
+        sort_value = (
+            func.ln(func.greatest(rank, 1e-9))
+            + func.extract('epoch', candidates.c.created_at) * (math.log(2) / half_life)
         )
     else:
-        # Default order by creation date (newest first)
-        query = query.order_by(Memory.created_at.desc())
+        sort_value = rank
+
+    return _ranked(candidates, cap, sort_value), sort_value, candidates.c.id
 
-    # Apply pagination
-    query = query.offset(query_request.offset).limit(query_request.limit)
 
-    return query.all()
+def _semantic_query(query_request: MemoryQueryRequest, filters: list) -> Tuple[Select, Any, Any]:
+    """
+    Nearest neighbours of the query's embedding through the HNSW index, at
+    most semantic_candidates of them, ordered by cosine similarity
+    """
+    vector = _query_embedding(query_request.query)
+    distance = Memory.embedding.cosine_distance(vector)
+
+    # ORDER BY the bare distance, or the index can't be used
+    matches = select(*MEMORY_COLUMNS, distance.label("distance")).where(and_(*filters)).order_by(distance)
+    cap = settings.semantic_candidates
+    candidates = _candidates(matches, cap, lambda c: (c.distance, c.id))
+
+    sort_value = 1 - candidates.c.distance
+    return _ranked(candidates, cap, sort_value), sort_value, candidates.c.id
+
+
+def _hybrid_query(query_request: MemoryQueryRequest, filters: list) -> Tuple[Select, Any, Any]:
+    """
+    Reciprocal rank fusion of the full-text and semantic candidates
+
+    Each memory scores 1 / (k + position) for every list it is in, so one
+    ranked highly by either, or fairly well by both, comes first.
+    """
+    lists = []
+    for build in (_keyword_query, _semantic_query):
+        ranked = build(query_request, filters)[0].subquery()
+        lists.append(select(
+            ranked,
+            func.row_number().over(order_by=(ranked.c.sort_value.desc(), ranked.c.id.desc())).label("position"),
+        ).subquery())
+    keyword, semantic = lists
+
+    def fused_score(ranked):
+        return func.coalesce(1.0 / (cast(ranked.c.position, Float) + settings.hybrid_rrf_k), 0.0)
+
+    fused = (
+        select(
+            *(func.coalesce(keyword.c[column.key], semantic.c[column.key]).label(column.key)
+              for column in MEMORY_COLUMNS),
+            (fused_score(keyword) + fused_score(semantic)).label("score"),
+            func.count().over().label("candidates"),
+            or_(
+                func.coalesce(func.bool_or(keyword.c.truncated).over(), False),
+                func.coalesce(func.bool_or(semantic.c.truncated).over(), False),
+            ).label("truncated"),
+        )
+        .select_from(keyword.join(semantic, keyword.c.id == semantic.c.id, full=True))
+        .subquery("fused")
+    )
+
+    query = select(
+        *(fused.c[column.key] for column in MEMORY_COLUMNS),
+        fused.c.score.label("sort_value"),
+        fused.c.candidates,
+        fused.c.truncated,
+    )
+    return query, fused.c.score, fused.c.id
+
+
+def _candidates(matches: Select, cap: int, order: Callable[[Any], tuple]) -> Subquery:
+    """
+    Cap an ordered query of matches, numbering and counting its rows so
+    _ranked can tell whether matches beyond the cap were left out
+    """
+    if cap:
+        # One more than the cap tells whether matches were left out
+        matches = matches.limit(cap + 1)
+    matches = matches.subquery("matches")
+
+    # Numbered and counted before the cursor or offset cuts them
+    return select(
+        matches,
+        func.row_number().over(order_by=order(matches.c)).label("ordinal"),
+        func.count().over().label("matched"),
+    ).subquery("candidates")
+
+
+def _ranked(candidates: Subquery, cap: int, sort_value: Any) -> Select:
+    """Select the candidates within the cap with their sort value and how many there were."""
+    query = select(
+        *(candidates.c[column.key] for column in MEMORY_COLUMNS),
+        sort_value.label("sort_value"),
+        (func.least(candidates.c.matched, cap) if cap else candidates.c.matched).label("candidates"),
+        (candidates.c.matched > cap if cap else literal(False)).label("truncated"),
+    )
+    if cap:
+        query = query.where(candidates.c.ordinal <= cap)
+    return query
+
+
+def _tsquery(query_request: MemoryQueryRequest) -> Any:
+    if query_request.search_mode == "websearch":
+        # Quoted phrases, OR and -word
+        return func.websearch_to_tsquery('english', query_request.query)
+    if query_request.search_mode == "prefix":
+        # Every word as a prefix; only word characters reach to_tsquery
+        words = re.findall(r"\w+", query_request.query or "")
+        if words:
+            return func.to_tsquery('english', " & ".join(f"{word}:*" for word in words))
+    return func.plainto_tsquery('english', query_request.query)
+
+
+def _query_embedding(query: str) -> Any:
+    # Raises SemanticSearchDisabledError unless EMBEDDING_DIMENSIONS is set
+    return get_embedder().embed([query])[0]
+
+
+# retrieval mode: (statement builder, cursor kind)
+SEARCHES = {
+    "keyword": (_keyword_query, RANK),
+    "semantic": (_semantic_query, SIMILARITY),
+    "hybrid": (_hybrid_query, FUSED),
+}
+
+
+def search_candidate_cap(retrieval: str) -> Optional[int]:
+    """Most candidates a search in this retrieval mode ranks, None if unbounded."""
+    keyword_cap = settings.search_candidate_cap or None
+    if retrieval == "keyword":
+        return keyword_cap
+    if retrieval == "semantic":
+        return settings.semantic_candidates
+    return keyword_cap and keyword_cap + settings.semantic_candidates
+
+
+async def query_memories(
+    db: AsyncSession,
+    query_request: MemoryQueryRequest,
+    user_id: Optional[int] = None,
+    with_expiry: bool = False
+) -> Tuple[Sequence[Row], Optional[str], Optional[MemorySearchInfo], Optional[datetime]]:
+    """
+    Query memories based on filters
+
+    Returns a page of memories, the cursor of the next page, if any, for
+    searches how many candidates were ranked, and with_expiry, when the page
+    changes because a memory expires (None if none will, or without
+    with_expiry). The memories are plain rows of MEMORY_COLUMNS followed by
+    their sort value, not ORM objects, so nothing is hydrated or tracked by
+    the session.
+    """
+    query, cursor_kind = memory_query(query_request, user_id)
+
+    if query_request.query and query_request.retrieval != "keyword":
+        # HNSW returns at most ef_search rows, before the tenant filters
+        await db.execute(
+            text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+            {"ef_search": str(min(max(settings.semantic_candidates + 1, 40), 1000))},
+        )
+        if settings.semantic_iterative_scan:
+            await db.execute(
+                text("SELECT set_config('hnsw.iterative_scan', :mode, true)"),
+                {"mode": settings.semantic_iterative_scan},
+            )
 
+    rows = (await db.execute(query)).all()
+    expires = await page_expiry(db, query_request, rows, user_id) if with_expiry else None
+    next_cursor = None
+    if len(rows) > query_request.limit:
+        rows = rows[:query_request.limit]
+        next_cursor = encode_cursor(cursor_kind, rows[-1].sort_value, rows[-1].id)
 
-def get_memory_by_id(db: Session, memory_id: int, user_id: Optional[int] = None) -> Optional[Memory]:
+    search = None
+    if query_request.query:
+        search = MemorySearchInfo(
+            candidate_cap=search_candidate_cap(query_request.retrieval),
+            candidates=rows[0].candidates if rows else 0,
+            truncated=rows[0].truncated if rows else False,
+        )
+
+    return rows, next_cursor, search, expires
+
+
+async def page_expiry(
+    db: AsyncSession,
+    query_request: MemoryQueryRequest,
+    rows: Sequence[Row],
+    user_id: Optional[int] = None
+) -> Optional[datetime]:
+    """
+    When the first memory a page of rows depends on expires, by ttl or by the
+    retention rule of the namespace; None if none of them will
+
+    That is the memories of the page and the one after it, which decides the
+    next cursor. Memories skipped by an offset aren't checked: the page
+    shifts when the reaper deletes them, which invalidates cached queries.
+    """
+    if not rows:
+        # Memories only ever drop out of a query as time passes
+        return None
+
+    expiries = [row.expires_at for row in rows if row.expires_at is not None]
+    if user_id:
+        max_age_days = await db.scalar(
+            select(RetentionRule.max_age_days)
+            .where(RetentionRule.user_id == user_id, RetentionRule.namespace == query_request.namespace)
+        )
+        if max_age_days is not None:
+            expiries.append(min(row.created_at for row in rows) + timedelta(days=max_age_days))
+
+    return min(expiries, default=None)
+
+
+async def get_memory_by_id(
+    db: AsyncSession,
+    memory_id: int,
+    namespace: str,
+    user_id: Optional[int] = None
+) -> Optional[Memory]:
     """
     Get a specific memory by ID
+
+    namespace is the partition key, so it is needed to find the row cheaply.
     """
-    query = db.query(Memory).filter(Memory.id == memory_id)
+    query = select(Memory).where(Memory.id == memory_id, Memory.namespace == namespace)
 
     if user_id:
-        query = query.filter(Memory.user_id == user_id)
+        query = query.where(Memory.user_id == user_id)
 
-    return query.first()
+    return await db.scalar(query)
 
 
-def delete_memory(db: Session, memory_id: int, user_id: Optional[int] = None) -> bool:
+async def delete_memory(
+    db: AsyncSession,
+    memory_id: int,
+    namespace: str,
+    user_id: Optional[int] = None
+) -> bool:
     """
     Delete a memory entry
     """
-    query = db.query(Memory).filter(Memory.id == memory_id)
+    query = delete(Memory).where(Memory.id == memory_id, Memory.namespace == namespace)
 
     if user_id:
-        query = query.filter(Memory.user_id == user_id)
+        query = query.where(Memory.user_id == user_id)
+
+    uid = await db.scalar(query.returning(Memory.uid))
+    await db.commit()
+    if uid is None:
+        return False
+
+    await query_cache.invalidate(user_id, [(uid, namespace)])
+    return True
+
+
+async def delete_expired_memories(
+    db: AsyncSession,
+    batch_size: int,
+    user_id: Optional[int] = None,
+    namespace: Optional[str] = None,
+    max_age_days: Optional[int] = None,
+) -> List[Row]:
+    """
+    Delete up to batch_size expired memories and commit
 
-    memory = query.first()
-    if memory:
-        db.delete(memory)
-        db.commit()
-        return True
+    Without a namespace these are memories past their expires_at; with one,
+    the memories of the user's namespace older than max_age_days. Rows
+    another transaction has locked are skipped rather than waited for, so
+    concurrent reapers and writers don't queue up behind each other. Returns
+    the (user_id, uid, namespace) of each deleted memory.
+    """
+    if namespace is None:
+        expired = Memory.expires_at <= func.now()
+    else:
+        expired = and_(
+            Memory.user_id == user_id,
+            Memory.namespace == namespace,
+            Memory.created_at < func.now() - timedelta(days=max_age_days),  # type: ignore
+        )
+    batch = select(Memory.id, Memory.namespace).where(expired).limit(batch_size).with_for_update(skip_locked=True)
 
-    return False
+    result = await db.execute(
+        delete(Memory)
+        .where(tuple_(Memory.id, Memory.namespace).in_(batch))
+        .returning(Memory.user_id, Memory.uid, Memory.namespace)
+    )
+    deleted = result.all()
+    await db.commit()
+    return deleted
 
 
-def update_memory(
-    db: Session,
+async def update_memory(
+    db: AsyncSession,
     memory_id: int,
+    namespace: str,
     update_data: dict,
     user_id: Optional[int] = None
 ) -> Optional[Memory]:
     """
     Update a memory entry
+
+    Changing the text to that of another memory of the uid in the namespace
+    raises IntegrityError.
     """
-    query = db.query(Memory).filter(Memory.id == memory_id)
+    values = {key: value for key, value in update_data.items() if key in Memory.__table__.c}
+    if not values:
+        return await get_memory_by_id(db, memory_id, namespace, user_id=user_id)
+
+    if "text" in values:
+        values["content_hash"] = content_hash(values["text"])
+        values["lsh_bands"] = lsh_bands(values["text"])
+
+    if settings.embedding_dimensions and values.keys() & {"text", "tags"}:
+        # The embedding covers both text and tags; fetch whichever isn't changing
+        if not values.keys() >= {"text", "tags"}:
+            current = await get_memory_by_id(db, memory_id, namespace, user_id=user_id)
+            if current is None:
+                return None
+            values.setdefault("text", current.text)
+            values.setdefault("tags", current.tags)
+        _add_embeddings([values])
+
+    query = update(Memory).where(Memory.id == memory_id, Memory.namespace == namespace)
 
     if user_id:
-        query = query.filter(Memory.user_id == user_id)
-
-    memory = query.first()
-    if memory:
-        for key, value in update_data.items():
-            if hasattr(memory, key):
-                setattr(memory, key, value)
-
-        db.commit()
-
-        # Update search vector if text or tags changed
-        if 'text' in update_data or 'tags' in update_data:
-            db.execute(
-                text(
-                    "UPDATE memories SET search_vector = to_tsvector('english', text || ' ' || array_to_string(tags, ' ')) WHERE id = :id"
-                ),
-                {"id": memory.id}
-            )
-            db.commit()
+        query = query.where(Memory.user_id == user_id)
+
+    # search_vector is refreshed by a trigger when text or tags change
+    memory = await _commit_returning(db, query.values(**values).returning(Memory))
+    if memory is not None:
+        # Across the namespace, as the uid may have changed
+        await query_cache.invalidate(user_id, [(None, namespace)])
+    return memory
 
-        db.refresh(memory)
-        return memory
 
-    return None
+async def _commit_returning(db: AsyncSession, statement) -> Optional[Memory]:
+    """Run a single INSERT/UPDATE ... RETURNING and commit."""
+    memory = await db.scalar(statement.execution_options(populate_existing=True))
+    await db.commit()
+    return memory
@@ -0,0 +1,59 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, Sequence
+
+from app.db.models import NamespaceStats, TagCount
+
+
+async def get_namespace_stats(db: AsyncSession, user_id: int, uid: str, namespace: str) -> Optional[NamespaceStats]:
+    """Memory and tag counts of a uid in a namespace, by primary key."""
+    return await db.get(NamespaceStats, (user_id, uid, namespace))
+
+
+async def get_tag_counts(
+    db: AsyncSession, user_id: int, uid: str, namespace: str, limit: int
+) -> Sequence[TagCount]:
+    """The most used tags of a uid in a namespace, along idx_tag_counts_facets."""
+    return (await db.scalars(
+        select(TagCount)
+        .where(TagCount.user_id == user_id, TagCount.uid == uid, TagCount.namespace == namespace)
+        .order_by(TagCount.memory_count.desc(), TagCount.tag)
+        .limit(limit)
+    )).all()
+
+
+async def complete_tags(
+    db: AsyncSession, user_id: int, uid: str, namespace: str, prefix: str, limit: int
+) -> Sequence[TagCount]:
+    """Tags of a uid in a namespace starting with prefix, in byte order, from a range of the primary key."""
+    query = (
+        select(TagCount)
+        .where(TagCount.user_id == user_id, TagCount.uid == uid, TagCount.namespace == namespace)
+        .order_by(TagCount.tag)
+        .limit(limit)
+    )
+
+    # A range rather than LIKE, which only becomes one when the pattern is a
+    # constant, not in the generic plans of prepared statements
+    if prefix:
+        query = query.where(TagCount.tag >= prefix)
+        upper = prefix_upper_bound(prefix)
+        if upper is not None:
+            query = query.where(TagCount.tag < upper)
+
+    return (await db.scalars(query)).all()
+
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """
+    The least string after every string starting with prefix, in code point
+    (and so UTF-8 byte) order; None if there is none.
+    """
+    while prefix:
+        following = ord(prefix[-1]) + 1
+        if 0xD800 <= following <= 0xDFFF:
+            following = 0xE000  # surrogates can't be stored
+        if following <= 0x10FFFF:
+            return prefix[:-1] + chr(following)
+        prefix = prefix[:-1]
+    return None
@@ -0,0 +1,47 @@
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, Sequence
+
+from app.db.models import RetentionRule
+from app.services.query_cache import query_cache
+
+
+async def get_retention_rules(db: AsyncSession, user_id: Optional[int] = None) -> Sequence[RetentionRule]:
+    """Retention rules of a user, or of everyone."""
+    query = select(RetentionRule).order_by(RetentionRule.user_id, RetentionRule.namespace)
+
+    if user_id:
+        query = query.where(RetentionRule.user_id == user_id)
+
+    return (await db.scalars(query)).all()
+
+
+async def set_retention_rule(db: AsyncSession, user_id: int, namespace: str, max_age_days: int) -> RetentionRule:
+    """Create or replace the retention rule of a namespace."""
+    statement = insert(RetentionRule).values(user_id=user_id, namespace=namespace, max_age_days=max_age_days)
+    statement = statement.on_conflict_do_update(
+        index_elements=[RetentionRule.user_id, RetentionRule.namespace],
+        set_={"max_age_days": statement.excluded.max_age_days, "updated_at": func.now()},
+    )
+    rule = await db.scalar(statement.returning(RetentionRule).execution_options(populate_existing=True))
+    await db.commit()
+
+    # Cached queries of the namespace may hold memories the rule hides
+    await query_cache.invalidate(user_id, [(None, namespace)])
+    return rule  # type: ignore
+
+
+async def delete_retention_rule(db: AsyncSession, user_id: int, namespace: str) -> bool:
+    """Delete the retention rule of a namespace."""
+    deleted = await db.scalar(
+        delete(RetentionRule)
+        .where(RetentionRule.user_id == user_id, RetentionRule.namespace == namespace)
+        .returning(RetentionRule.id)
+    )
+    await db.commit()
+    if deleted is None:
+        return False
+
+    await query_cache.invalidate(user_id, [(None, namespace)])
+    return True
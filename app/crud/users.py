@@ -1,24 +1,25 @@
 """CRUD operations for users."""
 
 from typing import Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.models import User
-from app.utils.security import hash_password, verify_password
+from app.utils.security import hash_password_async, verify_password_async
 
 
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     """Get user by email."""
-    return db.query(User).filter(User.email == email).first()
+    return await db.scalar(select(User).where(User.email == email))
 
 
-def get_user_by_id(db: Session, user_id: int) -> Optional[User]:
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
     """Get user by ID."""
-    return db.query(User).filter(User.id == user_id).first()
+    return await db.scalar(select(User).where(User.id == user_id))
 
 
-def create_user(db: Session, email: str, password: str, name: Optional[str] = None, plan: str = "free") -> User:
+async def create_user(db: AsyncSession, email: str, password: str, name: Optional[str] = None, plan: str = "free") -> User:
     """Create a new user."""
-    hashed_password = hash_password(password)
+    hashed_password = await hash_password_async(password)
     user = User(
         email=email,
         name=name,
@@ -27,26 +28,26 @@ def create_user(db: Session, email: str, password: str, name: Optional[str] = No
         is_active=True
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
     """Authenticate user with email and password."""
-    user = get_user_by_email(db, email)
+    user = await get_user_by_email(db, email)
     if not user:
         return None
-    if not verify_password(password, user.password_hash): # type: ignore
+    if not await verify_password_async(password, user.password_hash): # type: ignore
         return None
     if not user.is_active: # type: ignore
         return None
     return user
 
 
-def update_user(db: Session, user_id: int, **kwargs) -> Optional[User]:
+async def update_user(db: AsyncSession, user_id: int, **kwargs) -> Optional[User]:
     """Update user fields."""
-    user = get_user_by_id(db, user_id)
+    user = await get_user_by_id(db, user_id)
     if not user:
         return None
 
@@ -54,6 +55,6 @@ def update_user(db: Session, user_id: int, **kwargs) -> Optional[User]:
         if hasattr(user, field):
             setattr(user, field, value)
 
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Find and merge near-duplicate memories, e.g. "User prefers dark mode" saved
+again as "user prefers the dark mode".
+
+Memories of a uid in a namespace are grouped when their shingles are at
+least --threshold alike (Jaccard, see app.services.near_duplicates), found
+through MinHash LSH buckets rather than by comparing every pair. report
+prints each group as a line of JSON, for review; merge keeps the newest
+memory of each group, adds the tags of the others to it and deletes them,
+one uid and namespace per transaction. backfill fills memories.lsh_bands,
+which saves use to find near duplicates, for memories saved before it.
+
+    python -m app.db.compaction backfill [--all]
+    python -m app.db.compaction report [--namespace acme] [--threshold 0.7] > groups.ndjson
+    python -m app.db.compaction merge [--namespace acme] [--threshold 0.7]
+
+Memories without a user are left alone, as saves don't merge them either.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from typing import Callable, Iterator, Optional
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Row
+
+# Add the app directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+UPDATE_BANDS = text("""
+    UPDATE memories m SET lsh_bands = CAST(b.lsh_bands AS bigint[])
+    FROM unnest(CAST(:ids AS integer[]), CAST(:bands AS text[])) AS b(id, lsh_bands)
+    WHERE m.id = b.id
+""")
+
+SELECT_TENANTS = text("""
+    SELECT user_id, uid, namespace FROM memories
+    WHERE user_id IS NOT NULL AND (CAST(:namespace AS varchar) IS NULL OR namespace = :namespace)
+    GROUP BY user_id, uid, namespace HAVING count(*) > 1
+    ORDER BY user_id, uid, namespace
+""")
+
+# Newest first, along idx_memories_tenant_created
+SELECT_TENANT = text("""
+    SELECT id, text, tags FROM memories
+    WHERE user_id = :user_id AND uid = :uid AND namespace = :namespace
+    ORDER BY created_at DESC, id DESC
+""")
+
+DELETE_MERGED = text("DELETE FROM memories WHERE namespace = :namespace AND id = ANY(CAST(:ids AS integer[]))")
+
+
+def backfill_bands(conn: Connection, batch_size: int = 1000, recompute: bool = False) -> int:
+    """
+    Set lsh_bands of memories that have none (every memory with recompute)
+    and return how many were written. Commits after each batch.
+    """
+    from app.services.near_duplicates import lsh_bands
+
+    condition = "" if recompute else "AND lsh_bands IS NULL"
+    select_batch = text(
+        f"SELECT id, text FROM memories WHERE id > :last_id {condition} ORDER BY id LIMIT :batch_size"
+    )
+
+    written = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(select_batch, {"last_id": last_id, "batch_size": batch_size}).all()
+        if not rows:
+            return written
+
+        conn.execute(UPDATE_BANDS, {
+            "ids": [row.id for row in rows],
+            "bands": ["{" + ",".join(map(str, lsh_bands(row.text))) + "}" for row in rows],
+        })
+        conn.commit()
+
+        written += len(rows)
+        last_id = rows[-1].id
+
+
+def near_duplicate_groups(
+    conn: Connection,
+    threshold: float,
+    namespace: Optional[str] = None,
+) -> Iterator[tuple[Row, list[list[Row]]]]:
+    """
+    Each uid and namespace with near-duplicate memories, and its groups of
+    them, newest first. The transaction of a tenant is still open when it is
+    yielded, so its groups can be merged before the next one is read.
+    """
+    from app.services.near_duplicates import clusters
+
+    tenants = conn.execute(SELECT_TENANTS, {"namespace": namespace}).all()
+    conn.rollback()
+    for tenant in tenants:
+        rows = conn.execute(SELECT_TENANT, tenant._asdict()).all()
+        groups = [[rows[position] for position in group] for group in clusters([row.text for row in rows], threshold)]
+        if groups:
+            yield tenant, groups
+        conn.commit()
+
+
+def merge_group(conn: Connection, namespace: str, group: list[Row]) -> None:
+    """Keep the newest memory of a group with the tags of all of them, and delete the rest."""
+    from app.config import settings
+
+    keeper, merged = group[0], group[1:]
+    tags = list(dict.fromkeys(tag for row in group for tag in row.tags))
+    if tags != keeper.tags:
+        assignments = "tags = :tags, updated_at = now()"
+        params = {"id": keeper.id, "namespace": namespace, "tags": tags}
+        if settings.embedding_dimensions:
+            from app.services.embeddings import embedding_text, get_embedder
+
+            vector = get_embedder().embed([embedding_text(keeper.text, tags)])[0]
+            assignments += ", embedding = CAST(:embedding AS vector)"
+            params["embedding"] = "[" + ",".join(map(repr, vector.tolist())) + "]"
+        # search_vector is refreshed by a trigger
+        conn.execute(text(f"UPDATE memories SET {assignments} WHERE id = :id AND namespace = :namespace"), params)
+    conn.execute(DELETE_MERGED, {"namespace": namespace, "ids": [row.id for row in merged]})
+
+
+def compact(
+    conn: Connection,
+    threshold: float,
+    namespace: Optional[str] = None,
+    merge: bool = False,
+    report: Callable[[dict], None] = lambda group: None,
+) -> tuple[int, int, set]:
+    """
+    Find near-duplicate groups, passing each to report, and with merge
+    merge them. Returns how many groups there were, how many memories they
+    would lose, and the (user_id, namespace) pairs they are in.
+    """
+    found = duplicates = 0
+    changed = set()
+    for tenant, groups in near_duplicate_groups(conn, threshold, namespace):
+        for group in groups:
+            report({
+                "user_id": tenant.user_id,
+                "uid": tenant.uid,
+                "namespace": tenant.namespace,
+                "keep": {"id": group[0].id, "text": group[0].text},
+                "duplicates": [{"id": row.id, "text": row.text} for row in group[1:]],
+            })
+            if merge:
+                merge_group(conn, tenant.namespace, group)
+            found += 1
+            duplicates += len(group) - 1
+        changed.add((tenant.user_id, tenant.namespace))
+    return found, duplicates, changed
+
+
+def main() -> None:
+    from app.config import settings
+    from app.db.database import engine
+    from app.services.query_cache import query_cache
+    from app.services.redis_client import close_redis
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = commands.add_parser("backfill", help="fill lsh_bands of memories saved before it")
+    backfill_parser.add_argument("--all", action="store_true", help="recompute every memory's bands")
+    backfill_parser.add_argument("--batch-size", type=int, default=1000)
+    for command, description in (("report", "print near-duplicate groups as NDJSON"), ("merge", "merge near duplicates")):
+        command_parser = commands.add_parser(command, help=description)
+        command_parser.add_argument("--namespace", help="only this namespace")
+        command_parser.add_argument("--threshold", type=float, default=settings.near_duplicate_threshold)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        with engine.connect() as conn:
+            written = backfill_bands(conn, args.batch_size, args.all)
+        print(f"✅ Banded {written} memories")
+        return
+
+    def report(group: dict) -> None:
+        if args.command == "report":
+            sys.stdout.buffer.write(orjson.dumps(group) + b"\n")
+
+    with engine.connect() as conn:
+        found, duplicates, changed = compact(conn, args.threshold, args.namespace, args.command == "merge", report)
+
+    if args.command == "report":
+        print(f"✅ Found {found} groups of near duplicates, {duplicates} memories to merge", file=sys.stderr)
+        return
+
+    async def invalidate() -> None:
+        for user_id, namespace in changed:
+            await query_cache.invalidate(user_id, [(None, namespace)])
+        await close_redis()
+
+    asyncio.run(invalidate())
+    print(f"✅ Merged {duplicates} memories into {found} in {len(changed)} namespaces")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,125 @@
-from sqlalchemy import create_engine
+import logging
+import time
+from uuid import uuid4
+from pgvector.asyncpg import register_vector
+from prometheus_client import Gauge, Histogram
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+# Synchronous engine for migrations and scripts
 engine = create_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
+POOL_ACQUIRE_SECONDS = Histogram(
+    "ajimemo_db_pool_acquire_seconds",
+    "Time spent waiting for a pooled database connection",
+    ["pool"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Async queue pool that records how long checkouts wait, labelled by logging name."""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            POOL_ACQUIRE_SECONDS.labels(self.logging_name).observe(time.perf_counter() - started)
+
+
+def async_database_url(url: str) -> str:
+    """Point a PostgreSQL URL at the asyncpg driver."""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+def create_api_engine(url: str, pool_name: str = "primary") -> AsyncEngine:
+    """Create an async engine with the configured pool settings."""
+    connect_args: dict = {}
+
+    if settings.db_pgbouncer_mode:
+        # pgbouncer in transaction mode hands the server connection to another
+        # client after every transaction, so nothing may outlive one: no
+        # cached prepared statements and no session-level settings
+        connect_args["statement_cache_size"] = 0
+        connect_args["prepared_statement_cache_size"] = 0
+        connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    elif settings.db_statement_timeout_ms:
+        connect_args["server_settings"] = {"statement_timeout": str(settings.db_statement_timeout_ms)}
+
+    async_engine = create_async_engine(
+        async_database_url(url),
+        poolclass=InstrumentedQueuePool,
+        pool_logging_name=pool_name,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+    if settings.db_pgbouncer_mode and settings.db_statement_timeout_ms:
+        # Costs one extra round trip per transaction; set statement_timeout on
+        # the database role instead to avoid it
+        @event.listens_for(async_engine.sync_engine, "begin")
+        def set_statement_timeout(conn):
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings.db_statement_timeout_ms)}")
+
+    if settings.embedding_dimensions:
+        @event.listens_for(async_engine.sync_engine, "connect")
+        def register_vector_codec(dbapi_connection, connection_record):
+            dbapi_connection.run_async(_register_vector)
 
+    for name, doc, method in (
+        ("ajimemo_db_pool_size", "Configured pool size", "size"),
+        ("ajimemo_db_pool_checked_out", "Connections currently checked out", "checkedout"),
+        ("ajimemo_db_pool_checked_in", "Idle connections in the pool", "checkedin"),
+        ("ajimemo_db_pool_overflow", "Connections open beyond pool_size", "overflow"),
+    ):
+        _pool_gauge(name, doc).labels(pool_name).set_function(
+            lambda method=method: getattr(async_engine.pool, method)()
+        )
 
-def get_db():
-    db = SessionLocal()
+    return async_engine
+
+
+async def _register_vector(connection) -> None:
+    # Binary codec for pgvector, so embeddings go over the wire (and through
+    # COPY) as arrays rather than text
     try:
+        await register_vector(connection)
+    except ValueError:
+        # Extension not installed yet; semantic search fails until it is
+        logger.warning("pgvector type not found; run the migrations to enable semantic search")
+
+
+_gauges: dict[str, Gauge] = {}
+
+
+def _pool_gauge(name: str, doc: str) -> Gauge:
+    if name not in _gauges:
+        _gauges[name] = Gauge(name, doc, ["pool"])
+    return _gauges[name]
+
+
+# Async engine used by the API
+async_engine = create_api_engine(settings.database_url)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+Base = declarative_base()
+
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Hash and deduplicate memories saved before memories.content_hash existed.
+
+Saves merge a memory into an existing one with the same content, but only
+memories that have a content hash can be found that way. This walks the
+memories without one in batches of ids, each in its own short transaction:
+memories of a uid in a namespace with the same content are merged into the
+one that already has the hash or else the oldest, which gets the tags of all
+of them and the earliest created_at, and the others are deleted. Safe to
+interrupt and re-run; cached queries of changed namespaces are invalidated
+at the end.
+
+    python -m app.db.dedup [--batch-size 1000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+
+# Add the app directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+SELECT_BATCH = text(
+    "SELECT id, text FROM memories WHERE id > :last_id AND content_hash IS NULL ORDER BY id LIMIT :batch_size"
+)
+
+# Each memory of the batch and the one it is kept as: the memory that already
+# has its hash, or the oldest of the batch. Memories without a user are never
+# merged, as saves don't merge them either.
+STAGE_BATCH = text("""
+    CREATE TEMPORARY TABLE dedup_batch ON COMMIT DROP AS
+    SELECT b.id, b.content_hash, m.user_id, m.namespace,
+           CASE WHEN m.user_id IS NULL THEN b.id
+                ELSE coalesce(e.id, min(b.id) OVER (PARTITION BY m.user_id, m.uid, m.namespace, b.content_hash))
+           END AS keeper
+    FROM unnest(CAST(:ids AS integer[]), CAST(:hashes AS bytea[])) AS b(id, content_hash)
+    JOIN memories m ON m.id = b.id
+    LEFT JOIN memories e
+      ON e.user_id = m.user_id AND e.uid = m.uid AND e.namespace = m.namespace AND e.content_hash = b.content_hash
+""")
+
+MERGE_INTO_KEEPERS = text("""
+    UPDATE memories k
+    SET tags = memory_merge_tags(k.tags, d.tags), created_at = least(k.created_at, d.created_at)
+    FROM (
+        SELECT b.keeper,
+               array_agg(t.tag ORDER BY m.id, t.n) FILTER (WHERE t.tag IS NOT NULL) AS tags,
+               min(m.created_at) AS created_at
+        FROM dedup_batch b
+        JOIN memories m ON m.id = b.id
+        LEFT JOIN LATERAL unnest(m.tags) WITH ORDINALITY AS t(tag, n) ON true
+        WHERE b.id <> b.keeper
+        GROUP BY b.keeper
+    ) d
+    WHERE k.id = d.keeper
+""")
+
+DELETE_DUPLICATES = text("""
+    DELETE FROM memories m USING dedup_batch b
+    WHERE m.id = b.id AND b.id <> b.keeper
+    RETURNING b.user_id, b.namespace
+""")
+
+SET_HASHES = text("""
+    UPDATE memories m SET content_hash = b.content_hash
+    FROM dedup_batch b
+    WHERE m.id = b.id AND b.id = b.keeper AND m.content_hash IS NULL
+""")
+
+
+def deduplicate_memories(conn: Connection, batch_size: int = 1000) -> tuple[int, int, set]:
+    """
+    Hash every memory without a content hash and merge duplicates
+
+    Returns how many memories were hashed and merged away, and the
+    (user_id, namespace) pairs that lost memories. Commits after each batch.
+    """
+    from app.crud.memory import content_hash
+
+    hashed = merged = 0
+    changed = set()
+    last_id = 0
+    while True:
+        rows = conn.execute(SELECT_BATCH, {"last_id": last_id, "batch_size": batch_size}).all()
+        if not rows:
+            return hashed, merged, changed
+
+        params = {"ids": [row.id for row in rows], "hashes": [content_hash(row.text) for row in rows]}
+        try:
+            conn.execute(STAGE_BATCH, params)
+            conn.execute(MERGE_INTO_KEEPERS)
+            deleted = conn.execute(DELETE_DUPLICATES).all()
+            hashed += conn.execute(SET_HASHES).rowcount
+            conn.commit()
+        except IntegrityError:
+            # A save added one of the hashes meanwhile; redo the batch
+            conn.rollback()
+            continue
+
+        merged += len(deleted)
+        changed.update(deleted)
+        last_id = rows[-1].id
+
+
+def main() -> None:
+    from app.db.database import engine
+    from app.services.query_cache import query_cache
+    from app.services.redis_client import close_redis
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        hashed, merged, changed = deduplicate_memories(conn, args.batch_size)
+
+    async def invalidate() -> None:
+        for user_id, namespace in changed:
+            await query_cache.invalidate(user_id, [(None, namespace)])
+        await close_redis()
+
+    asyncio.run(invalidate())
+    print(f"✅ Hashed {hashed} memories, merged {merged} duplicates in {len(changed)} namespaces")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Add, fill and inspect memories.embedding, the vector column behind semantic
+search.
+
+The column is a pgvector ``vector(EMBEDDING_DIMENSIONS)`` with an HNSW index
+for cosine distance. The embeddings migration adds it when
+EMBEDDING_DIMENSIONS is set; installs that enable semantic search later, or
+that change the provider or dimensions, use this command. New memories are
+embedded as they are saved, existing ones by backfill:
+
+    python -m app.db.embeddings enable
+    python -m app.db.embeddings backfill [--namespace acme] [--all]
+    python -m app.db.embeddings status
+    python -m app.db.embeddings disable
+"""
+
+import argparse
+import os
+import sys
+from typing import Any, Optional
+from pgvector.sqlalchemy import VECTOR
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Add the app directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+TABLE = "memories"
+INDEX = "idx_memories_embedding"
+
+
+class EmbeddingVector(VECTOR):
+    """pgvector column that hands arrays to asyncpg as they are, for its binary codec."""
+
+    cache_ok = True
+    # $n::VECTOR(d), or multi-row inserts leave the type to inference
+    render_bind_cast = True
+
+    def bind_processor(self, dialect: Any) -> Any:
+        if dialect.driver == "asyncpg":
+            return None
+        return super().bind_processor(dialect)
+
+
+def embedding_dimensions(conn: Connection) -> int:
+    """Dimensions of memories.embedding, 0 if the column doesn't exist."""
+    return conn.execute(
+        text(
+            "SELECT atttypmod FROM pg_attribute "
+            "WHERE attrelid = CAST(:table AS regclass) AND attname = 'embedding' AND NOT attisdropped"
+        ),
+        {"table": TABLE},
+    ).scalar() or 0
+
+
+def enable_embeddings(conn: Connection, dimensions: int) -> None:
+    """Add the embedding column and its HNSW index."""
+    if dimensions < 1:
+        raise ValueError("dimensions must be at least 1")
+    current = embedding_dimensions(conn)
+    if current == dimensions:
+        return
+    if current:
+        # Vectors of another size can't be compared; backfill refills them
+        disable_embeddings(conn)
+
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    conn.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN embedding vector({int(dimensions)})"))
+    # Rows without an embedding are left out of the index
+    conn.execute(text(f"CREATE INDEX {INDEX} ON {TABLE} USING hnsw (embedding vector_cosine_ops)"))
+
+
+def disable_embeddings(conn: Connection) -> None:
+    """Drop the embedding column and its index."""
+    conn.execute(text(f"DROP INDEX IF EXISTS {INDEX}"))
+    conn.execute(text(f"ALTER TABLE {TABLE} DROP COLUMN IF EXISTS embedding"))
+
+
+def backfill_embeddings(
+    conn: Connection,
+    batch_size: int = 1000,
+    namespace: Optional[str] = None,
+    recompute: bool = False,
+) -> int:
+    """
+    Embed memories that have no embedding (every memory with recompute) and
+    return how many were written. Commits after each batch, so an interrupted
+    backfill picks up where it stopped.
+    """
+    from app.services.embeddings import embedding_text, get_embedder
+
+    embedder = get_embedder()
+    conditions = ["id > :last_id"]
+    if not recompute:
+        conditions.append("embedding IS NULL")
+    if namespace:
+        conditions.append("namespace = :namespace")
+    select_batch = text(
+        f"SELECT id, text, tags FROM {TABLE} WHERE {' AND '.join(conditions)} ORDER BY id LIMIT :batch_size"
+    )
+    update_batch = text(
+        f"UPDATE {TABLE} m SET embedding = CAST(v.embedding AS vector) "
+        "FROM unnest(CAST(:ids AS integer[]), CAST(:embeddings AS text[])) AS v(id, embedding) "
+        "WHERE m.id = v.id"
+    )
+
+    written = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select_batch, {"last_id": last_id, "namespace": namespace, "batch_size": batch_size}
+        ).all()
+        if not rows:
+            return written
+
+        vectors = embedder.embed([embedding_text(row.text, row.tags) for row in rows])
+        conn.execute(update_batch, {
+            "ids": [row.id for row in rows],
+            "embeddings": ["[" + ",".join(map(repr, vector.tolist())) + "]" for vector in vectors],
+        })
+        conn.commit()
+
+        written += len(rows)
+        last_id = rows[-1].id
+
+
+def main() -> None:
+    from app.config import settings
+    from app.db.database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("enable", help="add the embedding column and index for EMBEDDING_DIMENSIONS")
+    backfill_parser = commands.add_parser("backfill", help="embed memories that have no embedding yet")
+    backfill_parser.add_argument("--namespace", help="only this namespace")
+    backfill_parser.add_argument("--all", action="store_true", help="re-embed every memory, e.g. after a provider change")
+    backfill_parser.add_argument("--batch-size", type=int, default=1000)
+    commands.add_parser("status", help="show the column size and how many memories are embedded")
+    commands.add_parser("disable", help="drop the embedding column and index")
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        if args.command == "enable":
+            enable_embeddings(conn, settings.embedding_dimensions)
+            conn.commit()
+        elif args.command == "disable":
+            disable_embeddings(conn)
+            conn.commit()
+        elif args.command == "backfill":
+            written = backfill_embeddings(conn, args.batch_size, args.namespace, args.all)
+            print(f"✅ Embedded {written} memories")
+
+        dimensions = embedding_dimensions(conn)
+        if not dimensions:
+            print("✅ memories has no embedding column")
+            return
+        missing = conn.execute(text(f"SELECT count(*) FROM {TABLE} WHERE embedding IS NULL")).scalar_one()
+        print(f"✅ memories.embedding is vector({dimensions}); {missing} memories not embedded yet")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
     String,
     Boolean,
     DateTime,
@@ -8,11 +9,14 @@ from sqlalchemy import (
     ARRAY,
     Text,
     Index,
+    LargeBinary,
 )
 from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
+from app.config import settings
 from app.db.database import Base
+from app.db.embeddings import EmbeddingVector
 
 
 class User(Base):
@@ -33,6 +37,7 @@ class User(Base):
     api_tokens = relationship("ApiToken", back_populates="user")
     usage_logs = relationship("ApiUsage", back_populates="user")
     memories = relationship("Memory", back_populates="user")
+    retention_rules = relationship("RetentionRule", back_populates="user")
 
 
 class ApiToken(Base):
@@ -43,9 +48,11 @@ class ApiToken(Base):
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
     token_name = Column(String(100), nullable=False)
-    token_hash = Column(String(255), nullable=False)
+    token_hash = Column(String(255), nullable=True)  # legacy bcrypt hash
+    token_prefix = Column(String(16), nullable=True, index=True)
+    token_digest = Column(String(64), nullable=True)
     permissions = Column(JSONB, default={})
-    rate_limit_per_hour = Column(Integer, default=5)
+    rate_limit_per_hour = Column(Integer, nullable=True)  # overrides the plan tier
     last_used_at = Column(DateTime(timezone=True))
     expires_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -79,28 +86,108 @@ class ApiUsage(Base):
 class Memory(Base):
     __tablename__ = "memories"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True
     )
     uid = Column(String(255), nullable=False, index=True)
-    namespace = Column(String(255), nullable=False, index=True)
+    # Part of the primary key when the table is partitioned on it
+    namespace = Column(String(255), nullable=False, index=True, primary_key=bool(settings.memory_partitions))
     text = Column(Text, nullable=False)
     tags = Column(ARRAY(String), default=[], nullable=False)
     created_by = Column(String(255), nullable=True)
-    search_vector = Column(TSVECTOR)
+    search_vector = Column(TSVECTOR)  # maintained by the memories_search_vector trigger
+    # Digest of the normalised text (app.crud.memory.content_hash); NULL until
+    # `python -m app.db.dedup` has processed memories saved before it existed
+    content_hash = Column(LargeBinary)
+    # MinHash LSH keys of the text (app.services.near_duplicates); NULL until
+    # `python -m app.db.compaction backfill` has processed older memories
+    lsh_bands = deferred(Column(ARRAY(BigInteger)))
+    # Hidden from reads once passed, deleted by the reaper (app.services.retention)
+    expires_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
+    if settings.embedding_dimensions:
+        # Semantic search vector; deferred so entity loads don't fetch it
+        embedding = deferred(Column(EmbeddingVector(settings.embedding_dimensions)))
 
     # Relationships
     user = relationship("User", back_populates="memories")
 
-    # Indexes for better performance
+    # Indexes for better performance; the tenant indexes match the filters
+    # and ordering of query_memories (checked by scripts/bench/explain_check.py)
     __table_args__ = (
-        Index("idx_uid_namespace", "uid", "namespace"),
+        Index("idx_memories_tenant_created", user_id, uid, namespace, created_at.desc(), id.desc()),
+        Index("idx_memories_tenant_search", user_id, namespace, search_vector, postgresql_using="gin"),
         Index("idx_tags", "tags", postgresql_using="gin"),
-        Index("idx_search_vector", "search_vector", postgresql_using="gin"),
-        Index("idx_created_at", "created_at"),
+        # One memory per content; saves upsert on it
+        Index("idx_memories_content_hash", user_id, uid, namespace, content_hash, unique=True),
+        # Near-duplicate candidates of a save
+        Index("idx_memories_lsh_bands", lsh_bands, postgresql_using="gin"),
+        # Batches of the reaper; most memories never expire
+        Index("idx_memories_expires_at", expires_at, postgresql_where=expires_at.isnot(None)),
+        *(
+            [Index("idx_memories_embedding", "embedding", postgresql_using="hnsw",
+                   postgresql_ops={"embedding": "vector_cosine_ops"})]
+            if settings.embedding_dimensions else []
+        ),
+        {"postgresql_partition_by": "HASH (namespace)"} if settings.memory_partitions else {},
+    )
+
+
+class RetentionRule(Base):
+    __tablename__ = "retention_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    namespace = Column(String(255), nullable=False)
+    # Memories of the namespace older than this are hidden and reaped
+    max_age_days = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+    # Relationships
+    user = relationship("User", back_populates="retention_rules")
+
+    __table_args__ = (
+        Index("idx_retention_rules_user_namespace", user_id, namespace, unique=True),
+    )
+
+
+# Maintained by the memories_stats_* triggers, for lookups that would
+# otherwise count a whole namespace; memories without a user aren't counted
+class NamespaceStats(Base):
+    __tablename__ = "namespace_stats"
+
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    uid = Column(String(255), primary_key=True)
+    namespace = Column(String(255), primary_key=True)
+    memory_count = Column(BigInteger, nullable=False)
+    tag_count = Column(Integer, nullable=False)  # distinct tags
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class TagCount(Base):
+    __tablename__ = "tag_counts"
+
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    uid = Column(String(255), primary_key=True)
+    namespace = Column(String(255), primary_key=True)
+    # Byte order, so prefix matches are a range of the primary key
+    tag = Column(Text(collation="C"), primary_key=True)
+    memory_count = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        # Most used tags of a namespace
+        Index("idx_tag_counts_facets", user_id, uid, namespace, memory_count.desc(), tag),
     )
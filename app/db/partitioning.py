@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Convert the memories table to and from hash partitioning on namespace.
+
+Every tenant query filters on namespace, so with ``PARTITION BY HASH
+(namespace)`` Postgres prunes to a single partition and each GIN index only
+covers the tenants hashed there. Partitioned tables need the partition key in
+every unique index, so the primary key becomes ``(id, namespace)``; ids still
+come from the same sequence.
+
+The conversion copies the table, so run it in a maintenance window. Indexes,
+triggers and foreign keys are recreated from the live definitions, so it
+keeps working as later migrations add more of them. The partitioning
+migration calls it when MEMORY_PARTITIONS is set; installs that are already
+past that revision can run it directly:
+
+    python -m app.db.partitioning partition --partitions 16
+    python -m app.db.partitioning unpartition
+    python -m app.db.partitioning status
+"""
+
+import argparse
+import os
+import sys
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Add the app directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+TABLE = "memories"
+OLD_TABLE = "memories_old"
+
+
+def partition_count(conn: Connection) -> int:
+    """Number of partitions of memories, 0 if it is a plain table."""
+    return conn.execute(
+        text(
+            "SELECT count(i.inhrelid) FROM pg_partitioned_table p "
+            "LEFT JOIN pg_inherits i ON i.inhparent = p.partrelid "
+            "WHERE p.partrelid = CAST(:table AS regclass)"
+        ),
+        {"table": TABLE},
+    ).scalar_one() or 0
+
+
+def partition_memories(conn: Connection, partitions: int) -> None:
+    """Rebuild memories as a table hash partitioned on namespace."""
+    if partitions < 1:
+        raise ValueError("partitions must be at least 1")
+    if partition_count(conn):
+        return
+    _rebuild(conn, partitions)
+
+
+def unpartition_memories(conn: Connection) -> None:
+    """Rebuild memories as a single plain table."""
+    if not partition_count(conn):
+        return
+    _rebuild(conn, None)
+
+
+def _rebuild(conn: Connection, partitions: Optional[int]) -> None:
+    def execute(sql: str, **params):
+        return conn.execute(text(sql), params)
+
+    # Definitions name the table as it is now, which is also the new table's name
+    indexes = execute(
+        "SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE i.indrelid = CAST(:table AS regclass) AND NOT i.indisprimary",
+        table=TABLE,
+    ).all()
+    triggers = execute(
+        "SELECT pg_get_triggerdef(oid) FROM pg_trigger "
+        "WHERE tgrelid = CAST(:table AS regclass) AND NOT tgisinternal AND tgparentid = 0",
+        table=TABLE,
+    ).scalars().all()
+    foreign_keys = execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'",
+        table=TABLE,
+    ).all()
+    sequence = execute("SELECT pg_get_serial_sequence(:table, 'id')", table=TABLE).scalar_one()
+
+    execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+    execute(f"ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT {TABLE}_pkey TO {OLD_TABLE}_pkey")
+    for name, _ in indexes:
+        execute(f'DROP INDEX "{name}"')
+
+    if partitions:
+        execute(
+            f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY HASH (namespace)"
+        )
+        execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, namespace)")
+        for remainder in range(partitions):
+            execute(
+                f"CREATE TABLE {TABLE}_p{remainder} PARTITION OF {TABLE} "
+                f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+            )
+    else:
+        execute(f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)")
+
+    # Load before indexing and before the triggers exist, since search_vector
+    # is already filled in
+    execute(f"INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}")
+    if sequence:
+        execute(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id")
+
+    # Indexes on a partitioned table are created on every partition
+    for _, definition in indexes:
+        execute(definition.replace(" ON ONLY ", " ON "))
+    for name, definition in foreign_keys:
+        execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT "{name}" {definition}')
+    for definition in triggers:
+        execute(definition)
+
+    execute(f"DROP TABLE {OLD_TABLE}")
+    execute(f"ANALYZE {TABLE}")
+
+
+def main() -> None:
+    from app.db.database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    partition_parser = commands.add_parser("partition", help="hash partition memories on namespace")
+    partition_parser.add_argument("--partitions", type=int, required=True)
+    commands.add_parser("unpartition", help="turn memories back into a plain table")
+    commands.add_parser("status", help="show the number of partitions")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        if args.command == "partition":
+            partition_memories(conn, args.partitions)
+        elif args.command == "unpartition":
+            unpartition_memories(conn)
+        count = partition_count(conn)
+
+    print(f"✅ memories has {count} hash partitions" if count else "✅ memories is a plain table")
+
+
+if __name__ == "__main__":
+    main()
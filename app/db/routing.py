@@ -0,0 +1,233 @@
+"""
+Routing of read-only queries to replicas.
+
+Reads go round robin to replicas that are up and within the allowed replay
+lag. A uid/namespace written to in the last few seconds is pinned to the
+primary for reads of it, so clients always see their own writes; the pin is
+a short-lived Redis key shared by all workers. Writes are pinned by
+query_cache.invalidate, before cached queries of the namespace are replaced,
+so a query of the new cache generation never reads a replica that may not
+have replayed the write. When a replica query fails it is retried on the
+primary, and the replica sits out until the next lag check finds it healthy
+again.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+from prometheus_client import Counter, Gauge
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+from app.db.database import AsyncSessionLocal, create_api_engine
+from app.services.redis_client import get_redis, redis_available, mark_redis_down
+
+logger = logging.getLogger(__name__)
+
+PIN_KEY_PREFIX = "ajimemo:rw-pin:"
+LOCAL_PIN_LIMIT = 100000
+
+# Zero on a primary, or on a replica that has replayed everything it received
+REPLICA_LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+READ_ROUTES = Counter(
+    "ajimemo_db_read_routes",
+    "Read-only queries by where they were sent",
+    ["route"],  # replica, primary, pinned, fallback
+)
+REPLICA_LAG = Gauge("ajimemo_db_replica_lag_seconds", "Replay lag of each replica", ["pool"])
+REPLICA_HEALTHY = Gauge("ajimemo_db_replica_healthy", "Whether a replica is taking reads", ["pool"])
+
+T = TypeVar("T")
+
+# Whether the last ReadRouter.run of the current task was answered by a replica
+replica_read: ContextVar[bool] = ContextVar("replica_read", default=False)
+
+_REPLICA_ERRORS = (DBAPIError, PoolTimeoutError, OSError, asyncio.TimeoutError)
+
+
+@dataclass(frozen=True)
+class ReadScope:
+    """
+    Data a read or write covers; no namespace means every namespace of the
+    uid, and no uid (writes only) every uid of the namespace.
+    """
+
+    user_id: int
+    uid: Optional[str]
+    namespace: Optional[str] = None
+
+    def pin_keys(self) -> list[str]:
+        """Keys a write marks: its own namespace and the uid as a whole."""
+        uid = self.uid if self.uid is not None else "*"
+        keys = [f"{self.user_id}:{uid}:*"]
+        if self.namespace is not None:
+            keys.append(f"{self.user_id}:{uid}:{self.namespace}")
+        return keys
+
+    def read_keys(self) -> list[str]:
+        """Keys a read checks: writes by its uid, and by any uid."""
+        namespace = self.namespace if self.namespace is not None else "*"
+        keys = [f"{self.user_id}:*:{namespace}"]
+        if self.uid is not None:
+            keys.append(f"{self.user_id}:{self.uid}:{namespace}")
+        return keys
+
+
+class Replica:
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        self.healthy = False  # until the first lag check
+
+    def set_healthy(self, healthy: bool) -> None:
+        self.healthy = healthy
+        REPLICA_HEALTHY.labels(self.name).set(1 if healthy else 0)
+
+
+class ReadRouter:
+    """Chooses the database for read-only CRUD calls."""
+
+    def __init__(self, replica_urls: list[str], max_lag: float, check_interval: float, pin_seconds: int):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.pin_seconds = pin_seconds
+        self.replicas = [
+            Replica(f"replica-{i}", create_api_engine(url, pool_name=f"replica-{i}"))
+            for i, url in enumerate(replica_urls, 1)
+        ]
+        self._turn = itertools.count()
+        self._pins: OrderedDict[str, float] = OrderedDict()
+
+    async def run(
+        self,
+        scope: ReadScope,
+        fn: Callable[..., Awaitable[T]],
+        *args: Any,
+        **kwargs: Any,
+    ) -> T:
+        """
+        Run ``fn(db, *args, **kwargs)`` on a replica when that is safe.
+
+        ``fn`` must only read; it may run twice if the replica fails. Sets
+        replica_read for the caller.
+        """
+        replica_read.set(False)
+        replica = self._choose()
+        if replica is None:
+            READ_ROUTES.labels("primary").inc()
+        elif await self._is_pinned(scope):
+            READ_ROUTES.labels("pinned").inc()
+        else:
+            try:
+                async with AsyncSessionLocal(bind=replica.engine) as db:
+                    result = await fn(db, *args, **kwargs)
+                READ_ROUTES.labels("replica").inc()
+                replica_read.set(True)
+                return result
+            except _REPLICA_ERRORS as e:
+                logger.warning("Read on %s failed, retrying on primary: %s", replica.name, e)
+                replica.set_healthy(False)
+                READ_ROUTES.labels("fallback").inc()
+
+        async with AsyncSessionLocal() as db:
+            return await fn(db, *args, **kwargs)
+
+    async def pin(self, *scopes: ReadScope) -> None:
+        """Keep reads of scopes on the primary for a while after a write to them."""
+        if not self.replicas or not scopes:
+            return
+
+        keys = list(dict.fromkeys(key for scope in scopes for key in scope.pin_keys()))
+        expires = time.monotonic() + self.pin_seconds
+        for key in keys:
+            self._pins[key] = expires
+            self._pins.move_to_end(key)
+        while len(self._pins) > LOCAL_PIN_LIMIT:
+            self._pins.popitem(last=False)
+
+        if not redis_available():
+            return
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.set(PIN_KEY_PREFIX + key, 1, ex=self.pin_seconds)
+                await pipe.execute()
+        except RedisError:
+            mark_redis_down()
+
+    async def monitor(self) -> None:
+        """Check replica lag periodically, taking replicas in and out of rotation."""
+        while True:
+            for replica in self.replicas:
+                await self._check(replica)
+            await asyncio.sleep(self.check_interval)
+
+    async def close(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def _choose(self) -> Optional[Replica]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+    async def _is_pinned(self, scope: ReadScope) -> bool:
+        keys = scope.read_keys()
+        for key in keys:
+            expires = self._pins.get(key)
+            if expires is not None:
+                if expires > time.monotonic():
+                    return True
+                del self._pins[key]
+
+        # Without Redis, writes made through other workers can't be seen
+        if not redis_available():
+            return True
+        try:
+            return bool(await get_redis().exists(*(PIN_KEY_PREFIX + key for key in keys)))
+        except RedisError:
+            mark_redis_down()
+            return True
+
+    async def _check(self, replica: Replica) -> None:
+        try:
+            async with asyncio.timeout(self.check_interval):
+                async with replica.engine.connect() as conn:
+                    lag = float((await conn.execute(REPLICA_LAG_SQL)).scalar_one())
+        except _REPLICA_ERRORS as e:
+            if replica.healthy:
+                logger.warning("Replica %s is unavailable: %s", replica.name, e)
+            replica.set_healthy(False)
+            return
+
+        REPLICA_LAG.labels(replica.name).set(lag)
+        healthy = lag <= self.max_lag
+        if replica.healthy and not healthy:
+            logger.warning("Replica %s is %.1fs behind, sending reads to primary", replica.name, lag)
+        replica.set_healthy(healthy)
+
+
+read_router = ReadRouter(
+    replica_urls=[url.strip() for url in settings.database_replica_urls.split(",") if url.strip()],
+    max_lag=settings.replica_max_lag,
+    check_interval=settings.replica_check_interval,
+    pin_seconds=settings.replica_pin_seconds,
+)
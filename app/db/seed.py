@@ -12,7 +12,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from app.db.database import SessionLocal  # noqa: E402
 from app.db.models import User, ApiToken  # noqa: E402
-from app.utils.security import hash_password  # noqa: E402
+from app.utils.security import hash_password, api_token_prefix, digest_api_token  # noqa: E402
 from app.config import settings  # noqa: E402
 
 
@@ -50,7 +50,8 @@ def seed_admin_user(db: Session) -> None:
         admin_token = ApiToken(
             user_id=admin_user.id,
             token_name="Admin Token",
-            token_hash=hash_password("admin-token-123"),
+            token_prefix=api_token_prefix("admin-token-123"),
+            token_digest=digest_api_token("admin-token-123"),
             permissions={"all": True},
             rate_limit_per_hour=10000,
             is_active=True,
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Export or import memories as NDJSON from the command line.
+
+    python -m app.db.transfer export --uid bot --namespace acme --gzip -o acme.ndjson.gz
+    python -m app.db.transfer import --user-id 42 -i acme.ndjson.gz
+
+Exports go to stdout unless -o is given; imports read stdin unless -i is
+given. Gzipped input is detected automatically.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from typing import AsyncIterator, BinaryIO
+
+# Add the app directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from app.db.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.services.memory_transfer import MemoryImportError, export_memories, import_memories  # noqa: E402
+
+READ_SIZE = 256 * 1024
+
+
+async def read_chunks(source: BinaryIO) -> AsyncIterator[bytes]:
+    while chunk := await asyncio.to_thread(source.read, READ_SIZE):
+        yield chunk
+
+
+async def export_command(args: argparse.Namespace) -> None:
+    target = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async with AsyncSessionLocal() as db:
+            async for chunk in export_memories(db, args.uid, args.namespace, args.user_id, args.gzip):
+                target.write(chunk)
+    finally:
+        if args.output:
+            target.close()
+
+
+async def import_command(args: argparse.Namespace) -> None:
+    source = open(args.input, "rb") if args.input else sys.stdin.buffer
+    try:
+        async with AsyncSessionLocal() as db:
+            imported = await import_memories(db, read_chunks(source), args.user_id, args.uid, args.namespace)
+        print(f"✅ Imported {imported} memories", file=sys.stderr)
+    except MemoryImportError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if args.input:
+            source.close()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="write memories as NDJSON")
+    export_parser.add_argument("--uid", required=True)
+    export_parser.add_argument("--namespace", help="all namespaces of the uid if omitted")
+    export_parser.add_argument("--user-id", type=int, help="only memories owned by this user")
+    export_parser.add_argument("--gzip", action="store_true")
+    export_parser.add_argument("-o", "--output", help="file to write, stdout if omitted")
+
+    import_parser = commands.add_parser("import", help="load memories from NDJSON")
+    import_parser.add_argument("--user-id", type=int, help="owner of the imported memories")
+    import_parser.add_argument("--uid", help="replace the uid of every memory")
+    import_parser.add_argument("--namespace", help="replace the namespace of every memory")
+    import_parser.add_argument("-i", "--input", help="file to read, stdin if omitted")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "export":
+            await export_command(args)
+        else:
+            await import_command(args)
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
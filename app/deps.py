@@ -1,31 +1,34 @@
 """FastAPI dependencies."""
 
-from typing import Generator
+import json
+from typing import AsyncGenerator
 from datetime import datetime, timezone
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.database import SessionLocal
+from app.config import settings
+from app.db.database import AsyncSessionLocal
 from app.db.models import User, ApiToken
 from app.crud.users import get_user_by_id
-from app.utils.security import verify_token, verify_api_token
+from app.crud.api_tokens import get_token_by_value
+from app.services.last_used import last_used_buffer
+from app.services.rate_limiter import rate_limiter
+from app.services.token_cache import token_cache, snapshot_token, token_from_snapshot
+from app.utils.security import verify_token, digest_api_token
 
 security = HTTPBearer()
 
 
-def get_db() -> Generator[Session, None, None]:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """Get database session."""
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Get current authenticated user."""
     token = credentials.credentials
@@ -46,7 +49,7 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = get_user_by_id(db, user_id=user_id)
+    user = await get_user_by_id(db, user_id=int(user_id))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -69,7 +72,7 @@ def get_current_active_user(current_user: User = Depends(get_current_user)) -> U
     return current_user
 
 
-def validate_api_token(token: str, db: Session) -> ApiToken:
+async def validate_api_token(token: str, db: AsyncSession) -> ApiToken:
     """Validate API token and return the token object."""
     if not token:
         raise HTTPException(
@@ -77,27 +80,143 @@ def validate_api_token(token: str, db: Session) -> ApiToken:
             detail="API token is required"
         )
 
-    # Query all active tokens and verify against hash
-    active_tokens = db.query(ApiToken).filter(
-        ApiToken.is_active.is_(True)
-    ).all()
-
-    for api_token in active_tokens:
-        if verify_api_token(token, api_token.token_hash): # type: ignore
-            # Check if token is expired
-            if api_token.expires_at and api_token.expires_at < datetime.now(timezone.utc): # type: ignore
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="API token has expired"
-                )
-
-            # Update last_used_at
-            api_token.last_used_at = datetime.now(timezone.utc) # type: ignore
-            db.commit()
-
-            return api_token
-
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid API token"
-    )
+    token_digest = digest_api_token(token)
+    hit, snapshot = await token_cache.get(token_digest)
+
+    if hit and snapshot is not None:
+        api_token = token_from_snapshot(snapshot)
+    else:
+        found = None if hit else await get_token_by_value(db, token)
+        if found is None:
+            if not hit:
+                await token_cache.set_missing(token_digest)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid API token"
+            )
+        api_token = found
+        await token_cache.set(token_digest, snapshot_token(api_token))
+
+    # Check if token is expired
+    if api_token.expires_at and api_token.expires_at < datetime.now(timezone.utc): # type: ignore
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API token has expired"
+        )
+
+    # Update last_used_at in the background
+    last_used_buffer.record(api_token.id)  # type: ignore
+
+    return api_token
+
+
+def token_rate_limit(api_token: ApiToken) -> int:
+    """Hourly limit of a token: its own override, else the tier of its user's plan."""
+    if api_token.rate_limit_per_hour is not None:
+        return api_token.rate_limit_per_hour  # type: ignore
+
+    premium_plans = {plan.strip() for plan in settings.rate_limit_premium_plans.split(",")}
+    if api_token.user is not None and api_token.user.plan in premium_plans:
+        return settings.rate_limit_premium_tier
+    return settings.rate_limit_free_tier
+
+
+async def enforce_rate_limit(api_token: ApiToken, response: Response, cost: int = 1) -> None:
+    """Count cost requests against the token's hourly limit."""
+    if not settings.rate_limit_enabled:
+        return
+
+    limit = token_rate_limit(api_token)
+    result = await rate_limiter.hit(f"token:{api_token.id}", limit, cost)  # type: ignore
+
+    if not result.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded" if cost <= limit else f"Batch exceeds the hourly limit of {limit} requests",
+            headers=result.headers(),
+        )
+
+    response.headers.update(result.headers())
+
+
+async def authenticate_api_token(
+    request: Request,
+    token: str = Query(..., description="API token"),
+    db: AsyncSession = Depends(get_db)
+) -> ApiToken:
+    """Authenticate an AI request by its token, leaving rate limiting to the endpoint."""
+    api_token = await validate_api_token(token, db)
+    request.state.api_token = api_token
+    return api_token
+
+
+async def get_api_token(
+    response: Response,
+    api_token: ApiToken = Depends(authenticate_api_token)
+) -> ApiToken:
+    """Authenticate an AI request by its token and apply the token's rate limit."""
+    await enforce_rate_limit(api_token, response)
+    return api_token
+
+
+async def read_memory_batch(request: Request) -> list:
+    """
+    Read the items of a batch save from a JSON array or NDJSON body.
+
+    Items are returned unvalidated so each can fail on its own.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None:
+        try:
+            declared = int(content_length)
+        except ValueError:
+            declared = -1
+        if declared < 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid Content-Length"
+            )
+        if declared > settings.memory_batch_max_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Batch body exceeds {settings.memory_batch_max_bytes} bytes"
+            )
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > settings.memory_batch_max_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Batch body exceeds {settings.memory_batch_max_bytes} bytes"
+            )
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        if content_type in ("application/x-ndjson", "application/jsonl"):
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batch body must be a JSON array or NDJSON"
+        )
+
+    if not isinstance(items, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batch body must be a JSON array or NDJSON"
+        )
+    if not items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batch is empty"
+        )
+    if len(items) > settings.memory_batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {settings.memory_batch_max_items} items"
+        )
+
+    return items
@@ -0,0 +1,21 @@
+"""
+Background jobs: work a request hands off so it can respond without
+waiting for it.
+
+Job types are async functions registered with ``@job`` (app.jobs.tasks) and
+queued by name with ``await enqueue("name", **kwargs)``; arguments must be
+JSON-serialisable. Each type runs at most its concurrency limit of jobs at
+once per worker, and failed jobs are retried with exponential backoff until
+``jobs_max_attempts``.
+
+With ``JOBS_BACKEND=redis`` jobs go to Redis and are run by
+``python -m app.jobs.worker``, alongside gunicorn. With ``local``, the
+default, and whenever Redis is unavailable, they run in the process that
+queued them, after the response; jobs still queued when it shuts down are
+lost.
+"""
+
+from app.jobs.queue import enqueue
+from app.jobs.registry import job
+
+__all__ = ["enqueue", "job"]
@@ -0,0 +1,171 @@
+"""
+Job queues: Redis, shared by the app and ``python -m app.jobs.worker``
+processes, and an in-process one for single-node setups and tests.
+
+Jobs are delivered at least once: a job a worker dies running is run again,
+so jobs must be safe to repeat.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional
+
+import orjson
+from prometheus_client import Counter
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.services.redis_client import get_redis, redis_available, mark_redis_down
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "ajimemo:jobs:"
+DEAD_LETTER_LIMIT = 1000
+PROMOTE_BATCH_SIZE = 100
+
+# Moves due retries from a type's delayed set to its ready list in one step,
+# and returns when the next one is due
+PROMOTE_DUE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('LPUSH', KEYS[2], job)
+end
+local next = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return next[2]
+"""
+
+JOBS_ENQUEUED = Counter(
+    "ajimemo_jobs_enqueued",
+    "Background jobs queued, by type and queue",
+    ["type", "backend"],  # local, redis
+)
+
+
+def encode_job(job_type: str, kwargs: Dict[str, Any], attempt: int = 1) -> bytes:
+    """A job as stored in a queue; the id keeps identical jobs apart."""
+    return orjson.dumps({"id": uuid.uuid4().hex, "type": job_type, "kwargs": kwargs, "attempt": attempt})
+
+
+class RedisJobQueue:
+    """
+    A ready list per job type. A worker moves each job it takes to its own
+    processing list until the job is done, so the jobs of a worker that dies
+    are put back when it restarts under the same name. Retries wait in a
+    sorted set per type, scored by when they are due.
+    """
+
+    def __init__(self, redis: Redis, worker_name: str = ""):
+        self.redis = redis
+        self.worker_name = worker_name
+        self._promote_due = redis.register_script(PROMOTE_DUE)
+
+    def _ready(self, job_type: str) -> str:
+        return f"{REDIS_KEY_PREFIX}{job_type}"
+
+    def _delayed(self, job_type: str) -> str:
+        return f"{REDIS_KEY_PREFIX}{job_type}:delayed"
+
+    def _processing(self, job_type: str) -> str:
+        return f"{REDIS_KEY_PREFIX}{job_type}:processing:{self.worker_name}"
+
+    async def push(self, job_type: str, payload: bytes, delay: float = 0.0) -> None:
+        """Queue a job, to be run after delay seconds."""
+        if delay > 0:
+            await self.redis.zadd(self._delayed(job_type), {payload: time.time() + delay})
+        else:
+            await self.redis.lpush(self._ready(job_type), payload)
+
+    async def pop(self, job_type: str, timeout: float) -> Optional[bytes]:
+        """Take the oldest ready job, waiting up to timeout seconds for one."""
+        now = time.time()
+        next_due = await self._promote_due(
+            keys=[self._delayed(job_type), self._ready(job_type)], args=[now, PROMOTE_BATCH_SIZE]
+        )
+        if next_due is not None:
+            # Wake up for the next retry; Redis takes 0 as wait forever
+            timeout = max(min(timeout, float(next_due) - now), 0.01)
+        return await self.redis.blmove(self._ready(job_type), self._processing(job_type), timeout, "RIGHT", "LEFT")
+
+    async def ack(self, job_type: str, payload: bytes) -> None:
+        """Forget a job that is done, or has been queued again as a retry."""
+        await self.redis.lrem(self._processing(job_type), 1, payload)
+
+    async def dead(self, job_type: str, payload: bytes) -> None:
+        """Keep a job that ran out of attempts, for inspection; the oldest are dropped."""
+        key = f"{REDIS_KEY_PREFIX}dead"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lpush(key, payload)
+            pipe.ltrim(key, 0, DEAD_LETTER_LIMIT - 1)
+            await pipe.execute()
+
+    async def recover(self, job_types: Iterable[str]) -> int:
+        """Put back the jobs this worker was running when it last stopped, and return how many."""
+        recovered = 0
+        for job_type in job_types:
+            while await self.redis.lmove(self._processing(job_type), self._ready(job_type), "LEFT", "RIGHT"):
+                recovered += 1
+        return recovered
+
+
+class LocalJobQueue:
+    """Jobs run by the process that queued them; they don't survive it."""
+
+    def __init__(self) -> None:
+        self._ready: Dict[str, asyncio.Queue] = defaultdict(asyncio.Queue)
+
+    async def push(self, job_type: str, payload: bytes, delay: float = 0.0) -> None:
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready[job_type].put_nowait, payload)
+        else:
+            self._ready[job_type].put_nowait(payload)
+
+    async def pop(self, job_type: str, timeout: float) -> Optional[bytes]:
+        try:
+            return await asyncio.wait_for(self._ready[job_type].get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def ack(self, job_type: str, payload: bytes) -> None:
+        pass
+
+    async def dead(self, job_type: str, payload: bytes) -> None:
+        logger.error("Dropped job after its last attempt: %s", payload.decode())
+
+    def pending(self) -> int:
+        """Jobs waiting to run, not counting retries that aren't due yet."""
+        return sum(queue.qsize() for queue in self._ready.values())
+
+    def clear(self) -> int:
+        """Drop every waiting job and return how many there were."""
+        # The queues are bound to the loop they were awaited on, so none is kept
+        dropped = self.pending()
+        self._ready.clear()
+        return dropped
+
+
+local_queue = LocalJobQueue()
+
+
+async def enqueue(job_type: str, **kwargs: Any) -> None:
+    """
+    Queue a job of a registered type. It goes to Redis with
+    JOBS_BACKEND=redis, unless Redis is unavailable, and is otherwise run in
+    this process.
+    """
+    payload = encode_job(job_type, kwargs)
+    if settings.jobs_backend == "redis" and redis_available():
+        try:
+            await RedisJobQueue(get_redis()).push(job_type, payload)
+            JOBS_ENQUEUED.labels(job_type, "redis").inc()
+            return
+        except RedisError as e:
+            logger.warning("Failed to queue job %s in Redis, running it here: %s", job_type, e)
+            mark_redis_down()
+
+    await local_queue.push(job_type, payload)
+    JOBS_ENQUEUED.labels(job_type, "local").inc()
@@ -0,0 +1,47 @@
+"""Job types by name, registered with the @job decorator."""
+
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+
+
+@dataclass(frozen=True)
+class JobType:
+    name: str
+    run: Callable[..., Awaitable[None]]
+    concurrency: int  # jobs of this type running at once, per worker
+    max_attempts: int
+
+
+JOB_TYPES: Dict[str, JobType] = {}
+
+
+def concurrency_overrides() -> Dict[str, int]:
+    """JOBS_CONCURRENCY, e.g. ``index_memories=4,other=1``, as a dict."""
+    overrides = {}
+    for item in settings.jobs_concurrency.split(","):
+        name, _, limit = item.partition("=")
+        if name.strip() and limit.strip():
+            overrides[name.strip()] = int(limit)
+    return overrides
+
+
+def job(
+    name: Optional[str] = None,
+    concurrency: int = 1,
+    max_attempts: Optional[int] = None,
+) -> Callable[[Callable[..., Awaitable[None]]], Callable[..., Awaitable[None]]]:
+    """Register an async function as a job type, named after it unless name is given."""
+
+    def register(run: Callable[..., Awaitable[None]]) -> Callable[..., Awaitable[None]]:
+        job_name = name or run.__name__
+        JOB_TYPES[job_name] = JobType(
+            name=job_name,
+            run=run,
+            concurrency=concurrency_overrides().get(job_name, concurrency),
+            max_attempts=max_attempts or settings.jobs_max_attempts,
+        )
+        return run
+
+    return register
@@ -0,0 +1,18 @@
+"""Background job types; see app.jobs."""
+
+from typing import List, Optional
+
+from app.crud import memory as crud_memory
+from app.db.database import AsyncSessionLocal
+from app.jobs.registry import job
+from app.services.query_cache import query_cache
+
+
+@job(concurrency=2)
+async def index_memories(user_id: Optional[int], namespace: str, ids: List[int]) -> None:
+    """Compute the LSH keys and embeddings that saves left out (memory_indexing_deferred)."""
+    async with AsyncSessionLocal() as db:
+        indexed = await crud_memory.index_memories(db, namespace, ids)
+    if indexed:
+        # Semantic queries cached before now are missing these memories
+        await query_cache.invalidate(user_id, [(None, namespace)])
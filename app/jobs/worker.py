@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Runs background jobs from Redis, alongside gunicorn:
+
+    python -m app.jobs.worker [--name worker-1] [--types index_memories ...]
+
+Every worker needs a name of its own that stays the same across restarts,
+the host name by default: jobs it was running when it stopped are put back
+in the queue when it starts again. Any number of workers can share a queue.
+SIGTERM lets running jobs finish for up to JOBS_SHUTDOWN_TIMEOUT seconds.
+
+The app runs the same worker on its in-process queue (``local_worker``).
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+from typing import Iterable, List, Optional, Set, Union
+
+import orjson
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+
+# Add the app directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from app.config import settings  # noqa: E402
+from app.jobs.queue import LocalJobQueue, RedisJobQueue, local_queue  # noqa: E402
+from app.jobs.registry import JOB_TYPES, JobType  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 1.0  # seconds a consumer waits for a job before checking whether to stop
+
+JOBS_RUN = Counter(
+    "ajimemo_jobs",
+    "Background job runs by type and outcome",
+    ["type", "result"],  # done, retried, failed
+)
+
+
+def retry_delay(attempt: int) -> float:
+    """Seconds before retrying a job that failed its attempt-th run: exponential, capped, jittered."""
+    delay = min(settings.jobs_retry_base * 2 ** (attempt - 1), settings.jobs_retry_max)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class JobWorker:
+    """Runs jobs of each type from a queue, at most the type's concurrency at once."""
+
+    def __init__(self, queue: Union[RedisJobQueue, LocalJobQueue], job_types: Optional[Iterable[str]] = None):
+        self.queue = queue
+        self.job_types = job_types
+        self._consumers: List[asyncio.Task] = []
+        self._running: Set[asyncio.Task] = set()
+        self._closing = False
+
+    def start(self) -> None:
+        """Start consuming every registered job type, or the ones given."""
+        import app.jobs.tasks  # noqa: F401  registers the job types
+
+        self._closing = False
+        for name in self.job_types or list(JOB_TYPES):
+            self._consumers.append(asyncio.create_task(self._consume(JOB_TYPES[name])))
+
+    async def stop(self, timeout: float) -> None:
+        """Stop taking jobs and give the running ones up to timeout seconds to finish."""
+        self._closing = True
+        await asyncio.gather(*self._consumers)
+        self._consumers = []
+        if self._running:
+            _, unfinished = await asyncio.wait(self._running, timeout=timeout)
+            for task in unfinished:
+                task.cancel()
+            if unfinished:
+                logger.warning("Cancelled %d background jobs still running at shutdown", len(unfinished))
+        if isinstance(self.queue, LocalJobQueue):
+            dropped = self.queue.clear()
+            if dropped:
+                logger.warning("Dropped %d queued background jobs at shutdown", dropped)
+
+    async def _consume(self, job_type: JobType) -> None:
+        slots = asyncio.Semaphore(job_type.concurrency)
+        while not self._closing:
+            await slots.acquire()
+            try:
+                payload = await self.queue.pop(job_type.name, POLL_TIMEOUT)
+            except RedisError as e:
+                logger.warning("Failed to take a %s job: %s", job_type.name, e)
+                payload = None
+                await asyncio.sleep(settings.redis_retry_after)
+            if payload is None:
+                slots.release()
+                continue
+
+            task = asyncio.create_task(self._run(job_type, payload))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _run(self, job_type: JobType, payload: bytes) -> None:
+        job = orjson.loads(payload)
+        try:
+            await job_type.run(**job["kwargs"])
+            JOBS_RUN.labels(job_type.name, "done").inc()
+        except Exception as e:
+            attempt = job["attempt"]
+            try:
+                if attempt < job_type.max_attempts:
+                    delay = retry_delay(attempt)
+                    logger.warning("Job %s %s failed, retrying in %.1f s: %s", job_type.name, job["id"], delay, e)
+                    retry = orjson.dumps({**job, "attempt": attempt + 1})
+                    await self.queue.push(job_type.name, retry, delay)
+                    JOBS_RUN.labels(job_type.name, "retried").inc()
+                else:
+                    logger.error("Job %s %s failed after %d attempts: %s", job_type.name, job["id"], attempt, e)
+                    await self.queue.dead(job_type.name, payload)
+                    JOBS_RUN.labels(job_type.name, "failed").inc()
+            except RedisError as e:
+                # Still in the processing list, so it runs again after a restart
+                logger.warning("Failed to queue a retry of job %s %s: %s", job_type.name, job["id"], e)
+                return
+
+        try:
+            await self.queue.ack(job_type.name, payload)
+        except RedisError as e:
+            logger.warning("Failed to acknowledge job %s %s: %s", job_type.name, job["id"], e)
+
+
+local_worker = JobWorker(local_queue)
+
+
+async def run(name: str, job_types: Optional[List[str]]) -> None:
+    from redis.asyncio import Redis
+
+    from app.db.database import async_engine
+    from app.services.redis_client import close_redis
+
+    # Its own connection, as the shared one times out before a blocking pop returns
+    redis = Redis.from_url(settings.redis_url, socket_timeout=POLL_TIMEOUT + settings.redis_socket_timeout + 5)
+    queue = RedisJobQueue(redis, name)
+    recovered = await queue.recover(job_types or list(JOB_TYPES))
+    worker = JobWorker(queue, job_types)
+    worker.start()
+    logger.info("Worker %s started, %d interrupted jobs queued again", name, recovered)
+
+    stopping = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        asyncio.get_running_loop().add_signal_handler(signum, stopping.set)
+    await stopping.wait()
+
+    await worker.stop(settings.jobs_shutdown_timeout)
+    await redis.aclose()
+    await close_redis()
+    await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--name", default=socket.gethostname(), help="unique and stable across restarts")
+    parser.add_argument("--types", nargs="+", help="only these job types")
+    args = parser.parse_args()
+
+    import app.jobs.tasks  # noqa: F401  registers the job types
+
+    unknown = set(args.types or ()) - set(JOB_TYPES)
+    if unknown:
+        parser.error(f"unknown job types: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(run(args.name, args.types))
+
+
+if __name__ == "__main__":
+    main()
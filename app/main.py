@@ -1,12 +1,54 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from prometheus_client import make_asgi_app
+from app.api.middleware.usage import UsageMiddleware
 from app.api.v1.router import api_router
 from app.config import settings
+from app.db.database import async_engine
+from app.db.routing import read_router
+from app.jobs.worker import local_worker
+from app.services.idempotency import IdempotencyKeyError
+from app.services.last_used import last_used_buffer
+from app.services.query_cache import query_cache
+from app.services.redis_client import close_redis
+from app.services.retention import memory_reaper
+from app.services.token_cache import token_cache
+from app.services.usage import usage_recorder
+from app.utils.security import HashingOverloadedError
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    revocation_listener = asyncio.create_task(token_cache.listen())
+    invalidation_listener = asyncio.create_task(query_cache.listen())
+    invalidation_repair = asyncio.create_task(query_cache.repair())
+    last_used_buffer.start()
+    usage_recorder.start()
+    memory_reaper.start()
+    local_worker.start()
+    replica_monitor = asyncio.create_task(read_router.monitor())
+    yield
+    revocation_listener.cancel()
+    invalidation_listener.cancel()
+    invalidation_repair.cancel()
+    replica_monitor.cancel()
+    await last_used_buffer.stop()
+    await usage_recorder.stop()
+    await memory_reaper.stop()
+    await local_worker.stop(settings.jobs_shutdown_timeout)
+    await close_redis()
+    await read_router.close()
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="AjiMemo API",
     description="Universal GET available memory for Ai",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -18,7 +60,24 @@ app.add_middleware(
     allow_headers=settings.cors_allow_headers.split(",") if settings.cors_allow_headers != "*" else ["*"],
 )
 
+if settings.usage_logging_enabled:
+    app.add_middleware(UsageMiddleware)
+
 app.include_router(api_router, prefix="/api/v1")
+app.mount("/metrics", make_asgi_app())
+
+
+@app.exception_handler(HashingOverloadedError)
+async def hashing_overloaded_handler(request: Request, exc: HashingOverloadedError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(IdempotencyKeyError)
+async def idempotency_key_handler(request: Request, exc: IdempotencyKeyError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)})
 
 @app.get("/")
 async def root():
@@ -21,7 +21,7 @@ class AITokenData(BaseModel):
     token_name: str
     user_id: int
     permissions: Dict[str, Any]
-    rate_limit_per_hour: int
+    rate_limit_per_hour: int  # effective limit, the override or the plan tier
     expires_at: Optional[datetime]
     last_used_at: Optional[datetime]
     is_active: bool
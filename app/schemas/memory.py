@@ -1,25 +1,45 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import Any, List, Literal, Optional, Tuple
 from datetime import datetime
 
 from app.schemas.base import ApiResponse
 
 
 class MemoryCreateRequest(BaseModel):
-    uid: str = Field(..., description="User or session identifier")
-    namespace: str = Field(..., description="Memory namespace")
+    uid: str = Field(..., description="User or session identifier", max_length=255)
+    namespace: str = Field(..., description="Memory namespace", max_length=255)
     text: str = Field(..., description="Memory text content")
     tags: List[str] = Field(default_factory=list, description="List of tags")
     created_by: Optional[str] = Field(None, description="Who created this memory")
+    ttl: Optional[int] = Field(None, description="Seconds until the memory expires", ge=1)
+
+
+# What a save does when the uid has a memory alike in the namespace
+NearDuplicateAction = Literal["keep", "merge", "reject"]
 
 
 class MemoryQueryRequest(BaseModel):
     uid: str = Field(..., description="User or session identifier")
-    namespace: Optional[str] = Field(None, description="Memory namespace filter")
+    namespace: Optional[str] = Field(None, description="Memory namespace filter (defaults to uid)")
     tags: List[str] = Field(default_factory=list, description="List of tags to filter by")
     query: Optional[str] = Field(None, description="Full-text search query")
+    search_mode: Literal["plain", "websearch", "prefix"] = Field(
+        "plain", description="How query is parsed: plain words, web search syntax, or word prefixes"
+    )
+    retrieval: Literal["keyword", "semantic", "hybrid"] = Field(
+        "keyword", description="Search by full text, by embedding similarity, or both fused"
+    )
+    within_days: Optional[int] = Field(None, description="Only memories created in the last this many days", ge=1)
     limit: int = Field(10, description="Maximum number of results", ge=1, le=100)
     offset: int = Field(0, description="Offset for pagination", ge=0)
+    cursor: Optional[str] = Field(None, description="next_cursor of the previous page; takes precedence over offset")
+
+    @model_validator(mode="after")
+    def default_namespace(self) -> "MemoryQueryRequest":
+        # Queries always target one namespace, so partitions can be pruned
+        if not self.namespace:
+            self.namespace = self.uid
+        return self
 
 
 class MemoryData(BaseModel):
@@ -31,6 +51,7 @@ class MemoryData(BaseModel):
     created_by: Optional[str]
     created_at: datetime
     updated_at: datetime
+    expires_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -40,5 +61,122 @@ class MemoryResponse(ApiResponse):
     data: MemoryData
 
 
+class MemorySearchInfo(BaseModel):
+    candidate_cap: Optional[int]  # None when every match is ranked
+    candidates: int  # matches ranked for this query, at most candidate_cap
+    truncated: bool  # matches beyond the cap were not ranked
+
+
 class MemoryListResponse(ApiResponse):
     data: List[MemoryData]
+    next_cursor: Optional[str] = None
+    search: Optional[MemorySearchInfo] = None
+
+
+class MemoryBatchItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class MemoryBatchResult(BaseModel):
+    saved: int
+    failed: int
+    items: List[MemoryBatchItemResult]
+
+
+class MemoryBatchResponse(ApiResponse):
+    data: MemoryBatchResult
+
+
+class RetentionRuleRequest(BaseModel):
+    namespace: str = Field(..., description="Namespace the rule applies to", max_length=255)
+    max_age_days: int = Field(..., description="Memories older than this many days are deleted", ge=1)
+
+
+class RetentionRuleData(BaseModel):
+    namespace: str
+    max_age_days: int
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class RetentionRuleResponse(ApiResponse):
+    data: RetentionRuleData
+
+
+class RetentionRuleListResponse(ApiResponse):
+    data: List[RetentionRuleData]
+
+
+class NamespaceStatsData(BaseModel):
+    uid: str
+    namespace: str
+    memory_count: int
+    tag_count: int
+    updated_at: Optional[datetime] = None  # None if the namespace never had memories
+
+    class Config:
+        from_attributes = True
+
+
+class NamespaceStatsResponse(ApiResponse):
+    data: NamespaceStatsData
+
+
+class TagCountData(BaseModel):
+    tag: str
+    memory_count: int
+
+    class Config:
+        from_attributes = True
+
+
+class TagCountListResponse(ApiResponse):
+    data: List[TagCountData]
+
+
+class MemoryImportResult(BaseModel):
+    imported: int
+
+
+class MemoryImportResponse(ApiResponse):
+    data: MemoryImportResult
+
+
+def parse_batch_items(
+    raw_items: List[Any],
+    **overrides: Any
+) -> Tuple[List[MemoryCreateRequest], List[int], List[MemoryBatchItemResult]]:
+    """
+    Validate the items of a batch save one by one.
+
+    Returns the valid items, their positions in the batch, and an error result
+    for each invalid one. overrides are applied to every item before
+    validation.
+    """
+    valid: List[MemoryCreateRequest] = []
+    positions: List[int] = []
+    errors: List[MemoryBatchItemResult] = []
+
+    for index, raw in enumerate(raw_items):
+        if not isinstance(raw, dict):
+            errors.append(MemoryBatchItemResult(index=index, error="Item must be an object"))
+            continue
+        try:
+            valid.append(MemoryCreateRequest(**{**raw, **overrides}))
+            positions.append(index)
+        except ValidationError as e:
+            errors.append(MemoryBatchItemResult(index=index, error=validation_error_message(e)))
+
+    return valid, positions, errors
+
+
+def validation_error_message(error: ValidationError) -> str:
+    """One-line summary of a validation error, e.g. ``text: Field required``."""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors()
+    )
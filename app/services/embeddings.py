@@ -0,0 +1,98 @@
+"""
+Text embeddings for semantic memory search.
+
+The default provider runs locally and offline: word and character n-gram
+counts hashed into signed buckets (the hashing trick, a sparse random
+projection of the n-gram space) and L2-normalised, so cosine similarity
+rewards shared words, stems and spellings. It has no notion of synonyms; a
+model-backed provider can be plugged in with EMBEDDING_PROVIDER set to
+``module:factory``, a callable taking the dimensions and returning an
+object with ``dimensions`` and ``embed(texts)``.
+
+Vectors are stored in memories.embedding, so changing the provider or the
+dimensions means re-running ``python -m app.db.embeddings backfill --all``.
+"""
+
+import importlib
+import re
+import zlib
+from functools import lru_cache
+from typing import List, Protocol, Sequence
+
+import numpy as np
+
+from app.config import settings
+
+WORD_RE = re.compile(r"\w+")
+
+
+class SemanticSearchDisabledError(RuntimeError):
+    """Semantic search was requested but EMBEDDING_DIMENSIONS is 0."""
+
+
+class EmbeddingProvider(Protocol):
+    dimensions: int
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """One L2-normalised float32 row per text."""
+        ...
+
+
+class HashingEmbedder:
+    """Hashed word and character n-gram features, deterministic across processes."""
+
+    def __init__(self, dimensions: int, ngram_sizes: Sequence[int] = (3, 4, 5)):
+        self.dimensions = dimensions
+        self.ngram_sizes = tuple(ngram_sizes)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets, signs = self._hash(self._features(text))
+            vectors[row] = np.bincount(buckets, weights=signs, minlength=self.dimensions)
+        # Dampen repeated features, then normalise so dot product is cosine
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        for word in WORD_RE.findall(text.lower()):
+            features.append(word)
+            padded = f"<{word}>"
+            for n in self.ngram_sizes:
+                features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def _hash(self, features: List[str]) -> tuple[np.ndarray, np.ndarray]:
+        # crc32 rather than hash(), which is salted per process
+        hashes = np.fromiter((zlib.crc32(f.encode()) for f in features), dtype=np.uint32, count=len(features))
+        buckets = (hashes >> 1) % self.dimensions
+        signs = np.where(hashes & 1, 1.0, -1.0)
+        return buckets.astype(np.intp), signs
+
+
+@lru_cache
+def get_embedder() -> EmbeddingProvider:
+    """The configured provider; semantic search must be enabled."""
+    if not settings.embedding_dimensions:
+        raise SemanticSearchDisabledError("Semantic search is not enabled")
+
+    if settings.embedding_provider == "hashing":
+        return HashingEmbedder(settings.embedding_dimensions)
+
+    module_name, _, attribute = settings.embedding_provider.partition(":")
+    factory = getattr(importlib.import_module(module_name), attribute)
+    provider = factory(settings.embedding_dimensions)
+    if provider.dimensions != settings.embedding_dimensions:
+        raise RuntimeError(
+            f"{settings.embedding_provider} makes {provider.dimensions}-dimensional vectors, "
+            f"EMBEDDING_DIMENSIONS is {settings.embedding_dimensions}"
+        )
+    return provider
+
+
+def embedding_text(text: str, tags: Sequence[str]) -> str:
+    """What is embedded for a memory: its text and tags, like search_vector."""
+    return " ".join([text, *tags])
@@ -0,0 +1,93 @@
+"""
+Idempotency keys for memory saves.
+
+A client can send a key of its choosing with a save; retries with the same
+key get the response of the first request back, marked with an
+Idempotent-Replayed header, instead of saving again. Responses are kept in
+Redis, per user, for ``idempotency_ttl`` seconds. While the first request is
+still running its key is claimed, and a retry is turned away rather than run
+twice. A key reused for a different request is an error.
+
+Without Redis requests run as if they had no key; content hashes still keep
+repeated saves from being stored twice.
+"""
+
+import hashlib
+import logging
+from typing import Awaitable, Callable, Optional
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.services.redis_client import get_redis, redis_available, mark_redis_down
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "ajimemo:idempotency:"
+PENDING = b"-"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyKeyError(Exception):
+    """An idempotency key that can't be used for this request."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def run_idempotent(
+    user_id: int,
+    key: Optional[str],
+    fingerprint: bytes,
+    run: Callable[[], Awaitable[bytes]],
+) -> tuple[bytes, bool]:
+    """
+    Run a request once per idempotency key
+
+    fingerprint identifies the request, so a key reused for a different one
+    is caught. Returns the response body and whether it was replayed.
+    """
+    if not key or not redis_available():
+        return await run(), False
+
+    redis_key = f"{REDIS_KEY_PREFIX}{user_id}:{hashlib.sha256(key.encode()).hexdigest()}"
+    digest = hashlib.sha256(fingerprint).hexdigest().encode()
+    try:
+        redis = get_redis()
+        claimed = await redis.set(redis_key, PENDING, nx=True, ex=settings.idempotency_pending_ttl)
+        stored = None if claimed else await redis.get(redis_key)
+    except RedisError:
+        mark_redis_down()
+        return await run(), False
+
+    if not claimed:
+        if stored == PENDING:
+            raise IdempotencyKeyError("A request with this idempotency key is still in progress", 409)
+        if stored is not None:
+            stored_digest, _, body = stored.partition(b"\n")
+            if stored_digest != digest:
+                raise IdempotencyKeyError("This idempotency key was used for a different request", 422)
+            return body, True
+        # Expired since the SET; nothing to replay or guard
+        return await run(), False
+
+    try:
+        body = await run()
+    except BaseException:
+        await _release(redis_key)
+        raise
+
+    try:
+        await redis.set(redis_key, digest + b"\n" + body, ex=settings.idempotency_ttl)
+    except RedisError as e:
+        mark_redis_down()
+        logger.warning("Failed to store idempotent response: %s", e)
+    return body, False
+
+
+async def _release(redis_key: str) -> None:
+    # A failed request can be retried with the same key
+    try:
+        await get_redis().delete(redis_key)
+    except RedisError:
+        mark_redis_down()
@@ -0,0 +1,84 @@
+"""
+Write-behind buffer for ApiToken.last_used_at.
+
+Validation only records the time in memory. A background task flushes the
+buffer on an interval as one set-based UPDATE, keeping the newest timestamp
+per token, so authenticated reads never open a write transaction.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.config import settings
+from app.db.database import AsyncSessionLocal
+from app.crud.api_tokens import bulk_touch_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class LastUsedBuffer:
+    """Coalesces last_used_at updates per token and flushes them in batches."""
+
+    def __init__(self, flush_interval: float, max_pending: int):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def record(self, token_id: int, used_at: Optional[datetime] = None) -> None:
+        """Record that a token was used."""
+        used_at = used_at or datetime.now(timezone.utc)
+        previous = self._pending.get(token_id)
+        if previous is None or previous < used_at:
+            self._pending[token_id] = used_at
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        """Start the background flusher."""
+        self._closing = False
+        # Bound to the loop it is first awaited on, so one per run
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flusher and write everything still pending."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write all pending timestamps to the database."""
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        try:
+            async with AsyncSessionLocal() as db:
+                await bulk_touch_tokens(db, batch)
+        except Exception as e:
+            logger.warning("Failed to flush last_used_at for %d tokens: %s", len(batch), e)
+            for token_id, used_at in batch.items():
+                self.record(token_id, used_at)
+
+
+last_used_buffer = LastUsedBuffer(
+    flush_interval=settings.token_last_used_flush_interval,
+    max_pending=settings.token_last_used_max_pending,
+)
@@ -0,0 +1,255 @@
+"""
+Streaming export and import of memories as NDJSON.
+
+Exports read through a server-side cursor, ``memory_transfer_batch_size``
+rows at a time, and emit one chunk per batch, optionally gzip-compressed, so
+memory use doesn't grow with the namespace. Imports parse the input as it
+arrives (gzip is detected from the first bytes) and COPY it in chunks of the
+same size, committing each one; when a line is rejected the chunks before it
+stay imported and the error says how many rows that was.
+"""
+
+import json
+import re
+import zlib
+from datetime import datetime, timezone
+from typing import Any, AsyncIterable, AsyncIterator, Iterator, Optional
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.crud.memory import copy_memories, live_filters
+from app.db.database import AsyncSessionLocal
+from app.db.models import Memory
+from app.schemas.memory import MemoryCreateRequest, validation_error_message
+from app.services.query_cache import query_cache
+
+GZIP_MAGIC = b"\x1f\x8b"
+MAX_LINE_BYTES = 16 * 1024 * 1024
+INFLATE_STEP = 1024 * 1024  # bytes decompressed at a time
+
+EXPORT_COLUMNS = (
+    Memory.uid,
+    Memory.namespace,
+    Memory.text,
+    Memory.tags,
+    Memory.created_by,
+    Memory.created_at,
+    Memory.updated_at,
+    Memory.expires_at,
+)
+
+
+class MemoryImportError(ValueError):
+    """An import line was rejected; ``imported`` rows were committed before it."""
+
+    def __init__(self, message: str, imported: int):
+        super().__init__(f"{message} ({imported} memories imported before the error)")
+        self.imported = imported
+
+
+class _StreamError(Exception):
+    """The input as a whole can't be read."""
+
+
+async def export_memories(
+    db: AsyncSession,
+    uid: str,
+    namespace: Optional[str] = None,
+    user_id: Optional[int] = None,
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """Stream the memories of a uid, optionally one namespace, as NDJSON."""
+    query = select(*EXPORT_COLUMNS).where(Memory.uid == uid)
+
+    if namespace:
+        query = query.where(Memory.namespace == namespace)
+
+    if user_id:
+        query = query.where(Memory.user_id == user_id)
+
+    query = query.where(*live_filters(user_id, namespace)).order_by(Memory.id).execution_options(yield_per=settings.memory_transfer_batch_size)
+
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    result = await db.stream(query)
+    async for rows in result.partitions():
+        chunk = b"".join(_encode_row(row._mapping) for row in rows)
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+
+    if compressor is not None:
+        yield compressor.flush()
+
+
+async def stream_export(
+    uid: str,
+    namespace: Optional[str] = None,
+    user_id: Optional[int] = None,
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """export_memories in its own session, for responses sent after the endpoint returns."""
+    async with AsyncSessionLocal() as db:
+        async for chunk in export_memories(db, uid, namespace, user_id, compress):
+            yield chunk
+
+
+def export_filename(uid: str, namespace: Optional[str] = None, compress: bool = False) -> str:
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", f"{uid}-{namespace or 'all'}")
+    return f"{name}.ndjson.gz" if compress else f"{name}.ndjson"
+
+
+async def import_memories(
+    db: AsyncSession,
+    chunks: AsyncIterable[bytes],
+    user_id: Optional[int] = None,
+    uid: Optional[str] = None,
+    namespace: Optional[str] = None,
+) -> int:
+    """
+    Load NDJSON memories, plain or gzipped, and return how many were imported.
+
+    uid and namespace, when given, replace the values on every line; a line
+    without a namespace gets its uid. Timestamps, expiry included, are kept
+    if present.
+    """
+    imported = 0
+    rows: list[dict] = []
+    line_number = 0
+
+    try:
+        async for line in _ndjson_lines(chunks):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                rows.append(_import_row(json.loads(line), user_id, uid, namespace))
+            except ValidationError as e:
+                raise MemoryImportError(f"Line {line_number}: {validation_error_message(e)}", imported) from e
+            except (ValueError, TypeError) as e:
+                raise MemoryImportError(f"Line {line_number}: {e}", imported) from e
+
+            if len(rows) >= settings.memory_transfer_batch_size:
+                imported += await _load(db, rows)
+                rows = []
+    except _StreamError as e:
+        raise MemoryImportError(str(e), imported) from e
+
+    if rows:
+        imported += await _load(db, rows)
+    return imported
+
+
+def _encode_row(row: Any) -> bytes:
+    record = dict(row)
+    for field in ("created_at", "updated_at", "expires_at"):
+        if record[field] is not None:
+            record[field] = record[field].isoformat()
+    return json.dumps(record, ensure_ascii=False).encode() + b"\n"
+
+
+def _import_row(record: Any, user_id: Optional[int], uid: Optional[str], namespace: Optional[str]) -> dict:
+    if not isinstance(record, dict):
+        raise ValueError("line must be a JSON object")
+
+    fields = {key: record[key] for key in ("uid", "namespace", "text", "tags", "created_by") if key in record}
+    if uid:
+        fields["uid"] = uid
+    if namespace:
+        fields["namespace"] = namespace
+    elif not fields.get("namespace"):
+        fields["namespace"] = fields.get("uid")
+    memory = MemoryCreateRequest(**fields)
+    if "\x00" in memory.text:
+        raise ValueError("text contains a NUL character")
+
+    now = datetime.now(timezone.utc)
+    created_at = datetime.fromisoformat(record["created_at"]) if record.get("created_at") else now
+    updated_at = datetime.fromisoformat(record["updated_at"]) if record.get("updated_at") else created_at
+    expires_at = datetime.fromisoformat(record["expires_at"]) if record.get("expires_at") else None
+
+    return {
+        "user_id": user_id,
+        "uid": memory.uid,
+        "namespace": memory.namespace,
+        "text": memory.text,
+        "tags": memory.tags,
+        "created_by": memory.created_by,
+        "created_at": created_at,
+        "updated_at": updated_at,
+        "expires_at": expires_at,
+    }
+
+
+async def _load(db: AsyncSession, rows: list[dict]) -> int:
+    await copy_memories(db, rows)
+    await db.commit()
+    await query_cache.invalidate(rows[0]["user_id"], [(row["uid"], row["namespace"]) for row in rows])
+    return len(rows)
+
+
+async def _ndjson_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines, inflating it first if it is gzipped."""
+    inflater = None
+    head = b""
+    buffer = b""
+
+    async for chunk in chunks:
+        if head is not None:
+            # Wait for enough bytes to recognise gzip
+            head += chunk
+            if len(head) < len(GZIP_MAGIC):
+                continue
+            if head.startswith(GZIP_MAGIC):
+                inflater = _GzipInflater()
+            chunk, head = head, None
+
+        for data in inflater.inflate(chunk) if inflater is not None else (chunk,):
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield line
+            if len(buffer) > MAX_LINE_BYTES:
+                raise _StreamError(f"Line longer than {MAX_LINE_BYTES} bytes")
+
+    if head:
+        buffer = head
+    elif inflater is not None and not inflater.eof:
+        raise _StreamError("Truncated gzip input")
+    if buffer:
+        yield buffer
+
+
+class _GzipInflater:
+    """
+    Inflates gzip input of one or more members.
+
+    Concatenated gzip files (``cat a.gz b.gz``, or pigz/bgzip output) are
+    one valid gzip file, but a zlib decompressor stops after the first
+    member; the rest is fed to a new one.
+    """
+
+    def __init__(self):
+        self._decompressor = zlib.decompressobj(wbits=31)
+
+    @property
+    def eof(self) -> bool:
+        """Whether the input so far ends at the end of a member."""
+        return self._decompressor.eof
+
+    def inflate(self, chunk: bytes) -> Iterator[bytes]:
+        # Bounded steps, so a small compressed chunk can't expand all at once
+        while chunk:
+            decompressor = self._decompressor
+            try:
+                yield decompressor.decompress(chunk, INFLATE_STEP)
+                while decompressor.unconsumed_tail:
+                    yield decompressor.decompress(decompressor.unconsumed_tail, INFLATE_STEP)
+            except zlib.error as e:
+                raise _StreamError(f"Invalid gzip input: {e}") from e
+
+            chunk = decompressor.unused_data if decompressor.eof else b""
+            if chunk:
+                self._decompressor = zlib.decompressobj(wbits=31)
@@ -0,0 +1,131 @@
+"""
+Near-duplicate memories by MinHash and locality-sensitive hashing.
+
+A memory's shingles are the character 3-grams of its words, normalised like
+content hashes, so "prefers dark mode" and "user prefers the dark mode" share
+most of them. How alike two memories are is the Jaccard similarity of their
+shingles; only wording counts, so "prefers dark mode" is as close to "prefers
+light mode" as to a paraphrase, and synonyms don't count at all.
+
+MinHash signatures estimate that similarity, and are cut into BANDS bands of
+BAND_ROWS values, each hashed to a 64-bit key. Memories sharing a key are
+candidates, which are then compared exactly: with 16 bands of 4, pairs at
+0.7 similarity share a key 99% of the time, pairs at 0.3 only 12%. The keys
+are stored in memories.lsh_bands, so a save finds its candidates through a
+GIN index rather than by comparing against the whole namespace.
+
+Changing the shingles or the band layout changes every key, so memories
+have to be re-banded with ``python -m app.db.compaction backfill --all``.
+"""
+
+import hashlib
+import re
+import unicodedata
+import zlib
+from typing import Dict, List, Sequence, Set
+
+import numpy as np
+
+WORD_RE = re.compile(r"\w+")
+SHINGLE_SIZE = 3
+BANDS = 16
+BAND_ROWS = 4
+PERMUTATIONS = BANDS * BAND_ROWS
+
+# Universal hashes (a * x + b) mod p stand in for permutations of the
+# shingle hashes; x < 2 ** 32 and a < p, so a * x + b fits in 64 bits
+PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20250908)
+_A = _rng.randint(1, PRIME, size=PERMUTATIONS).astype(np.uint64)
+_B = _rng.randint(0, PRIME, size=PERMUTATIONS).astype(np.uint64)
+
+
+class NearDuplicateError(Exception):
+    """A memory was saved with on_near_duplicate="reject" and is like an existing one."""
+
+    def __init__(self, memory_id: int, similarity: float):
+        super().__init__(f"Memory {memory_id} is a near duplicate (similarity {similarity:.2f})")
+        self.memory_id = memory_id
+        self.similarity = similarity
+
+
+def shingles(text: str) -> Set[str]:
+    """Character 3-grams of the words of text, with word boundaries marked."""
+    result = set()
+    for word in WORD_RE.findall(unicodedata.normalize("NFKC", text).casefold()):
+        padded = f"<{word}>"
+        result.update(padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1))
+    return result
+
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    """Jaccard similarity of two shingle sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def signature(shingle_set: Set[str]) -> np.ndarray:
+    """MinHash signature of a non-empty shingle set, PERMUTATIONS values."""
+    # crc32 rather than hash(), which is salted per process
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode()) for shingle in shingle_set), dtype=np.uint64, count=len(shingle_set)
+    )
+    return ((np.outer(_A, hashes) + _B[:, None]) % PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_keys(shingle_set: Set[str]) -> List[int]:
+    """LSH keys of a shingle set, as signed 64-bit integers for a bigint[] column; none if it is empty."""
+    if not shingle_set:
+        return []
+    values = signature(shingle_set)
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(
+            values[band * BAND_ROWS:(band + 1) * BAND_ROWS].tobytes(), digest_size=8, person=band.to_bytes(16, "big")
+        ).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def lsh_bands(text: str) -> List[int]:
+    """The memories.lsh_bands of a memory's text."""
+    return band_keys(shingles(text))
+
+
+def clusters(texts: Sequence[str], threshold: float) -> List[List[int]]:
+    """
+    Group texts that are near duplicates of each other
+
+    Returns the positions of each group of two or more, in ascending order.
+    Each text is compared only with the first text of every bucket it falls
+    in, so the work grows with the number of texts rather than of pairs; a
+    group can chain texts that are each like the next but not like the
+    first.
+    """
+    sets = [shingles(text) for text in texts]
+    parent = list(range(len(texts)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    buckets: Dict[int, List[int]] = {}
+    for position, shingle_set in enumerate(sets):
+        for key in band_keys(shingle_set):
+            buckets.setdefault(key, []).append(position)
+
+    for members in buckets.values():
+        first = members[0]
+        for position in members[1:]:
+            root, other = find(first), find(position)
+            if root != other and similarity(sets[first], sets[position]) >= threshold:
+                # The earlier position stays the root
+                parent[max(root, other)] = min(root, other)
+
+    groups: Dict[int, List[int]] = {}
+    for position in range(len(texts)):
+        groups.setdefault(find(position), []).append(position)
+    return [group for group in groups.values() if len(group) > 1]
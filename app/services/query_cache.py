@@ -0,0 +1,334 @@
+"""
+Two-tier cache of memory query responses.
+
+Agents repeat the same query many times per conversation, so the rendered
+response body is cached, keyed by user and the normalised query request. A
+bounded per-worker LRU sits in front of Redis, which is shared by all
+gunicorn workers.
+
+Entries are never deleted on writes. Instead each (user_id, namespace) has a
+generation that is part of every key; a write replaces it, so later lookups
+miss and the stale entries expire on their own. The generation is read
+before the query runs, so a result computed while a write lands is stored
+under the old generation and never served. Generations are random tokens
+rather than counters, so one evicted from Redis can't come back with a value
+used before. Workers keep generations locally for a few seconds; changes are
+published to every worker, each of which drops its copy.
+
+Reads of what was written are pinned to the primary before the generation
+is replaced, so the first queries of a new generation can't cache rows from
+a replica that hasn't replayed the write yet. As a second guard, results
+read from a replica aren't stored while their generation is younger than
+``replica_pin_seconds``; generations carry the time they were started.
+
+If a new generation can't be stored, the namespace is marked dirty in the
+worker that wrote: it bypasses the cache for the namespace and retries, on
+later lookups and in the background, until the generation is replaced or
+every entry that could be stale has expired. Entries live only
+``query_cache_ttl`` seconds, which bounds what other workers can serve
+meanwhile.
+
+Memories also drop out of results without a write, when their ttl or the
+namespace's retention rule runs out, so an entry lives no longer than the
+first memory it depends on.
+
+The key, with that expiry, also gives the ETag of a query's response, so a
+conditional GET whose tag is still current is answered without running the
+query or looking the entry up. When Redis is unavailable there is no key and
+the cache is bypassed: other workers' writes couldn't be seen.
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Iterable, Optional, Tuple
+
+import orjson
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.db.routing import ReadScope, read_router, replica_read
+from app.schemas.memory import MemoryQueryRequest
+from app.services.redis_client import get_redis, redis_available, mark_redis_down
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "ajimemo:query:v2:"  # v2 entries start with their expiry
+GENERATION_KEY_PREFIX = "ajimemo:query-gen:"
+INVALIDATION_CHANNEL = "ajimemo:query-invalidations"
+LOCAL_GENERATION_LIMIT = 100000
+
+SPACES_RE = re.compile(r"\s+")
+
+QUERY_CACHE_LOOKUPS = Counter(
+    "ajimemo_query_cache_lookups",
+    "Memory query cache lookups by outcome",
+    ["result"],  # local, redis, miss, bypass
+)
+
+
+def request_digest(query_request: MemoryQueryRequest) -> str:
+    """Digest of a query request, the same for requests that return the same memories."""
+    fields = query_request.model_dump()
+    # Tags match by overlap, and the query's spacing is lost in parsing
+    fields["tags"] = sorted(set(fields["tags"]))
+    if fields["query"] is not None:
+        fields["query"] = SPACES_RE.sub(" ", fields["query"]).strip()
+    return hashlib.sha256(orjson.dumps(fields, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def etag(key: str, expires: Optional[datetime]) -> str:
+    """
+    Strong ETag of the response cached under key; it changes with the
+    generation. It ends with when the response goes stale without a write,
+    in ms since the epoch, if it does, so it can be checked without the entry.
+    """
+    digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+    if expires is None:
+        return f'"{digest}"'
+    return f'"{digest}-{int(expires.timestamp() * 1000):x}"'
+
+
+def etag_is_current(key: str, tag: str) -> bool:
+    """Whether an ETag sent with the response cached under key still describes it."""
+    digest, _, expires = tag.strip('"').partition("-")
+    if digest != hashlib.sha256(key.encode()).hexdigest()[:32]:
+        return False
+    try:
+        return not expires or int(expires, 16) > time.time() * 1000
+    except ValueError:
+        return False
+
+
+def new_generation(started: Optional[float] = None) -> str:
+    """A generation token: when it was started (ms since the epoch, hex) and a random part."""
+    started = time.time() if started is None else started
+    return f"{int(started * 1000):x}-{uuid.uuid4().hex}"
+
+
+def generation_age(generation: str) -> Optional[float]:
+    """Seconds since a generation was started, None if it doesn't say."""
+    started, _, rest = generation.partition("-")
+    if not rest:
+        return None
+    return time.time() - int(started, 16) / 1000
+
+
+class QueryCache:
+    """Per-worker LRU backed by Redis, keyed by generation and request digest."""
+
+    def __init__(self, enabled: bool, maxsize: int, ttl: int, local_ttl: int):
+        self.enabled = enabled
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self._local: OrderedDict[str, tuple[float, bytes, Optional[datetime]]] = OrderedDict()
+        self._generations: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._dirty: dict[str, float] = {}  # scope -> when its invalidation failed
+
+    async def key(self, user_id: int, query_request: MemoryQueryRequest) -> Optional[str]:
+        """Cache key of a query, None if it can't be cached now."""
+        if not redis_available():
+            return None
+        if query_request.within_days:
+            # Memories age out of these without any write
+            return None
+
+        scope = f"{user_id}:{query_request.namespace}"
+        if scope in self._dirty and not await self._repair(scope):
+            return None
+
+        generation = await self._generation(scope)
+        if generation is None:
+            return None
+        return f"{user_id}:{generation}:{request_digest(query_request)}"
+
+    async def get_or_set(
+        self,
+        key: Optional[str],
+        run: Callable[[bool], Awaitable[Tuple[bytes, Optional[datetime]]]],
+        tagged: bool = False,
+    ) -> Tuple[bytes, Optional[str]]:
+        """
+        Return the response body cached under key, or run the query and cache
+        it, with its ETag if tagged (None if it has none).
+
+        ``run(with_expiry)`` returns the body and, when asked because the body
+        is stored or tagged, when it goes stale without a write, if it does;
+        the entry expires then at the latest.
+        """
+        if key is None or not self.enabled:
+            QUERY_CACHE_LOOKUPS.labels("bypass").inc()
+            tagged = tagged and key is not None
+            body, expires = await run(tagged)
+            return body, self._etag(key, expires, tagged)
+
+        entry = self._local.get(key)
+        if entry is not None:
+            deadline, body, expires = entry
+            if deadline > time.monotonic():
+                self._local.move_to_end(key)
+                QUERY_CACHE_LOOKUPS.labels("local").inc()
+                return body, self._etag(key, expires, tagged)
+            del self._local[key]
+
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                value, ttl_ms = await pipe.get(REDIS_KEY_PREFIX + key).pttl(REDIS_KEY_PREFIX + key).execute()
+        except RedisError:
+            mark_redis_down()
+            value = None
+        if value is not None:
+            # Stored as the expiry (ms since the epoch, hex, or nothing), a newline and the body
+            expires_ms, _, body = value.partition(b"\n")
+            expires = datetime.fromtimestamp(int(expires_ms, 16) / 1000, timezone.utc) if expires_ms else None
+            # The local copy expires with the Redis entry
+            if ttl_ms > 0:
+                self._store_local(key, body, expires, ttl_ms / 1000)
+            QUERY_CACHE_LOOKUPS.labels("redis").inc()
+            return body, self._etag(key, expires, tagged)
+
+        QUERY_CACHE_LOOKUPS.labels("miss").inc()
+        body, expires = await run(True)
+        if replica_read.get() and self._is_young(key):
+            # The replica may not have replayed the write that started the generation
+            return body, None
+        ttl = float(self.ttl)
+        if expires is not None:
+            ttl = min(ttl, (expires - datetime.now(timezone.utc)).total_seconds())
+        if ttl < 0.001:
+            # A memory of the response has expired already
+            return body, None
+        self._store_local(key, body, expires, ttl)
+        if redis_available():
+            expires_ms = f"{int(expires.timestamp() * 1000):x}" if expires is not None else ""
+            try:
+                await get_redis().set(REDIS_KEY_PREFIX + key, expires_ms.encode() + b"\n" + body, px=int(ttl * 1000))
+            except RedisError:
+                mark_redis_down()
+        return body, self._etag(key, expires, tagged)
+
+    async def invalidate(self, user_id: Optional[int], written: Iterable[Tuple[Optional[str], str]]) -> None:
+        """
+        Start a new generation, on every worker, for the namespaces written to.
+
+        written holds the (uid, namespace) of each write, with no uid for
+        writes across the namespace. Reads of them are pinned to the primary
+        first.
+        """
+        written = set(written)
+        if user_id is not None:
+            await read_router.pin(*(ReadScope(user_id, uid, namespace) for uid, namespace in written))
+
+        for namespace in {namespace for _, namespace in written}:
+            scope = f"{user_id}:{namespace}"
+            if not await self._bump(scope):
+                logger.warning("Failed to invalidate cached queries of %s, bypassing them until it succeeds", scope)
+                self._dirty[scope] = time.monotonic()
+
+    async def repair(self) -> None:
+        """Retry failed invalidations until they succeed."""
+        while True:
+            await asyncio.sleep(settings.redis_retry_after)
+            for scope in list(self._dirty):
+                if redis_available():
+                    await self._repair(scope)
+
+    async def listen(self) -> None:
+        """Drop local generations replaced by other workers."""
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                async with pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    async for message in pubsub.listen():
+                        self._generations.pop(message["data"].decode(), None)
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, OSError) as e:
+                logger.warning("Query cache invalidation listener disconnected: %s", e)
+                # Nothing heard while disconnected, so forget every generation
+                self._generations.clear()
+                await asyncio.sleep(settings.redis_retry_after)
+
+    async def _bump(self, scope: str) -> bool:
+        self._generations.pop(scope, None)
+        generation = new_generation()
+        try:
+            redis = get_redis()
+            await redis.set(GENERATION_KEY_PREFIX + scope, generation)
+            await redis.publish(INVALIDATION_CHANNEL, scope)
+        except RedisError:
+            mark_redis_down()
+            return False
+        self._store_generation(scope, generation)
+        return True
+
+    async def _repair(self, scope: str) -> bool:
+        """Retry the invalidation of a dirty scope; whether its cache can be used again."""
+        failed_at = self._dirty[scope]
+        if await self._bump(scope) or failed_at + self.ttl <= time.monotonic():
+            # Entries stored before the write have expired even if the bump failed
+            if self._dirty.get(scope) == failed_at:
+                del self._dirty[scope]
+            return scope not in self._dirty
+        return False
+
+    async def _generation(self, scope: str) -> Optional[str]:
+        entry = self._generations.get(scope)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        key = GENERATION_KEY_PREFIX + scope
+        try:
+            redis = get_redis()
+            generation = await redis.get(key)
+            if generation is None:
+                # First query of the namespace; another worker may start it
+                # first. Nothing was written, so it doesn't need to look young
+                new = new_generation(started=0)
+                generation = new.encode() if await redis.set(key, new, nx=True) else await redis.get(key)
+        except RedisError:
+            mark_redis_down()
+            return None
+        if generation is None:
+            return None
+
+        generation = generation.decode()
+        self._store_generation(scope, generation)
+        return generation
+
+    def _is_young(self, key: str) -> bool:
+        age = generation_age(key.split(":")[1])
+        return age is not None and age < settings.replica_pin_seconds
+
+    def _store_generation(self, scope: str, generation: str) -> None:
+        self._generations[scope] = (time.monotonic() + self.local_ttl, generation)
+        self._generations.move_to_end(scope)
+        while len(self._generations) > LOCAL_GENERATION_LIMIT:
+            self._generations.popitem(last=False)
+
+    def _etag(self, key: Optional[str], expires: Optional[datetime], tagged: bool) -> Optional[str]:
+        if key is None or not tagged:
+            return None
+        return etag(key, expires)
+
+    def _store_local(self, key: str, body: bytes, expires: Optional[datetime], ttl: float) -> None:
+        self._local[key] = (time.monotonic() + ttl, body, expires)
+        self._local.move_to_end(key)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+
+query_cache = QueryCache(
+    enabled=settings.query_cache_enabled,
+    maxsize=settings.query_cache_size,
+    ttl=settings.query_cache_ttl,
+    local_ttl=settings.query_cache_local_ttl,
+)
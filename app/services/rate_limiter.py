@@ -0,0 +1,117 @@
+"""
+Per-token rate limiting with GCRA.
+
+The generic cell rate algorithm keeps a single "theoretical arrival time" per
+key, so a check is one atomic Redis script call with no per-request lists.
+When Redis is unavailable the same algorithm runs in-process; limits are then
+enforced per worker instead of globally until Redis comes back.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.services.redis_client import get_redis, redis_available, mark_redis_down
+
+REDIS_KEY_PREFIX = "ajimemo:ratelimit:"
+WINDOW_MS = 3600 * 1000
+
+# KEYS[1] = bucket key; ARGV[1] = emission interval (ms), ARGV[2] = burst tolerance (ms),
+# ARGV[3] = requests counted
+# Returns {allowed, retry_after_ms, remaining, reset_after_ms}
+GCRA_SCRIPT = """
+local emission = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+  tat = now
+end
+local new_tat = tat + emission * cost
+local allow_at = new_tat - tolerance
+if now < allow_at then
+  return {0, allow_at - now, 0, tat - now}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return {1, 0, math.floor((tolerance - (new_tat - now)) / emission), new_tat - now}
+"""
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # seconds until the next request is allowed
+    reset_after: float  # seconds until the full limit is available again
+
+    def headers(self) -> dict[str, str]:
+        """Rate limit response headers."""
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return headers
+
+
+class RateLimiter:
+    """GCRA limiter backed by Redis with an in-process fallback."""
+
+    def __init__(self, local_max_keys: int):
+        self.local_max_keys = local_max_keys
+        self._local: OrderedDict[str, float] = OrderedDict()
+        self._script = None
+
+    async def hit(self, key: str, limit_per_hour: int, cost: int = 1) -> RateLimitResult:
+        """
+        Count cost requests against key and report whether they are allowed.
+
+        A cost above the limit is never allowed.
+        """
+        limit = max(1, limit_per_hour)
+        emission = WINDOW_MS / limit
+        tolerance = emission * limit
+
+        if redis_available():
+            try:
+                redis = get_redis()
+                if self._script is None or self._script.registered_client is not redis:
+                    # The client is replaced when Redis is closed and reopened
+                    self._script = redis.register_script(GCRA_SCRIPT)
+                allowed, retry_ms, remaining, reset_ms = await self._script(
+                    keys=[REDIS_KEY_PREFIX + key],
+                    args=[math.ceil(emission), math.ceil(tolerance), cost],
+                )
+                return RateLimitResult(bool(allowed), limit, remaining, retry_ms / 1000, reset_ms / 1000)
+            except RedisError:
+                mark_redis_down()
+
+        return self._hit_local(key, limit, emission, tolerance, cost)
+
+    def _hit_local(self, key: str, limit: int, emission: float, tolerance: float, cost: int) -> RateLimitResult:
+        now = time.monotonic() * 1000
+        tat = max(self._local.get(key, now), now)
+        new_tat = tat + emission * cost
+        allow_at = new_tat - tolerance
+
+        if now < allow_at:
+            return RateLimitResult(False, limit, 0, (allow_at - now) / 1000, (tat - now) / 1000)
+
+        self._local[key] = new_tat
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_max_keys:
+            self._local.popitem(last=False)
+
+        remaining = math.floor((tolerance - (new_tat - now)) / emission)
+        return RateLimitResult(True, limit, remaining, 0, (new_tat - now) / 1000)
+
+
+rate_limiter = RateLimiter(local_max_keys=settings.rate_limit_local_max_keys)
@@ -0,0 +1,42 @@
+"""Shared Redis connection with a simple circuit breaker."""
+
+import time
+from typing import Optional
+from redis.asyncio import Redis
+
+from app.config import settings
+
+_redis: Optional[Redis] = None
+_down_until: float = 0.0
+
+
+def get_redis() -> Redis:
+    """Get the process-wide Redis client."""
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(
+            settings.redis_url,
+            socket_timeout=settings.redis_socket_timeout,
+            socket_connect_timeout=settings.redis_socket_timeout,
+            health_check_interval=30,
+        )
+    return _redis
+
+
+def redis_available() -> bool:
+    """Check whether Redis should be tried, or is backing off after a failure."""
+    return time.monotonic() >= _down_until
+
+
+def mark_redis_down() -> None:
+    """Stop using Redis for a while after a failed call."""
+    global _down_until
+    _down_until = time.monotonic() + settings.redis_retry_after
+
+
+async def close_redis() -> None:
+    """Close the Redis client."""
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
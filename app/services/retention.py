@@ -0,0 +1,108 @@
+"""
+Background deletion of expired memories.
+
+A memory expires when its ttl passes (expires_at) or when it is older than
+the retention rule of its namespace. Reads hide it from then on
+(app.crud.memory.live_filters); the reaper deletes it within
+``memory_reaper_interval`` seconds. Deletes run ``memory_reaper_batch_size``
+rows per transaction and skip rows locked by others, so the reapers of every
+worker can run at once without lock storms or long transactions holding up
+vacuum. Cached queries of the namespaces it deletes from are invalidated.
+"""
+
+import asyncio
+import logging
+from itertools import groupby
+from typing import Any, List, Optional
+
+from prometheus_client import Counter
+from sqlalchemy import Row
+
+from app.config import settings
+from app.crud.memory import delete_expired_memories
+from app.crud.retention_rules import get_retention_rules
+from app.db.database import AsyncSessionLocal
+from app.services.query_cache import query_cache
+
+logger = logging.getLogger(__name__)
+
+MEMORIES_REAPED = Counter(
+    "ajimemo_memories_reaped",
+    "Expired memories deleted by the reaper",
+    ["reason"],  # ttl, retention
+)
+
+
+class MemoryReaper:
+    """Deletes expired memories in small batches on an interval."""
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def start(self) -> None:
+        """Start the background reaper, unless the interval is 0."""
+        if self.interval <= 0:
+            return
+        self._closing = False
+        # Bound to the loop it is first awaited on, so one per run
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the reaper after the batch it is deleting."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.warning("Failed to reap expired memories: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def reap(self) -> int:
+        """Delete the memories that have expired so far and return how many."""
+        reaped = await self._reap_batches("ttl")
+
+        async with AsyncSessionLocal() as db:
+            rules = [(rule.user_id, rule.namespace, rule.max_age_days) for rule in await get_retention_rules(db)]
+        for user_id, namespace, max_age_days in rules:
+            reaped += await self._reap_batches(
+                "retention", user_id=user_id, namespace=namespace, max_age_days=max_age_days
+            )
+        return reaped
+
+    async def _reap_batches(self, reason: str, **rule: Any) -> int:
+        reaped = 0
+        async with AsyncSessionLocal() as db:
+            while not self._closing:
+                deleted = await delete_expired_memories(db, self.batch_size, **rule)
+                reaped += len(deleted)
+                MEMORIES_REAPED.labels(reason).inc(len(deleted))
+                await _invalidate(deleted)
+                # A short batch means the rest, if any, is locked by others
+                if len(deleted) < self.batch_size:
+                    break
+        return reaped
+
+
+async def _invalidate(deleted: List[Row]) -> None:
+    for user_id, rows in groupby(sorted(deleted, key=lambda row: row.user_id or 0), key=lambda row: row.user_id):
+        await query_cache.invalidate(user_id, [(row.uid, row.namespace) for row in rows])
+
+
+memory_reaper = MemoryReaper(
+    interval=settings.memory_reaper_interval,
+    batch_size=settings.memory_reaper_batch_size,
+)
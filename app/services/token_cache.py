@@ -0,0 +1,173 @@
+"""
+Two-tier cache of validated API tokens.
+
+A bounded per-worker LRU sits in front of Redis, which is shared by all
+gunicorn workers. Misses are cached too, for a short time, so repeated
+requests with a bad token don't reach the database. Revocations delete the
+Redis entry and are published to every worker, each of which drops its local
+copy; the local TTL bounds staleness if a message is ever lost.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Optional
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.db.models import ApiToken, User
+from app.services.redis_client import get_redis, redis_available, mark_redis_down
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "ajimemo:token:"
+REVOCATION_CHANNEL = "ajimemo:token-revocations"
+MISSING = "-"
+
+_SNAPSHOT_FIELDS = (
+    "id",
+    "user_id",
+    "token_name",
+    "token_prefix",
+    "permissions",
+    "rate_limit_per_hour",
+    "last_used_at",
+    "expires_at",
+    "created_at",
+    "is_active",
+)
+_DATETIME_FIELDS = ("last_used_at", "expires_at", "created_at")
+
+
+def snapshot_token(api_token: ApiToken) -> dict[str, Any]:
+    """Serialize the cacheable fields of a token and its user's plan."""
+    snapshot = {field: getattr(api_token, field) for field in _SNAPSHOT_FIELDS}
+    for field in _DATETIME_FIELDS:
+        if snapshot[field] is not None:
+            snapshot[field] = snapshot[field].isoformat()
+    snapshot["plan"] = api_token.user.plan
+    return snapshot
+
+
+def token_from_snapshot(snapshot: dict[str, Any]) -> ApiToken:
+    """Build a detached token object, with its user's plan, from a cached snapshot."""
+    fields = dict(snapshot)
+    plan = fields.pop("plan", None)
+    for field in _DATETIME_FIELDS:
+        if fields.get(field) is not None:
+            fields[field] = datetime.fromisoformat(fields[field])
+    return ApiToken(**fields, user=User(id=fields["user_id"], plan=plan))
+
+
+class TokenCache:
+    """Per-worker LRU backed by Redis, keyed by token digest."""
+
+    def __init__(self, maxsize: int, ttl: int, local_ttl: int, negative_ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.negative_ttl = negative_ttl
+        self._local: OrderedDict[str, tuple[float, Optional[dict[str, Any]]]] = OrderedDict()
+
+    async def get(self, token_digest: str) -> tuple[bool, Optional[dict[str, Any]]]:
+        """
+        Look up a token.
+
+        Returns ``(hit, snapshot)``; a hit with no snapshot is a cached miss.
+        """
+        entry = self._local.get(token_digest)
+        if entry is not None:
+            expires, snapshot = entry
+            if expires > time.monotonic():
+                self._local.move_to_end(token_digest)
+                return True, snapshot
+            del self._local[token_digest]
+
+        if not redis_available():
+            return False, None
+
+        try:
+            raw = await get_redis().get(REDIS_KEY_PREFIX + token_digest)
+        except RedisError:
+            mark_redis_down()
+            return False, None
+
+        if raw is None:
+            return False, None
+
+        snapshot = None if raw == MISSING.encode() else json.loads(raw)
+        self._store_local(token_digest, snapshot, self._ttl_for(snapshot, self.local_ttl))
+        return True, snapshot
+
+    async def set(self, token_digest: str, snapshot: dict[str, Any]) -> None:
+        """Cache a validated token, never past its own expiry."""
+        ttl = self._ttl_for(snapshot, self.ttl)
+        if ttl <= 0:
+            return
+        self._store_local(token_digest, snapshot, min(ttl, self.local_ttl))
+        await self._set_remote(token_digest, json.dumps(snapshot), ttl)
+
+    async def set_missing(self, token_digest: str) -> None:
+        """Cache a failed lookup for a short time."""
+        self._store_local(token_digest, None, self.negative_ttl)
+        await self._set_remote(token_digest, MISSING, self.negative_ttl)
+
+    async def evict(self, token_digest: str) -> None:
+        """Drop a token from every worker's cache."""
+        self._local.pop(token_digest, None)
+        try:
+            redis = get_redis()
+            await redis.delete(REDIS_KEY_PREFIX + token_digest)
+            await redis.publish(REVOCATION_CHANNEL, token_digest)
+        except RedisError as e:
+            mark_redis_down()
+            logger.warning("Failed to broadcast token revocation: %s", e)
+
+    async def listen(self) -> None:
+        """Evict local entries on revocations published by other workers."""
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                async with pubsub:
+                    await pubsub.subscribe(REVOCATION_CHANNEL)
+                    async for message in pubsub.listen():
+                        self._local.pop(message["data"].decode(), None)
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, OSError) as e:
+                logger.warning("Token revocation listener disconnected: %s", e)
+                # Nothing heard while disconnected, so drop everything cached
+                self._local.clear()
+                await asyncio.sleep(settings.redis_retry_after)
+
+    def _ttl_for(self, snapshot: Optional[dict[str, Any]], ttl: int) -> int:
+        if snapshot is None or snapshot.get("expires_at") is None:
+            return ttl
+        expires_at = datetime.fromisoformat(snapshot["expires_at"])
+        remaining = (expires_at - datetime.now(timezone.utc)).total_seconds()
+        return min(ttl, int(remaining))
+
+    def _store_local(self, token_digest: str, snapshot: Optional[dict[str, Any]], ttl: int) -> None:
+        self._local[token_digest] = (time.monotonic() + ttl, snapshot)
+        self._local.move_to_end(token_digest)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    async def _set_remote(self, token_digest: str, value: str, ttl: int) -> None:
+        if not redis_available():
+            return
+        try:
+            await get_redis().set(REDIS_KEY_PREFIX + token_digest, value, ex=ttl)
+        except RedisError:
+            mark_redis_down()
+
+
+token_cache = TokenCache(
+    maxsize=settings.token_cache_size,
+    ttl=settings.token_cache_ttl,
+    local_ttl=settings.token_cache_local_ttl,
+    negative_ttl=settings.token_cache_negative_ttl,
+)
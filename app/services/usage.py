@@ -0,0 +1,104 @@
+"""
+Batched ApiUsage ingestion.
+
+Requests push usage records onto a bounded in-memory queue and return
+immediately. A background writer drains the queue into api_usage with
+multi-row inserts. When the queue is full, records are dropped and counted
+rather than slowing requests down.
+"""
+
+import asyncio
+import logging
+from typing import Any, Optional
+
+from prometheus_client import Counter, Gauge
+from sqlalchemy import insert
+
+from app.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.models import ApiUsage
+
+logger = logging.getLogger(__name__)
+
+USAGE_RECORDED = Counter("ajimemo_usage_records", "Usage records queued")
+USAGE_DROPPED = Counter("ajimemo_usage_records_dropped", "Usage records dropped because the queue was full")
+USAGE_WRITTEN = Counter("ajimemo_usage_records_written", "Usage records written to the database")
+USAGE_FAILED = Counter("ajimemo_usage_records_failed", "Usage records lost to failed writes")
+
+
+class UsageRecorder:
+    """Bounded queue of usage records with a batching writer."""
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def record(self, **fields: Any) -> None:
+        """Queue a usage record without waiting."""
+        try:
+            self._queue.put_nowait(fields)
+            USAGE_RECORDED.inc()
+        except asyncio.QueueFull:
+            USAGE_DROPPED.inc()
+
+    def qsize(self) -> int:
+        """Number of records waiting to be written."""
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        """Start the background writer."""
+        self._closing = False
+        # Bound to the loop it is first awaited on, so one per run; stop() emptied the last one
+        self._queue = asyncio.Queue(maxsize=self._queue.maxsize)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the writer and write everything still queued."""
+        self._closing = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._write(batch)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self._closing:
+            batch: list[dict[str, Any]] = []
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            if batch:
+                await self._write(batch)
+
+    async def _write(self, batch: list[dict[str, Any]]) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(ApiUsage), batch)
+                await db.commit()
+            USAGE_WRITTEN.inc(len(batch))
+        except Exception as e:
+            USAGE_FAILED.inc(len(batch))
+            logger.warning("Failed to write %d usage records: %s", len(batch), e)
+
+
+usage_recorder = UsageRecorder(
+    max_queue=settings.usage_queue_size,
+    batch_size=settings.usage_batch_size,
+    flush_interval=settings.usage_flush_interval,
+)
+
+USAGE_QUEUE_DEPTH = Gauge("ajimemo_usage_queue_depth", "Usage records waiting to be written")
+USAGE_QUEUE_DEPTH.set_function(usage_recorder.qsize)
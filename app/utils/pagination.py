@@ -0,0 +1,40 @@
+"""Opaque keyset pagination cursors."""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any
+
+# Cursor kinds, one per sort order
+CREATED = "c"  # (created_at, id), newest first
+RANK = "r"  # (rank, id), most relevant first
+SIMILARITY = "s"  # (cosine similarity, id), nearest first
+FUSED = "f"  # (fused rank score, id), best first
+
+
+class InvalidCursorError(ValueError):
+    """The cursor is malformed or belongs to a different kind of query."""
+
+
+def encode_cursor(kind: str, value: Any, last_id: int) -> str:
+    """Encode the sort key of the last row on a page."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([kind, value, last_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, kind: str) -> tuple[Any, int]:
+    """Decode a cursor for a query sorted by kind into ``(value, last_id)``."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_kind, value, last_id = json.loads(raw)
+        if cursor_kind != kind or not isinstance(last_id, int):
+            raise ValueError(cursor_kind)
+        if kind == CREATED:
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, (int, float)):
+            raise ValueError(value)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+    return value, last_id
@@ -0,0 +1,51 @@
+"""Responses serialised with orjson, bypassing response model validation."""
+
+from typing import Callable, Optional, Sequence
+
+import orjson
+from sqlalchemy import Row
+
+from app.schemas.memory import MemoryData, MemorySearchInfo
+
+MEMORY_FIELDS = tuple(MemoryData.model_fields)
+
+
+def render_memory_list(
+    rows: Sequence[Row],
+    next_cursor: Optional[str] = None,
+    search: Optional[MemorySearchInfo] = None,
+) -> bytes:
+    """
+    A MemoryListResponse body rendered straight from query_memories rows.
+
+    Rows are already in the shape of MemoryData, so they go to orjson as
+    dicts instead of being copied into Pydantic models and validated again by
+    the response model. The JSON is the same, including "Z" for UTC times.
+    """
+    # zip stops at the last MemoryData field, dropping the sort value and counts
+    return orjson.dumps(
+        {
+            "data": [dict(zip(MEMORY_FIELDS, row)) for row in rows],
+            "message": None,
+            "success": True,
+            "next_cursor": next_cursor,
+            "search": search.model_dump() if search else None,
+        },
+        option=orjson.OPT_UTC_Z,
+    )
+
+
+def matching_etag(if_none_match: Optional[str], is_current: Callable[[str], bool]) -> Optional[str]:
+    """
+    The first entity tag of an If-None-Match header that is current (weak
+    comparison, as RFC 9110 asks), None if there is none.
+
+    "*" never matches: it names no response that could be sent back with a 304.
+    """
+    if not if_none_match:
+        return None
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/")
+        if tag.startswith('"') and is_current(tag):
+            return tag
+    return None
@@ -1,9 +1,17 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Optional, TypeVar
+import hashlib
+import hmac
+import secrets
 import bcrypt
 from jose import jwt, exceptions
+from prometheus_client import Counter, Gauge
 from app.config import settings
 
+T = TypeVar("T")
+
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt."""
@@ -16,6 +24,71 @@ def verify_password(password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 
+class HashingOverloadedError(RuntimeError):
+    """Raised when too many hashing jobs are already waiting."""
+
+
+class HashingExecutor:
+    """
+    Bounded thread pool for bcrypt work.
+
+    bcrypt takes hundreds of milliseconds per call, so it runs here instead of
+    on the event loop or in the request threadpool. Jobs beyond max_queue are
+    rejected rather than queued, so a burst of logins can't pile up
+    unbounded work.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hashing")
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs running or waiting."""
+        return self._pending
+
+    @property
+    def queued(self) -> int:
+        """Number of jobs waiting for a free thread."""
+        return max(0, self._pending - self.max_workers)
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Run a hashing function in the pool."""
+        if self.queued >= self.max_queue:
+            HASHING_REJECTED.inc()
+            raise HashingOverloadedError("Too many pending hashing jobs")
+
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+
+hashing_executor = HashingExecutor(
+    max_workers=settings.hashing_max_workers,
+    max_queue=settings.hashing_max_queue,
+)
+
+HASHING_QUEUE_DEPTH = Gauge("ajimemo_hashing_queue_depth", "Hashing jobs waiting for a thread")
+HASHING_QUEUE_DEPTH.set_function(lambda: hashing_executor.queued)
+HASHING_IN_FLIGHT = Gauge("ajimemo_hashing_in_flight", "Hashing jobs running or waiting")
+HASHING_IN_FLIGHT.set_function(lambda: hashing_executor.pending)
+HASHING_REJECTED = Counter("ajimemo_hashing_rejected", "Hashing jobs rejected because the queue was full")
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password without blocking the event loop."""
+    return await hashing_executor.run(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    """Verify a password without blocking the event loop."""
+    return await hashing_executor.run(verify_password, password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -47,3 +120,36 @@ def hash_api_token(token: str) -> str:
 def verify_api_token(token: str, hashed_token: str) -> bool:
     """Verify an API token against its hash."""
     return bcrypt.checkpw(token.encode('utf-8'), hashed_token.encode('utf-8'))
+
+
+async def verify_api_token_async(token: str, hashed_token: str) -> bool:
+    """Verify an API token without blocking the event loop."""
+    return await hashing_executor.run(verify_api_token, token, hashed_token)
+
+
+# API tokens are looked up by a short public prefix and verified with a keyed
+# HMAC-SHA256 digest, so validation is one indexed fetch plus a constant-time
+# compare. bcrypt hashes above are only kept for tokens issued before that.
+API_TOKEN_PREFIX = "ajm_"
+API_TOKEN_PREFIX_LENGTH = 12
+
+
+def generate_api_token() -> str:
+    """Generate a new random API token."""
+    return API_TOKEN_PREFIX + secrets.token_urlsafe(32)
+
+
+def api_token_prefix(token: str) -> str:
+    """Return the public lookup part of an API token."""
+    return token[:API_TOKEN_PREFIX_LENGTH]
+
+
+def digest_api_token(token: str) -> str:
+    """Return the keyed HMAC-SHA256 digest of an API token."""
+    key = (settings.api_token_secret or settings.secret_key).encode('utf-8')
+    return hmac.new(key, token.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def verify_api_token_digest(token: str, token_digest: str) -> bool:
+    """Verify an API token against its HMAC digest in constant time."""
+    return hmac.compare_digest(digest_api_token(token), token_digest)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Concurrent-request throughput benchmark for a single API worker.
+
+Registers a throwaway AI user, saves a set of memories and then hammers
+/ai/memory/query with a fixed number of concurrent clients, reporting
+requests per second and latency percentiles.
+
+Run the server with one worker and rate limiting off, e.g. (the query is
+the same every time, so turn the query cache off to measure the database)
+
+    RATE_LIMIT_ENABLED=false QUERY_CACHE_ENABLED=false uvicorn app.main:app --workers 1 --port 8000
+    python scripts/bench/concurrent_queries.py --url http://localhost:8000 -c 64 -d 20
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+WORDS = "dark mode project react deadline meeting coffee preference travel budget".split()
+
+
+async def setup(client: httpx.AsyncClient, memories: int) -> tuple[str, str]:
+    uid = f"bench-{uuid.uuid4().hex[:8]}"
+    r = await client.get("/api/v1/ai/register", params={"namespace": "bench", "uid": uid})
+    r.raise_for_status()
+    token = r.json()["data"]["token"]
+
+    for i in range(memories):
+        text = " ".join(WORDS[(i + j) % len(WORDS)] for j in range(6))
+        r = await client.get("/api/v1/ai/memory/save", params={
+            "uid": uid, "token": token, "text": f"{text} #{i}", "tags": WORDS[i % len(WORDS)],
+        })
+        r.raise_for_status()
+
+    return uid, token
+
+
+async def worker(client: httpx.AsyncClient, uid: str, token: str, deadline: float,
+                 latencies: list[float], errors: list[int]) -> None:
+    i = 0
+    while time.perf_counter() < deadline:
+        params = {"uid": uid, "token": token, "query": WORDS[i % len(WORDS)], "limit": 10}
+        started = time.perf_counter()
+        r = await client.get("/api/v1/ai/memory/query", params=params)
+        latencies.append(time.perf_counter() - started)
+        if r.status_code != 200:
+            errors.append(r.status_code)
+        i += 1
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("-d", "--duration", type=float, default=15.0, help="seconds")
+    parser.add_argument("--memories", type=int, default=200, help="memories to seed")
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        uid, token = await setup(client, args.memories)
+
+        latencies: list[float] = []
+        errors: list[int] = []
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(*(
+            worker(client, uid, token, deadline, latencies, errors) for _ in range(args.concurrency)
+        ))
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"concurrency:  {args.concurrency}")
+    print(f"requests:     {len(latencies)} ({len(errors)} errors)")
+    print(f"throughput:   {len(latencies) / args.duration:.1f} req/s")
+    print(f"latency p50:  {quantiles[49] * 1000:.1f} ms")
+    print(f"latency p95:  {quantiles[94] * 1000:.1f} ms")
+    print(f"latency p99:  {quantiles[98] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
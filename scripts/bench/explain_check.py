@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN regression check for the query_memories query shapes.
+
+Seeds a throwaway user with synthetic memories spread over skewed tenants
+(the same ones for a given --seed), ANALYZEs, then builds each query shape with app.crud.memory.memory_query (the
+exact statements the API runs) and inspects EXPLAIN (ANALYZE, BUFFERS) of it.
+A shape fails if its plan scans memories sequentially, doesn't use the
+tenant index meant for it, or sorts where the index should give the order.
+Full-text shapes are ordered by ts_rank, which no index can provide, so a
+top-N sort of the matching rows is expected there, and for small tenants
+the planner may rightly filter the tenant's rows off the B-tree instead of
+probing the GIN; either tenant index passes.
+
+    python scripts/bench/explain_check.py --rows 200000
+
+Exits non-zero if any shape fails. The seeded rows are deleted afterwards
+unless --keep is given.
+"""
+
+import argparse
+import json
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.crud.memory import memory_query  # noqa: E402
+from app.db.database import engine  # noqa: E402
+from app.schemas.memory import MemoryQueryRequest  # noqa: E402
+from app.utils.pagination import encode_cursor  # noqa: E402
+
+CREATED_INDEX = "idx_memories_tenant_created"
+SEARCH_INDEX = "idx_memories_tenant_search"
+SORTS = {"Sort", "Incremental Sort"}
+
+WORDS = (
+    "coffee tea project deadline meeting travel budget preference dark mode react python "
+    "invoice holiday family doctor gym recipe garden music podcast"
+).split()
+
+# name: (request fields, indexes one of which the plan must use, whether a sort is allowed)
+SHAPES = {
+    "newest": ({}, (CREATED_INDEX,), False),
+    "newest_cursor": ({"cursor": True}, (CREATED_INDEX,), False),
+    "newest_offset": ({"offset": 50}, (CREATED_INDEX,), False),
+    "tags": ({"tags": ["coffee"]}, (CREATED_INDEX,), False),
+    "fts": ({"query": "project deadline"}, (SEARCH_INDEX, CREATED_INDEX), True),
+    "fts_cursor": ({"query": "project deadline", "cursor": True}, (SEARCH_INDEX, CREATED_INDEX), True),
+}
+
+
+def seed(conn, rows: int, tenants: int, random_seed: float = 0.5) -> tuple[int, str]:
+    user_id = conn.execute(text(
+        "INSERT INTO users (email, name, password_hash) VALUES (:email, 'explain check', '-') RETURNING id"
+    ), {"email": f"explain-{uuid.uuid4().hex[:8]}@example.invalid"}).scalar_one()
+
+    words = "ARRAY[" + ",".join(f"'{word}'" for word in WORDS) + "]"
+    n = len(WORDS)
+    # The same tenant sizes, and so statistics and plans, on every run
+    conn.execute(text("SELECT setseed(:seed)"), {"seed": random_seed})
+    # Tenant k gets roughly 1/k^(2/3) of the rows; search_vector comes from the trigger
+    conn.execute(text(f"""
+        INSERT INTO memories (user_id, uid, namespace, text, tags, created_by, created_at, updated_at)
+        SELECT :user_id, ns, ns, body, tags, 'explain', now() - g * interval '1 second', now() - g * interval '1 second'
+        FROM (
+            SELECT g,
+                   'explain' || floor(:tenants * power(random(), 3))::int AS ns,
+                   array_to_string(ARRAY[
+                       w[1 + (g * 7) % {n}], w[1 + (g * 13) % {n}], w[1 + (g * 17) % {n}]
+                   ], ' ') || ' note ' || g AS body,
+                   ARRAY[w[1 + g % {n}], w[1 + (g / 3) % {n}]]::varchar[] AS tags
+            FROM generate_series(1, :rows) g, (SELECT {words} AS w) words
+        ) s
+    """), {"user_id": user_id, "rows": rows, "tenants": tenants})
+    conn.execute(text("ANALYZE memories"))
+
+    # The largest tenant is where a bad plan hurts most
+    namespace = conn.execute(text(
+        "SELECT namespace FROM memories WHERE user_id = :user_id "
+        "GROUP BY namespace ORDER BY count(*) DESC LIMIT 1"
+    ), {"user_id": user_id}).scalar_one()
+    return user_id, namespace
+
+
+def build_request(session: Session, namespace: str, user_id: int, fields: dict) -> MemoryQueryRequest:
+    fields = dict(fields)
+    if fields.pop("cursor", False):
+        # Continue after the first page, as a client following next_cursor would
+        first_page = MemoryQueryRequest(uid=namespace, **fields)
+        query, cursor_kind = memory_query(first_page, user_id)
+        last = session.execute(query).all()[first_page.limit - 1]
+        fields["cursor"] = encode_cursor(cursor_kind, last.sort_value, last.id)
+    return MemoryQueryRequest(uid=namespace, **fields)
+
+
+def explain(session: Session, request: MemoryQueryRequest, user_id: int) -> dict:
+    query, _ = memory_query(request, user_id)
+    compiled = query.compile(dialect=engine.dialect)
+    plan = session.connection().exec_driver_sql(
+        f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {compiled}", compiled.params
+    ).scalar_one()
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def index_names(session: Session, indexes: tuple[str, ...]) -> set[str]:
+    """The indexes and, on a partitioned table, their per-partition indexes."""
+    return {*indexes, *session.execute(text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits "
+        "WHERE inhparent IN (SELECT to_regclass(unnest(CAST(:indexes AS text[]))))"
+    ), {"indexes": list(indexes)}).scalars()}
+
+
+def check(plan: dict, expected: tuple[str, ...], indexes: set[str], sort_allowed: bool) -> list[str]:
+    nodes = list(plan_nodes(plan["Plan"]))
+    problems = []
+    for node in nodes:
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name", "").startswith("memories"):
+            problems.append(f"sequential scan on {node['Relation Name']}")
+        if node["Node Type"] in SORTS and not sort_allowed:
+            problems.append(f"{node['Node Type']} on {', '.join(node.get('Sort Key', []))}")
+    if not any(node.get("Index Name") in indexes for node in nodes):
+        problems.append(f"{' or '.join(expected)} not used")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--seed", type=float, default=0.5, help="random seed of the tenant sizes, -1 to 1")
+    parser.add_argument("--keep", action="store_true", help="don't delete the seeded user and memories")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        user_id, namespace = seed(conn, args.rows, args.tenants, args.seed)
+
+    failed = False
+    try:
+        with Session(engine) as session:
+            size = session.execute(
+                text("SELECT count(*) FROM memories WHERE namespace = :ns"), {"ns": namespace}
+            ).scalar_one()
+            print(f"checking tenant {namespace} ({size} memories)")
+
+            for name, (fields, expected, sort_allowed) in SHAPES.items():
+                plan = explain(session, build_request(session, namespace, user_id, fields), user_id)
+                problems = check(plan, expected, index_names(session, expected), sort_allowed)
+                failed = failed or bool(problems)
+                status = "FAIL" if problems else "ok"
+                print(f"{name:<15}{status:<6}{plan['Execution Time']:>9.2f} ms  {'; '.join(problems)}")
+                if args.verbose or problems:
+                    print(json.dumps(plan["Plan"], indent=2))
+    finally:
+        if not args.keep:
+            with engine.begin() as conn:
+                conn.execute(text("DELETE FROM memories WHERE user_id = :user_id"), {"user_id": user_id})
+                conn.execute(text("DELETE FROM users WHERE id = :user_id"), {"user_id": user_id})
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Check and time the per-namespace counts kept by the memories_stats triggers.
+
+Seeds a throwaway user with --rows memories in one namespace, tagged from a
+pool of --tags tags, then updates and deletes some of them. Reports:
+
+- whether namespace_stats and tag_counts agree with counting the memories
+- EXPLAIN (ANALYZE) of the summary, tag facet and tag autocomplete lookups,
+  built by app.crud.memory_stats as the API runs them; a lookup fails if it
+  scans a table sequentially or sorts instead of reading an index in order.
+  Sequential scans are disabled while explaining, as the planner rightly
+  prefers them on the small tables of a fresh database; one still showing
+  means no index can serve the lookup
+- the time of each lookup against counting the namespace directly
+- the time of a --batch-rows INSERT with and without the insert trigger;
+  disabling it takes a brief exclusive lock on memories, so run this
+  against a development database
+
+    python scripts/bench/namespace_stats.py --rows 200000 --tags 2000
+
+Exits non-zero if the counts disagree or a lookup fails. The seeded rows
+are deleted afterwards.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from sqlalchemy import Select, select, text  # noqa: E402
+from sqlalchemy.engine import Connection  # noqa: E402
+
+from app.crud import memory_stats  # noqa: E402
+from app.db.database import engine  # noqa: E402
+from app.db.models import NamespaceStats  # noqa: E402
+
+NAMESPACE = "stats-bench"
+SORTS = {"Sort", "Incremental Sort"}
+
+INSERT_MEMORIES = text("""
+    INSERT INTO memories (user_id, uid, namespace, text, tags)
+    SELECT :user_id, :namespace, :namespace, 'stats bench note ' || g,
+           ARRAY['tag' || (g % :tags), 'tag' || ((g * 7) % :tags), 'bench']::varchar[]
+    FROM generate_series(:start, :start + :rows - 1) g
+""")
+
+# What the counts replace
+COUNT_MEMORIES = text("SELECT count(*) FROM memories WHERE user_id = :user_id AND uid = :uid AND namespace = :uid")
+COUNT_TAGS = text("""
+    SELECT tag, count(*) FROM memories m CROSS JOIN LATERAL (SELECT DISTINCT unnest(m.tags) AS tag) t
+    WHERE user_id = :user_id AND uid = :uid AND namespace = :uid
+    GROUP BY tag ORDER BY count(*) DESC, tag COLLATE "C" LIMIT 20
+""")
+
+STATS_MISMATCHES = text("""
+    SELECT
+        (SELECT memory_count FROM namespace_stats WHERE user_id = :user_id AND uid = :uid AND namespace = :uid)
+            IS DISTINCT FROM (SELECT count(*) FROM memories WHERE user_id = :user_id AND namespace = :uid),
+        (SELECT count(*) FROM (
+            (SELECT t.tag, count(*) FROM memories m CROSS JOIN LATERAL (SELECT DISTINCT unnest(m.tags) AS tag) t
+             WHERE m.user_id = :user_id AND m.namespace = :uid GROUP BY t.tag
+             EXCEPT SELECT tag, memory_count FROM tag_counts WHERE user_id = :user_id AND namespace = :uid)
+            UNION ALL
+            (SELECT tag, memory_count FROM tag_counts WHERE user_id = :user_id AND namespace = :uid
+             EXCEPT SELECT t.tag, count(*) FROM memories m CROSS JOIN LATERAL (SELECT DISTINCT unnest(m.tags) AS tag) t
+             WHERE m.user_id = :user_id AND m.namespace = :uid GROUP BY t.tag)
+        ) d),
+        (SELECT tag_count FROM namespace_stats WHERE user_id = :user_id AND uid = :uid AND namespace = :uid)
+            IS DISTINCT FROM (SELECT count(*) FROM tag_counts WHERE user_id = :user_id AND namespace = :uid)
+""")
+
+
+class Capture:
+    """Stands in for an AsyncSession to get the statement a crud function would run."""
+
+    def __init__(self) -> None:
+        self.statement: Select = None  # type: ignore
+
+    async def scalars(self, statement: Select) -> list:
+        self.statement = statement
+        return Capture.Empty()
+
+    class Empty:
+        def all(self) -> list:
+            return []
+
+
+def lookups(user_id: int) -> dict[str, Select]:
+    statements = {
+        "summary": select(NamespaceStats).where(
+            NamespaceStats.user_id == user_id, NamespaceStats.uid == NAMESPACE, NamespaceStats.namespace == NAMESPACE
+        ),
+    }
+    for name, call in (
+        ("facets", lambda db: memory_stats.get_tag_counts(db, user_id, NAMESPACE, NAMESPACE, 20)),
+        ("complete", lambda db: memory_stats.complete_tags(db, user_id, NAMESPACE, NAMESPACE, "tag12", 10)),
+    ):
+        capture = Capture()
+        asyncio.run(call(capture))
+        statements[name] = capture.statement
+    return statements
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(conn: Connection, statement: Select) -> dict:
+    compiled = statement.compile(dialect=engine.dialect)
+    conn.execute(text("SET enable_seqscan = off"))
+    try:
+        plan = conn.exec_driver_sql(
+            f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {compiled}", compiled.params
+        ).scalar_one()
+    finally:
+        conn.execute(text("RESET enable_seqscan"))
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]
+
+
+def problems(plan: dict) -> list[str]:
+    found = []
+    for node in plan_nodes(plan["Plan"]):
+        if node["Node Type"] == "Seq Scan":
+            found.append(f"sequential scan on {node['Relation Name']}")
+        if node["Node Type"] in SORTS:
+            found.append(f"{node['Node Type']} on {', '.join(node.get('Sort Key', []))}")
+    return found
+
+
+def timed(conn: Connection, statement, params: dict, repeat: int = 5) -> float:
+    """Best of repeat runs, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(statement, params).all()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def insert_ms(user_id: int, rows: int, tags: int, trigger: bool) -> float:
+    """Time of inserting rows memories, rolled back afterwards."""
+    with engine.connect() as conn:
+        if not trigger:
+            conn.execute(text("ALTER TABLE memories DISABLE TRIGGER memories_stats_insert"))
+        started = time.perf_counter()
+        conn.execute(INSERT_MEMORIES, {
+            "user_id": user_id, "namespace": NAMESPACE + "-batch", "tags": tags, "start": 1, "rows": rows,
+        })
+        elapsed = (time.perf_counter() - started) * 1000
+        conn.rollback()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--tags", type=int, default=2000, help="distinct tags in the namespace")
+    parser.add_argument("--batch-rows", type=int, default=10_000)
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        user_id = conn.execute(text(
+            "INSERT INTO users (email, name, password_hash) VALUES (:email, 'stats bench', '-') RETURNING id"
+        ), {"email": f"stats-{uuid.uuid4().hex[:8]}@example.invalid"}).scalar_one()
+
+    failed = False
+    try:
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT")
+            params = {"user_id": user_id, "namespace": NAMESPACE, "tags": args.tags}
+            # Several statements, so the counts are added to rather than only created
+            chunk = max(args.rows // 4, 1)
+            for start in range(1, args.rows + 1, chunk):
+                conn.execute(INSERT_MEMORIES, {**params, "start": start, "rows": min(chunk, args.rows - start + 1)})
+            conn.execute(text(
+                "UPDATE memories SET tags = tags[2:] WHERE user_id = :user_id AND id % 10 = 0"
+            ), {"user_id": user_id})
+            conn.execute(text("DELETE FROM memories WHERE user_id = :user_id AND id % 10 = 1"), {"user_id": user_id})
+            conn.execute(text("ANALYZE memories"))
+            conn.execute(text("ANALYZE namespace_stats"))
+            conn.execute(text("ANALYZE tag_counts"))
+
+            key = {"user_id": user_id, "uid": NAMESPACE}
+            memories_wrong, tags_wrong, tag_count_wrong = conn.execute(STATS_MISMATCHES, key).one()
+            failed = memories_wrong or bool(tags_wrong) or tag_count_wrong
+            print(f"counts {'FAIL' if failed else 'ok'}: memory_count {'wrong' if memories_wrong else 'right'}, "
+                  f"{tags_wrong} tag counts wrong, tag_count {'wrong' if tag_count_wrong else 'right'}")
+
+            for name, statement in lookups(user_id).items():
+                plan = explain(conn, statement)
+                found = problems(plan)
+                failed = failed or bool(found)
+                print(f"{name:<10}{'FAIL' if found else 'ok':<6}{plan['Execution Time']:>9.3f} ms  {'; '.join(found)}")
+                if found:
+                    print(json.dumps(plan["Plan"], indent=2))
+
+            print(f"count(*) of the namespace    {timed(conn, COUNT_MEMORIES, key):9.1f} ms")
+            print(f"top 20 tags by unnest(tags)  {timed(conn, COUNT_TAGS, key):9.1f} ms")
+
+        with_trigger = insert_ms(user_id, args.batch_rows, args.tags, trigger=True)
+        without = insert_ms(user_id, args.batch_rows, args.tags, trigger=False)
+        print(f"insert {args.batch_rows} rows: {with_trigger:.0f} ms with the trigger, {without:.0f} ms without "
+              f"(+{(with_trigger - without) / without:.0%})")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM memories WHERE user_id = :user_id"), {"user_id": user_id})
+            conn.execute(text("DELETE FROM users WHERE id = :user_id"), {"user_id": user_id})
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Recall and running time of near-duplicate grouping with MinHash LSH.
+
+Generates synthetic memories, a share of them rewordings of an earlier one
+(a word dropped, "the" added, case changed), and groups them with
+app.services.near_duplicates.clusters. Reports:
+
+- pair recall: the share of pairs at least --threshold alike, by exact
+  all-pairs comparison, that ended up in the same group
+- pair precision: the share of pairs grouped together that are at least
+  --threshold alike (chained groups lower it)
+- seconds to group --rows memories and, for scale, to compare every pair of
+  the --exact-rows sample exactly
+
+Needs no database.
+
+    python scripts/bench/near_duplicates.py --rows 50000 --exact-rows 2000
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from app.services.near_duplicates import clusters, shingles, similarity  # noqa: E402
+
+WORDS = (
+    "user prefers dark mode light theme editor meeting monday friday coffee tea project deadline "
+    "budget travel flight hotel doctor recipe garden podcast deploy review family allergy report "
+    "design python invoice holiday schedule notes concise answers react app"
+).split()
+
+
+def reword(text: str, rng: random.Random) -> str:
+    words = text.split()
+    change = rng.choice(("drop", "the", "case"))
+    if change == "drop" and len(words) > 4:
+        del words[rng.randrange(len(words))]
+    elif change == "the":
+        words.insert(rng.randrange(len(words) + 1), "the")
+    else:
+        words = [word.upper() if rng.random() < 0.3 else word for word in words]
+    return " ".join(words)
+
+
+def corpus(rows: int, rewordings: float, rng: random.Random) -> list[str]:
+    texts: list[str] = []
+    for _ in range(rows):
+        if texts and rng.random() < rewordings:
+            texts.append(reword(rng.choice(texts), rng))
+        else:
+            texts.append(" ".join(rng.sample(WORDS, rng.randint(5, 9))))
+    return texts
+
+
+def grouped_pairs(groups: list[list[int]]) -> set[tuple[int, int]]:
+    return {pair for group in groups for pair in itertools.combinations(group, 2)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--exact-rows", type=int, default=2000)
+    parser.add_argument("--rewordings", type=float, default=0.2, help="share of memories that reword another")
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    # Quality against exact all-pairs comparison, on a sample small enough for it
+    sample = corpus(args.exact_rows, args.rewordings, rng)
+    started = time.perf_counter()
+    sets = [shingles(text) for text in sample]
+    similar = {
+        (i, j) for i, j in itertools.combinations(range(len(sample)), 2)
+        if similarity(sets[i], sets[j]) >= args.threshold
+    }
+    exact_seconds = time.perf_counter() - started
+    found = grouped_pairs(clusters(sample, args.threshold))
+    recall = len(similar & found) / len(similar) if similar else 1.0
+    precision = len(similar & found) / len(found) if found else 1.0
+
+    texts = corpus(args.rows, args.rewordings, rng)
+    started = time.perf_counter()
+    groups = clusters(texts, args.threshold)
+    lsh_seconds = time.perf_counter() - started
+
+    print(f"threshold {args.threshold}, {args.rewordings:.0%} rewordings")
+    print(f"{args.exact_rows} memories: {len(similar)} similar pairs, "
+          f"pair recall {recall:.3f}, pair precision {precision:.3f}, all-pairs {exact_seconds:.1f} s")
+    print(f"{args.rows} memories: {len(groups)} groups in {lsh_seconds:.1f} s with LSH "
+          f"(all-pairs would take ~{exact_seconds * (args.rows / args.exact_rows) ** 2:.0f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Query latency on a plain versus a hash-partitioned memories table.
+
+Builds two scratch tables with the same synthetic data and the same indexes
+as memories (one plain, one PARTITION BY HASH (namespace)), then times the
+three tenant query shapes of query_memories against random namespaces:
+newest first, full-text ranked and tag filtered. Tenant sizes are skewed so
+a few namespaces are large, as in production. The tables are dropped at the
+end unless --keep is given.
+
+    python scripts/bench/partitioning.py --rows 10000000 --partitions 16
+
+Building 10M rows takes a while and roughly 15 GB of disk for both copies.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from sqlalchemy import text  # noqa: E402
+
+from app.db.database import engine  # noqa: E402
+
+FLAT = "bench_memories_flat"
+HASHED = "bench_memories_hash"
+
+WORDS = (
+    "coffee tea project deadline meeting travel budget preference dark mode react python "
+    "invoice holiday family doctor gym recipe garden music podcast"
+).split()
+
+COLUMNS = """
+    id bigint NOT NULL,
+    user_id integer,
+    uid varchar(255) NOT NULL,
+    namespace varchar(255) NOT NULL,
+    text text NOT NULL,
+    tags varchar[] NOT NULL,
+    created_by varchar(255),
+    search_vector tsvector,
+    created_at timestamptz,
+    updated_at timestamptz
+"""
+
+INDEXES = (
+    "CREATE INDEX ON {table} (uid, namespace)",
+    "CREATE INDEX ON {table} (namespace)",
+    "CREATE INDEX ON {table} (created_at)",
+    "CREATE INDEX ON {table} USING gin (tags)",
+    "CREATE INDEX ON {table} USING gin (search_vector)",
+)
+
+QUERIES = {
+    "newest": (
+        "SELECT * FROM {table} WHERE uid = :ns AND namespace = :ns "
+        "ORDER BY created_at DESC, id DESC LIMIT 10"
+    ),
+    "fts": (
+        "SELECT *, ts_rank(search_vector, q) AS rank FROM {table}, plainto_tsquery('english', :term) q "
+        "WHERE uid = :ns AND namespace = :ns AND search_vector @@ q "
+        "ORDER BY rank DESC, id DESC LIMIT 10"
+    ),
+    "tags": (
+        "SELECT * FROM {table} WHERE uid = :ns AND namespace = :ns AND tags && CAST(:tags AS varchar[]) "
+        "ORDER BY created_at DESC, id DESC LIMIT 10"
+    ),
+}
+
+
+def build(conn, rows: int, namespaces: int, partitions: int) -> None:
+    words = "ARRAY[" + ",".join(f"'{word}'" for word in WORDS) + "]"
+    n = len(WORDS)
+
+    conn.execute(text(f"DROP TABLE IF EXISTS {FLAT}, {HASHED} CASCADE"))
+    conn.execute(text(f"CREATE TABLE {FLAT} ({COLUMNS}, PRIMARY KEY (id))"))
+    conn.execute(text(f"CREATE TABLE {HASHED} ({COLUMNS}, PRIMARY KEY (id, namespace)) PARTITION BY HASH (namespace)"))
+    for remainder in range(partitions):
+        conn.execute(text(
+            f"CREATE TABLE {HASHED}_p{remainder} PARTITION OF {HASHED} "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        ))
+
+    started = time.perf_counter()
+    # Skewed tenants: namespace k gets roughly 1/k^(2/3) of the rows
+    conn.execute(text(f"""
+        INSERT INTO {FLAT}
+        SELECT g, 1, ns, ns, body, tags, 'bench',
+               to_tsvector('english', body || ' ' || array_to_string(tags, ' ')),
+               now() - g * interval '1 second', now() - g * interval '1 second'
+        FROM (
+            SELECT g,
+                   'ns' || floor(:namespaces * power(random(), 3))::int AS ns,
+                   array_to_string(ARRAY[
+                       w[1 + (g * 7) % {n}], w[1 + (g * 13) % {n}], w[1 + (g * 17) % {n}],
+                       w[1 + (g * 23) % {n}], w[1 + (g * 29) % {n}]
+                   ], ' ') || ' note ' || g AS body,
+                   ARRAY[w[1 + g % {n}], w[1 + (g / 3) % {n}]]::varchar[] AS tags
+            FROM generate_series(1, :rows) g, (SELECT {words} AS w) words
+        ) s
+    """), {"rows": rows, "namespaces": namespaces})
+    conn.execute(text(f"INSERT INTO {HASHED} SELECT * FROM {FLAT}"))
+    print(f"loaded {rows} rows twice in {time.perf_counter() - started:.0f}s")
+
+    started = time.perf_counter()
+    for table in (FLAT, HASHED):
+        for index in INDEXES:
+            conn.execute(text(index.format(table=table)))
+        conn.execute(text(f"ANALYZE {table}"))
+    print(f"indexed in {time.perf_counter() - started:.0f}s")
+
+
+def index_size(conn, table: str) -> int:
+    return conn.execute(text(
+        "SELECT sum(pg_indexes_size(oid)) FROM pg_class WHERE oid = CAST(:table AS regclass) "
+        "OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = CAST(:table AS regclass))"
+    ), {"table": table}).scalar_one()
+
+
+def measure(conn, table: str, sample: list[str], term_tags: list[tuple[str, str]]) -> dict[str, list[float]]:
+    timings: dict[str, list[float]] = {name: [] for name in QUERIES}
+    for ns, (term, tag) in zip(sample, term_tags):
+        for name, sql in QUERIES.items():
+            started = time.perf_counter()
+            conn.execute(text(sql.format(table=table)), {"ns": ns, "term": term, "tags": [tag]}).all()
+            timings[name].append(time.perf_counter() - started)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--namespaces", type=int, default=10_000)
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=300, help="namespaces sampled per table")
+    parser.add_argument("--reuse", action="store_true", help="skip building, use tables from a --keep run")
+    parser.add_argument("--keep", action="store_true", help="don't drop the tables afterwards")
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not args.reuse:
+            build(conn, args.rows, args.namespaces, args.partitions)
+
+        namespaces = conn.execute(text(f"SELECT DISTINCT namespace FROM {FLAT}")).scalars().all()
+        rng = random.Random(42)
+        sample = [rng.choice(namespaces) for _ in range(args.queries)]
+        term_tags = [(rng.choice(WORDS), rng.choice(WORDS)) for _ in sample]
+
+        # Warm both tables the same way before timing
+        for table in (FLAT, HASHED):
+            measure(conn, table, sample[:20], term_tags[:20])
+
+        print(f"{'table':<22}{'query':<8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for table in (FLAT, HASHED):
+            for name, timings in measure(conn, table, sample, term_tags).items():
+                q = statistics.quantiles(timings, n=100)
+                print(f"{table:<22}{name:<8}{q[49] * 1000:>9.2f}{q[94] * 1000:>9.2f}{q[98] * 1000:>9.2f}")
+        for table in (FLAT, HASHED):
+            print(f"{table} index size: {index_size(conn, table) / 2**20:.0f} MiB")
+
+        if not args.keep:
+            conn.execute(text(f"DROP TABLE {FLAT}, {HASHED} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
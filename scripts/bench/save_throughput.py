@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Memory write throughput benchmark.
+
+Calls app.crud.memory.create_memory directly against the configured
+database with a fixed number of concurrent sessions, so the numbers reflect
+round trips and transactions per save rather than HTTP overhead. The rows it
+writes are deleted afterwards.
+
+    python scripts/bench/save_throughput.py -c 8 -d 10
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from sqlalchemy import delete  # noqa: E402
+
+from app.crud.memory import create_memory  # noqa: E402
+from app.db.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.db.models import Memory  # noqa: E402
+from app.schemas.memory import MemoryCreateRequest  # noqa: E402
+
+WORDS = "dark mode project react deadline meeting coffee preference travel budget".split()
+
+
+async def worker(uid: str, deadline: float, latencies: list[float]) -> None:
+    i = 0
+    async with AsyncSessionLocal() as db:
+        while time.perf_counter() < deadline:
+            text = " ".join(WORDS[(i + j) % len(WORDS)] for j in range(8))
+            request = MemoryCreateRequest(uid=uid, namespace=uid, text=text, tags=[WORDS[i % len(WORDS)]])
+            started = time.perf_counter()
+            await create_memory(db, request)
+            latencies.append(time.perf_counter() - started)
+            i += 1
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="seconds")
+    args = parser.parse_args()
+
+    uid = f"bench-{uuid.uuid4().hex[:8]}"
+    latencies: list[float] = []
+    deadline = time.perf_counter() + args.duration
+    try:
+        await asyncio.gather(*(worker(uid, deadline, latencies) for _ in range(args.concurrency)))
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Memory).where(Memory.uid == uid))
+            await db.commit()
+        await async_engine.dispose()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"concurrency:  {args.concurrency}")
+    print(f"saves:        {len(latencies)}")
+    print(f"throughput:   {len(latencies) / args.duration:.1f} saves/s")
+    print(f"latency p50:  {quantiles[49] * 1000:.2f} ms")
+    print(f"latency p99:  {quantiles[98] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Recall and latency of keyword, semantic and hybrid memory search.
+
+Needs semantic search enabled (EMBEDDING_DIMENSIONS set and the embedding
+column added). Seeds a throwaway namespace with synthetic memories, then
+asks for each of a sample of them with a paraphrase: three of its words,
+inflected differently ("meeting" as "meetings", "prefer" as "preferring").
+Reports, for each retrieval mode through query_memories:
+
+- precision@k: the share of results that contain all three words asked
+  for, in any form (many memories do, so which one was paraphrased
+  doesn't matter)
+- recall@k (semantic only): overlap of the HNSW results with the exact
+  k nearest neighbours, computed with NumPy over the same embeddings
+- p50 / p95 latency of the query
+
+The seeded rows are deleted afterwards.
+
+    python scripts/bench/semantic_search.py --rows 20000 --queries 200 -k 10
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import numpy as np  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.crud.memory import copy_memories, query_memories  # noqa: E402
+from app.db.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.db.models import Memory  # noqa: E402
+from app.schemas.memory import MemoryQueryRequest  # noqa: E402
+from app.services.embeddings import embedding_text, get_embedder  # noqa: E402
+
+# Word as stored: word as asked for
+VARIANTS = {
+    "prefer": "preferring", "meeting": "meetings", "travel": "travelling", "deadline": "deadlines",
+    "budget": "budgeting", "coffee": "coffees", "project": "projects", "editor": "editors",
+    "dark": "darker", "schedule": "scheduled", "invoice": "invoices", "holiday": "holidays",
+    "doctor": "doctors", "recipe": "recipes", "garden": "gardening", "podcast": "podcasts",
+    "deploy": "deployment", "review": "reviewing", "family": "families", "allergy": "allergies",
+    "flight": "flights", "report": "reporting", "design": "designer", "python": "pythonic",
+}
+WORDS = list(VARIANTS)
+MODES = ("keyword", "semantic", "hybrid")
+
+
+def corpus(rows: int, words_per_memory: int, rng: random.Random) -> list[str]:
+    return [" ".join(rng.sample(WORDS, words_per_memory)) + f" note {i}" for i in range(rows)]
+
+
+def paraphrase(text: str, rng: random.Random) -> tuple[str, set[str]]:
+    words = rng.sample([word for word in text.split() if word in VARIANTS], 3)
+    return " ".join(VARIANTS[word] for word in words), set(words)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--words", type=int, default=6, help="vocabulary words per memory")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not settings.embedding_dimensions:
+        sys.exit("❌ Semantic search is not enabled (EMBEDDING_DIMENSIONS is 0)")
+
+    rng = random.Random(args.seed)
+    uid = f"bench-{uuid.uuid4().hex[:8]}"
+    texts = corpus(args.rows, args.words, rng)
+    try:
+        async with AsyncSessionLocal() as db:
+            ids = []
+            for start in range(0, len(texts), 5000):
+                ids += await copy_memories(db, [
+                    {"user_id": None, "uid": uid, "namespace": uid, "text": body, "tags": [], "created_by": "bench"}
+                    for body in texts[start:start + 5000]
+                ])
+            await db.commit()
+
+            # The vectors the rows were stored with, for the exact neighbours
+            vectors = get_embedder().embed([embedding_text(body, []) for body in texts])
+            ids = np.array(ids)
+
+            relevant = {mode: 0 for mode in MODES}
+            latencies = {mode: [] for mode in MODES}
+            overlap = 0
+            for source in rng.sample(range(args.rows), args.queries):
+                query, words = paraphrase(texts[source], rng)
+                for mode in MODES:
+                    request = MemoryQueryRequest(uid=uid, namespace=uid, query=query, retrieval=mode, limit=args.k)
+                    started = time.perf_counter()
+                    rows, _, _, _ = await query_memories(db, request)
+                    latencies[mode].append(time.perf_counter() - started)
+                    await db.rollback()
+
+                    relevant[mode] += sum(words <= set(row.text.split()) for row in rows)
+                    found = [row.id for row in rows]
+                    if mode == "semantic":
+                        similarity = vectors @ get_embedder().embed([query])[0]
+                        exact = ids[np.argsort(-similarity, kind="stable")[:args.k]]
+                        overlap += len(set(found) & set(exact.tolist()))
+
+        print(f"{args.rows} memories, {args.queries} paraphrased queries, k={args.k}, "
+              f"semantic_candidates={settings.semantic_candidates}")
+        print(f"{'mode':<10}{'precision@k':>13}{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}")
+        for mode in MODES:
+            quantiles = statistics.quantiles(latencies[mode], n=100)
+            recall = f"{overlap / (args.queries * args.k):.3f}" if mode == "semantic" else "-"
+            print(f"{mode:<10}{relevant[mode] / (args.queries * args.k):>13.3f}{recall:>10}"
+                  f"{quantiles[49] * 1000:>9.1f}{quantiles[94] * 1000:>9.1f}")
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Memory).where(Memory.uid == uid))
+            await db.commit()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Per-row cost of the memory query read path, before and after projection.
+
+Seeds one page of memories, then times both halves of a query response
+per row:
+
+- fetch: loading full Memory ORM objects (search_vector included) versus
+  the MEMORY_COLUMNS rows query_memories returns now
+- serialize: copying ORM objects into MemoryData, wrapping them in
+  MemoryListResponse and putting that through the response model the way
+  FastAPI does (dump, validate, dump to JSON) versus
+  render_memory_list rendering the rows with orjson, as the endpoints do
+
+The seeded rows are deleted afterwards.
+
+    python scripts/bench/serialization.py --rows 100 --repeat 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pydantic import TypeAdapter  # noqa: E402
+from sqlalchemy import delete, select  # noqa: E402
+
+from app.crud.memory import create_memories, query_memories  # noqa: E402
+from app.db.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.db.models import Memory  # noqa: E402
+from app.schemas.memory import MemoryCreateRequest, MemoryData, MemoryListResponse, MemoryQueryRequest  # noqa: E402
+from app.utils.responses import render_memory_list  # noqa: E402
+
+WORDS = "dark mode project react deadline meeting coffee preference travel budget".split()
+
+response_model = TypeAdapter(MemoryListResponse)
+
+
+async def fetch_orm(db, request: MemoryQueryRequest) -> list[Memory]:
+    # The query as it was before projection: whole entities, identity map and all
+    query = (
+        select(Memory)
+        .where(Memory.uid == request.uid, Memory.namespace == request.namespace)
+        .order_by(Memory.created_at.desc(), Memory.id.desc())
+        .limit(request.limit + 1)
+    )
+    memories = (await db.execute(query)).scalars().all()[:request.limit]
+    db.expunge_all()
+    return memories
+
+
+def serialize_orm(memories: list[Memory]) -> bytes:
+    content = MemoryListResponse(
+        data=[
+            MemoryData(
+                id=memory.id,
+                uid=memory.uid,
+                namespace=memory.namespace,
+                text=memory.text,
+                tags=memory.tags,
+                created_by=memory.created_by,
+                created_at=memory.created_at,
+                updated_at=memory.updated_at,
+            )
+            for memory in memories
+        ],
+        success=True,
+    )
+    # response_model handling: dump the returned model, validate the dump,
+    # serialize the validated copy
+    validated = response_model.validate_python(content.model_dump())
+    return json.dumps(response_model.dump_python(validated, mode="json")).encode()
+
+
+def serialize_rows(rows) -> bytes:
+    return render_memory_list(rows)
+
+
+async def timed(repeat: int, rows: int, fn, *args) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(*args)
+        if asyncio.iscoroutine(result):
+            await result
+    return (time.perf_counter() - started) / repeat / rows * 1e6
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100, help="memories per page (at most 100)")
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    uid = f"bench-{uuid.uuid4().hex[:8]}"
+    request = MemoryQueryRequest(uid=uid, limit=args.rows)
+    try:
+        async with AsyncSessionLocal() as db:
+            await create_memories(db, [
+                MemoryCreateRequest(
+                    uid=uid,
+                    namespace=uid,
+                    text=" ".join(WORDS[(i + j) % len(WORDS)] for j in range(12)) + f" #{i}",
+                    tags=[WORDS[i % len(WORDS)], WORDS[(i + 3) % len(WORDS)]],
+                    created_by="bench",
+                )
+                for i in range(args.rows)
+            ])
+
+            memories = await fetch_orm(db, request)
+            rows, _, _, _ = await query_memories(db, request)
+            assert json.loads(serialize_orm(memories)) == json.loads(serialize_rows(rows))
+
+            async def fetch_rows():
+                await query_memories(db, request)
+
+            results = {
+                "fetch": (
+                    await timed(args.repeat, args.rows, fetch_orm, db, request),
+                    await timed(args.repeat, args.rows, fetch_rows),
+                ),
+                "serialize": (
+                    await timed(args.repeat, args.rows, serialize_orm, memories),
+                    await timed(args.repeat, args.rows, serialize_rows, rows),
+                ),
+            }
+
+        print(f"{args.rows} rows per page, {args.repeat} pages")
+        print(f"{'us per row':<12}{'ORM+pydantic':>14}{'rows+orjson':>14}{'speedup':>9}")
+        for name, (before, after) in results.items():
+            print(f"{name:<12}{before:>14.2f}{after:>14.2f}{before / after:>8.1f}x")
+        before, after = (sum(side) for side in zip(*results.values()))
+        print(f"{'total':<12}{before:>14.2f}{after:>14.2f}{before / after:>8.1f}x")
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Memory).where(Memory.uid == uid))
+            await db.commit()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
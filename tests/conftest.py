@@ -0,0 +1,100 @@
+"""
+Shared fixtures.
+
+Tests that need Postgres (migrated to head) or Redis are skipped when they
+can't be reached, so the pure unit tests run anywhere.
+"""
+
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from redis import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.config import settings
+from app.crud.api_tokens import create_api_token
+from app.crud.users import create_user
+from app.db.database import AsyncSessionLocal, async_engine, engine
+from app.main import app as application
+from app.services.redis_client import close_redis
+from app.utils.security import generate_api_token
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def database() -> None:
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except OperationalError:
+        pytest.skip("PostgreSQL is not available")
+
+
+@pytest.fixture(scope="session")
+def redis_server() -> None:
+    try:
+        Redis.from_url(settings.redis_url, socket_timeout=1).ping()
+    except (RedisError, OSError):
+        pytest.skip("Redis is not available")
+
+
+@pytest.fixture
+async def db(database, redis_server):
+    """Session for async tests; the pools are closed with the test's event loop."""
+    async with AsyncSessionLocal() as session:
+        yield session
+    await close_redis()
+    await async_engine.dispose()
+
+
+@pytest.fixture
+async def redis(redis_server):
+    """Redis for async tests that don't touch the database."""
+    yield
+    await close_redis()
+
+
+@pytest.fixture
+def client(database, redis_server):
+    with TestClient(application) as c:
+        yield c
+
+
+@pytest.fixture
+def ai_user(client) -> dict:
+    """A freshly registered AI user: uid, namespace and token."""
+    uid = f"test-{uuid.uuid4().hex[:12]}"
+    response = client.get("/api/v1/ai/register", params={"namespace": "tests", "uid": uid})
+    assert response.status_code == 200
+    data = response.json()["data"]
+    return {"uid": uid, "namespace": "tests", "token": data["token"]}
+
+
+@pytest.fixture
+def web_user(client) -> dict:
+    """A freshly registered web user: id and Authorization headers."""
+    email = f"test-{uuid.uuid4().hex[:12]}@example.com"
+    response = client.post("/api/v1/auth/register", json={"email": email, "password": "secret-password"})
+    assert response.status_code == 200
+    data = response.json()["data"]
+    return {"id": data["user"]["id"], "headers": {"Authorization": f"Bearer {data['token']}"}}
+
+
+@pytest.fixture
+async def user(db):
+    """A user created directly through the CRUD layer."""
+    return await create_user(db, f"test-{uuid.uuid4().hex[:12]}@example.com", "secret-password")
+
+
+@pytest.fixture
+async def api_token(db, user):
+    """An API token of user, created directly through the CRUD layer."""
+    return await create_api_token(db, user.id, "test", generate_api_token())
+
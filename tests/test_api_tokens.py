@@ -0,0 +1,112 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import bcrypt
+import pytest
+from sqlalchemy import update
+
+from app.config import settings
+from app.crud import api_tokens
+from app.crud.api_tokens import create_api_token, get_token_by_value
+from app.db.models import ApiToken
+from app.services.token_cache import token_cache
+from app.utils.security import api_token_prefix, digest_api_token, generate_api_token, hash_api_token
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+async def retire_legacy_tokens(db, user):
+    """Legacy rows left behind would be scanned by every later test."""
+    yield
+    await db.execute(
+        update(ApiToken).where(ApiToken.user_id == user.id, ApiToken.token_digest.is_(None)).values(is_active=False)
+    )
+    await db.commit()
+
+
+async def legacy_token(db, user, token_hash=None, last_used_at=None) -> tuple:
+    """A token as issued before prefix/digest lookup: only a bcrypt hash."""
+    token = generate_api_token()
+    api_token = ApiToken(
+        user_id=user.id,
+        token_name="legacy",
+        token_hash=token_hash or hash_api_token(token),
+        permissions={},
+        is_active=True,
+        last_used_at=last_used_at,
+    )
+    db.add(api_token)
+    await db.commit()
+    return token, api_token.id
+
+
+async def test_token_is_found_by_prefix_and_digest(db, user):
+    token = generate_api_token()
+    api_token = await create_api_token(db, user.id, "test", token)
+
+    found = await get_token_by_value(db, token)
+    assert found is not None and found.id == api_token.id
+    assert found.user.plan == user.plan
+
+    # Same prefix, different secret
+    forged = api_token_prefix(token) + "x" * (len(token) - len(api_token_prefix(token)))
+    assert await get_token_by_value(db, forged) is None
+
+
+async def test_legacy_tokens_are_not_scanned_by_default(db, user, monkeypatch):
+    monkeypatch.setattr(settings, "api_token_legacy_fallback", False)
+    token, _ = await legacy_token(db, user)
+
+    assert await get_token_by_value(db, token) is None
+
+
+async def test_legacy_token_is_upgraded_once_found(db, user, monkeypatch):
+    monkeypatch.setattr(settings, "api_token_legacy_fallback", True)
+    token, token_id = await legacy_token(db, user)
+
+    found = await get_token_by_value(db, token)
+    assert found is not None and found.id == token_id
+    assert found.token_hash is None
+    assert found.token_digest == digest_api_token(token)
+    # The miss cached before the scan is gone
+    assert await token_cache.get(found.token_digest) == (False, None)  # type: ignore
+
+    # From now on it is found without the scan
+    monkeypatch.setattr(settings, "api_token_legacy_fallback", False)
+    assert (await get_token_by_value(db, token)).id == token_id  # type: ignore
+
+
+async def test_legacy_token_behind_recently_used_ones_is_found(db, user, monkeypatch):
+    monkeypatch.setattr(settings, "api_token_legacy_fallback", True)
+    now = datetime.now(timezone.utc)
+    token, token_id = await legacy_token(db, user, last_used_at=now - timedelta(days=365))
+
+    # Cheap hashes of other tokens, all used more recently
+    decoy_hash = bcrypt.hashpw(b"another token", bcrypt.gensalt(4)).decode()
+    for _ in range(25):
+        await legacy_token(db, user, token_hash=decoy_hash, last_used_at=now)
+
+    found = await get_token_by_value(db, token)
+    assert found is not None and found.id == token_id
+
+
+async def test_legacy_scans_are_rate_limited(db, user, monkeypatch):
+    monkeypatch.setattr(settings, "api_token_legacy_fallback", True)
+    monkeypatch.setattr(settings, "api_token_legacy_scans_per_hour", 1)
+    monkeypatch.setattr(api_tokens, "LEGACY_SCAN_KEY", f"legacy-token-scan-{uuid.uuid4().hex}")
+    token, token_id = await legacy_token(db, user)
+
+    assert await get_token_by_value(db, generate_api_token()) is None
+    # Over the limit the scan doesn't run, and the token isn't cached as invalid
+    assert await get_token_by_value(db, token) is None
+    assert await token_cache.get(digest_api_token(token)) == (False, None)
+
+
+async def test_failed_legacy_scan_is_cached(db, user, monkeypatch):
+    monkeypatch.setattr(settings, "api_token_legacy_fallback", True)
+    await legacy_token(db, user)
+    token = generate_api_token()
+
+    assert await get_token_by_value(db, token) is None
+    assert await token_cache.get(digest_api_token(token)) == (True, None)
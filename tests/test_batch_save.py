@@ -0,0 +1,80 @@
+import uuid
+
+import orjson
+import pytest
+from sqlalchemy import select
+
+from app.config import settings
+from app.crud.memory import create_memories
+from app.db.models import Memory
+from app.schemas.memory import MemoryCreateRequest
+
+
+@pytest.fixture
+def namespace() -> str:
+    return f"batch-{uuid.uuid4().hex[:8]}"
+
+
+def items(namespace: str, *texts: str, tags=()) -> list:
+    return [MemoryCreateRequest(uid="u", namespace=namespace, text=text, tags=list(tags)) for text in texts]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("copy", [False, True], ids=["values", "copy"])
+async def test_ids_come_back_in_item_order(db, user, namespace, monkeypatch, copy):
+    monkeypatch.setattr(settings, "memory_batch_copy_threshold", 1 if copy else 10**6)
+    existing = (await create_memories(db, items(namespace, "existing", tags=["old"]), user_id=user.id))[0]
+
+    ids = await create_memories(
+        db, items(namespace, "first", "Existing", "second", "FIRST", tags=["new"]), user_id=user.id
+    )
+    assert len(set(ids)) == 3
+    assert ids[0] == ids[3]
+    assert ids[1] == existing
+
+    rows = (await db.execute(select(Memory.text, Memory.tags).where(Memory.id.in_(ids)).order_by(Memory.id))).all()
+    assert [(row.text, row.tags) for row in rows] == [("existing", ["old", "new"]), ("first", ["new"]), ("second", ["new"])]
+
+
+def test_batch_reports_each_item(client, ai_user):
+    uid, token = ai_user["uid"], ai_user["token"]
+    body = [{"uid": uid, "text": "one"}, {"uid": uid}, "not an object", {"uid": uid, "text": "two"}]
+
+    response = client.post("/api/v1/ai/memory/save/batch", params={"token": token}, json=body)
+    assert response.status_code == 200
+    data = response.json()
+    assert not data["success"]
+    assert (data["data"]["saved"], data["data"]["failed"]) == (2, 2)
+    items = data["data"]["items"]
+    assert [item["index"] for item in items] == [0, 1, 2, 3]
+    assert items[0]["id"] and items[3]["id"]
+    assert items[1]["error"].startswith("text") and items[2]["error"] == "Item must be an object"
+
+
+def test_batch_accepts_ndjson(client, ai_user):
+    lines = b"\n".join(orjson.dumps({"uid": ai_user["uid"], "text": f"line {i}"}) for i in range(3))
+
+    response = client.post(
+        "/api/v1/ai/memory/save/batch",
+        params={"token": ai_user["token"]},
+        content=lines,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.json()["data"]["saved"] == 3
+
+
+def test_oversized_batch_is_rejected(client, ai_user, monkeypatch):
+    monkeypatch.setattr(settings, "memory_batch_max_bytes", 10)
+    response = client.post("/api/v1/ai/memory/save/batch", params={"token": ai_user["token"]}, json=[{"text": "x" * 20}])
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("content_length", ["abc", "-5"])
+def test_malformed_content_length_is_rejected(client, ai_user, content_length):
+    response = client.post(
+        "/api/v1/ai/memory/save/batch",
+        params={"token": ai_user["token"]},
+        content=b'[{"text": "x"}]',
+        headers={"Content-Type": "application/json", "Content-Length": content_length},
+    )
+    assert response.status_code == 400
@@ -0,0 +1,85 @@
+import inspect
+import uuid
+
+import pytest
+from prometheus_client import REGISTRY
+from fastapi.routing import APIRoute
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.database import async_database_url, create_api_engine, get_db
+from app.main import app
+
+pytestmark = pytest.mark.anyio
+
+
+def test_async_database_url_uses_asyncpg():
+    assert async_database_url("postgresql://user:secret@db:5432/ajimemo") == (
+        "postgresql+asyncpg://user:secret@db:5432/ajimemo"
+    )
+    assert async_database_url("postgresql+psycopg2://postgres@/ajimemo?host=/tmp/pg").startswith(
+        "postgresql+asyncpg://postgres@/ajimemo?host="
+    )
+
+
+async def test_get_db_yields_an_async_session(db):
+    sessions = get_db()
+    session = await sessions.__anext__()
+    try:
+        assert isinstance(session, AsyncSession)
+        assert await session.scalar(text("SELECT 1")) == 1
+    finally:
+        await sessions.aclose()
+
+
+def test_endpoints_run_on_the_event_loop():
+    # A sync endpoint would block a threadpool worker on every query
+    sync = [route.path for route in app.routes if isinstance(route, APIRoute) and not inspect.iscoroutinefunction(route.endpoint)]
+    assert sync == []
+
+
+@pytest.fixture
+def pool_name() -> str:
+    return f"test-{uuid.uuid4().hex[:8]}"
+
+
+async def statement_timeout(engine) -> str:
+    async with engine.connect() as conn:
+        return await conn.scalar(text("SHOW statement_timeout"))
+
+
+async def test_engine_uses_configured_pool(database, pool_name, monkeypatch):
+    monkeypatch.setattr(settings, "db_pool_size", 3)
+    monkeypatch.setattr(settings, "db_max_overflow", 2)
+    monkeypatch.setattr(settings, "db_statement_timeout_ms", 1500)
+    engine = create_api_engine(settings.database_url, pool_name)
+    try:
+        assert engine.pool.size() == 3
+        assert engine.pool._max_overflow == 2  # type: ignore
+        assert await statement_timeout(engine) == "1500ms"
+
+        labels = {"pool": pool_name}
+        assert REGISTRY.get_sample_value("ajimemo_db_pool_size", labels) == 3
+        assert REGISTRY.get_sample_value("ajimemo_db_pool_acquire_seconds_count", labels) == 1
+    finally:
+        await engine.dispose()
+
+
+async def test_pgbouncer_mode_keeps_no_session_state(database, pool_name, monkeypatch):
+    monkeypatch.setattr(settings, "db_pgbouncer_mode", True)
+    monkeypatch.setattr(settings, "db_statement_timeout_ms", 2500)
+    engine = create_api_engine(settings.database_url, pool_name)
+    try:
+        connect_args = engine.dialect.create_connect_args(engine.url)[1]
+        assert "server_settings" not in connect_args
+        # Set per transaction instead
+        assert await statement_timeout(engine) == "2500ms"
+        # Statement names are never reused, so they can't clash on a shared server connection
+        query = "SELECT name FROM pg_prepared_statements"
+        async with engine.connect() as conn:
+            first = {name for name, in (await conn.exec_driver_sql(query)).all()}
+            second = {name for name, in (await conn.exec_driver_sql(query)).all()}
+        assert second - first
+    finally:
+        await engine.dispose()
@@ -0,0 +1,91 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.crud.memory import create_memory, query_memories
+from app.schemas.memory import MemoryCreateRequest, MemoryQueryRequest
+from app.services.embeddings import HashingEmbedder, SemanticSearchDisabledError, get_embedder
+
+
+class FixedProvider:
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    def embed(self, texts):
+        return np.ones((len(texts), self.dimensions), dtype=np.float32) / np.sqrt(self.dimensions)
+
+
+def make_provider(dimensions: int) -> FixedProvider:
+    return FixedProvider(dimensions)
+
+
+def make_wrong_provider(dimensions: int) -> FixedProvider:
+    return FixedProvider(dimensions + 1)
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    """Set embedding settings for get_embedder, which caches its provider."""
+    def configure(**values) -> None:
+        for name, value in values.items():
+            monkeypatch.setattr(settings, name, value)
+        get_embedder.cache_clear()
+
+    yield configure
+    get_embedder.cache_clear()
+
+
+def test_hashing_embeddings_are_normalised_and_deterministic():
+    embedder = HashingEmbedder(64)
+    vectors = embedder.embed(["Prefers dark mode", "Prefers dark mode", ""])
+
+    assert vectors.shape == (3, 64) and vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors[:2], axis=1), 1)
+    assert np.array_equal(vectors[0], vectors[1])
+    assert not vectors[2].any()
+
+
+def test_similar_texts_are_closer():
+    query, similar, unrelated = HashingEmbedder(256).embed(
+        ["preferring darker modes", "prefers dark mode", "booked a flight to Lisbon"]
+    )
+    assert query @ similar > query @ unrelated
+
+
+def test_disabled_without_dimensions(configure):
+    configure(embedding_dimensions=0)
+    with pytest.raises(SemanticSearchDisabledError):
+        get_embedder()
+
+
+def test_custom_provider(configure):
+    configure(embedding_dimensions=8, embedding_provider=f"{__name__}:make_provider")
+    assert isinstance(get_embedder(), FixedProvider)
+
+    configure(embedding_provider=f"{__name__}:make_wrong_provider")
+    with pytest.raises(RuntimeError, match="9-dimensional"):
+        get_embedder()
+
+
+@pytest.mark.skipif(settings.embedding_dimensions, reason="semantic search is enabled")
+def test_semantic_query_is_a_bad_request_when_disabled(client, ai_user):
+    params = {"uid": ai_user["uid"], "token": ai_user["token"], "query": "dark", "retrieval": "semantic"}
+    response = client.get("/api/v1/ai/memory/query", params=params)
+    assert response.status_code == 400
+    assert "not enabled" in response.json()["detail"]
+
+
+@pytest.mark.anyio
+@pytest.mark.skipif(not settings.embedding_dimensions, reason="semantic search is disabled")
+@pytest.mark.parametrize("retrieval", ["semantic", "hybrid"])
+async def test_semantic_search_finds_related_wording(db, user, retrieval):
+    namespace = f"semantic-{uuid.uuid4().hex[:8]}"
+    for text in ("prefers dark mode", "booked a flight to Lisbon"):
+        await create_memory(db, MemoryCreateRequest(uid="u", namespace=namespace, text=text), user_id=user.id)
+
+    request = MemoryQueryRequest(uid="u", namespace=namespace, query="preferring darker modes", retrieval=retrieval)
+    rows, _, search, _ = await query_memories(db, request, user_id=user.id)
+    assert rows[0].text == "prefers dark mode"
+    assert search.candidates >= 1  # type: ignore
@@ -0,0 +1,98 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from app.services import redis_client
+from app.services.idempotency import REPLAYED_HEADER, IdempotencyKeyError, run_idempotent
+
+
+def counting_run(bodies: list):
+    async def run() -> bytes:
+        bodies.append(f"body {len(bodies)}".encode())
+        return bodies[-1]
+    return run
+
+
+@pytest.fixture
+def key() -> str:
+    return uuid.uuid4().hex
+
+
+@pytest.mark.anyio
+async def test_retries_get_the_first_response(redis, key):
+    bodies: list = []
+    assert await run_idempotent(1, key, b"request", counting_run(bodies)) == (b"body 0", False)
+    assert await run_idempotent(1, key, b"request", counting_run(bodies)) == (b"body 0", True)
+    # Keys are per user
+    assert await run_idempotent(2, key, b"request", counting_run(bodies)) == (b"body 1", False)
+
+
+@pytest.mark.anyio
+async def test_key_reused_for_another_request_is_rejected(redis, key):
+    await run_idempotent(1, key, b"request", counting_run([]))
+    with pytest.raises(IdempotencyKeyError) as raised:
+        await run_idempotent(1, key, b"another request", counting_run([]))
+    assert raised.value.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_retry_while_running_is_turned_away(redis, key):
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow() -> bytes:
+        started.set()
+        await release.wait()
+        return b"done"
+
+    first = asyncio.create_task(run_idempotent(1, key, b"request", slow))
+    await started.wait()
+    with pytest.raises(IdempotencyKeyError) as raised:
+        await run_idempotent(1, key, b"request", slow)
+    assert raised.value.status_code == 409
+
+    release.set()
+    assert await first == (b"done", False)
+
+
+@pytest.mark.anyio
+async def test_failed_request_can_be_retried(redis, key):
+    async def fail() -> bytes:
+        raise RuntimeError("database down")
+
+    with pytest.raises(RuntimeError):
+        await run_idempotent(1, key, b"request", fail)
+    assert await run_idempotent(1, key, b"request", counting_run([])) == (b"body 0", False)
+
+
+@pytest.mark.anyio
+async def test_requests_run_normally_without_redis(redis, key, monkeypatch):
+    monkeypatch.setattr(redis_client, "_down_until", time.monotonic() + 60)
+    bodies: list = []
+    await run_idempotent(1, key, b"request", counting_run(bodies))
+    assert await run_idempotent(1, key, b"request", counting_run(bodies)) == (b"body 1", False)
+
+
+def test_saves_are_idempotent(client, ai_user):
+    # GET saves take the key as a parameter
+    params = {"uid": ai_user["uid"], "token": ai_user["token"], "text": "saved once", "idempotency_key": uuid.uuid4().hex}
+
+    first = client.get("/api/v1/ai/memory/save", params=params)
+    again = client.get("/api/v1/ai/memory/save", params=params)
+    assert first.status_code == again.status_code == 200
+    assert again.content == first.content
+    assert REPLAYED_HEADER not in first.headers and again.headers[REPLAYED_HEADER] == "true"
+
+    response = client.get("/api/v1/ai/memory/save", params={**params, "text": "something else"})
+    assert response.status_code == 422
+
+
+def test_batch_saves_are_idempotent(client, ai_user):
+    body = [{"uid": ai_user["uid"], "text": "batch saved once"}]
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+
+    first = client.post("/api/v1/ai/memory/save/batch", params={"token": ai_user["token"]}, json=body, headers=headers)
+    again = client.post("/api/v1/ai/memory/save/batch", params={"token": ai_user["token"]}, json=body, headers=headers)
+    assert again.content == first.content
+    assert again.headers[REPLAYED_HEADER] == "true"
@@ -0,0 +1,120 @@
+import asyncio
+import uuid
+
+import orjson
+import pytest
+from redis.asyncio import Redis
+
+from app.config import settings
+from app.jobs import job
+from app.jobs.queue import LocalJobQueue, RedisJobQueue, encode_job
+from app.jobs.worker import JobWorker, retry_delay
+
+calls: list = []
+
+
+@job(name="test_flaky", concurrency=2, max_attempts=3)
+async def flaky(n: int) -> None:
+    calls.append(("flaky", n))
+    if calls.count(("flaky", n)) < 2:
+        raise RuntimeError("first attempt fails")
+
+
+@job(name="test_broken", max_attempts=2)
+async def broken() -> None:
+    calls.append(("broken",))
+    raise RuntimeError("always fails")
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "jobs_retry_base", 0.01)
+    calls.clear()
+
+
+async def run_worker(queue, seconds: float = 0.5) -> None:
+    worker = JobWorker(queue, ["test_flaky", "test_broken"])
+    worker.start()
+    await asyncio.sleep(seconds)
+    await worker.stop(timeout=1)
+
+
+def test_retry_delay_grows_and_is_capped(monkeypatch):
+    monkeypatch.setattr(settings, "jobs_retry_base", 1.0)
+    monkeypatch.setattr(settings, "jobs_retry_max", 5.0)
+
+    assert 0.5 <= retry_delay(1) <= 1.0
+    assert 2.0 <= retry_delay(3) <= 4.0
+    assert 2.5 <= retry_delay(10) <= 5.0
+
+
+@pytest.mark.anyio
+async def test_local_jobs_are_retried_until_they_succeed_or_run_out():
+    queue = LocalJobQueue()
+    for n in range(3):
+        await queue.push("test_flaky", encode_job("test_flaky", {"n": n}))
+    await queue.push("test_broken", encode_job("test_broken", {}))
+
+    await run_worker(queue)
+
+    assert sorted(c for c in calls if c[0] == "flaky") == [("flaky", n) for n in range(3) for _ in range(2)]
+    assert calls.count(("broken",)) == 2
+    assert queue.pending() == 0
+
+
+def test_local_worker_restarts_on_a_new_event_loop():
+    queue = LocalJobQueue()
+
+    async def run() -> None:
+        await queue.push("test_flaky", encode_job("test_flaky", {"n": len(calls)}))
+        await run_worker(queue, seconds=0.2)
+
+    asyncio.run(run())
+    asyncio.run(run())
+    assert len(calls) == 4
+
+
+@pytest.fixture
+async def redis_queue(redis_server):
+    redis = Redis.from_url(settings.redis_url)
+    queue = RedisJobQueue(redis, f"test-{uuid.uuid4().hex[:8]}")
+    yield queue
+    for key in await redis.keys("ajimemo:jobs:test_*"):
+        await redis.delete(key)
+    await redis.aclose()
+
+
+@pytest.mark.anyio
+async def test_redis_jobs_are_acknowledged_retried_and_dead_lettered(redis_queue):
+    redis = redis_queue.redis
+    await redis.delete("ajimemo:jobs:test_flaky", "ajimemo:jobs:test_broken")
+    broken = encode_job("test_broken", {})
+    await redis_queue.push("test_flaky", encode_job("test_flaky", {"n": 1}))
+    await redis_queue.push("test_broken", broken)
+
+    # A consumer blocked on an empty ready list sees a retry when its poll ends
+    await run_worker(redis_queue, seconds=2.5)
+
+    assert calls.count(("flaky", 1)) == 2
+    assert calls.count(("broken",)) == 2
+    # Done, retried and dead jobs all leave the worker's processing lists
+    for job_type in ("test_flaky", "test_broken"):
+        assert await redis.llen(redis_queue._processing(job_type)) == 0
+        assert await redis.llen(redis_queue._ready(job_type)) == 0
+        assert await redis.zcard(redis_queue._delayed(job_type)) == 0
+    dead = [orjson.loads(payload) for payload in await redis.lrange("ajimemo:jobs:dead", 0, 10)]
+    assert {"id": orjson.loads(broken)["id"], "attempt": 2} in [{"id": d["id"], "attempt": d["attempt"]} for d in dead]
+
+
+@pytest.mark.anyio
+async def test_jobs_of_a_stopped_worker_are_recovered_in_order(redis_queue):
+    redis = redis_queue.redis
+    payloads = [encode_job("test_flaky", {"n": n}) for n in range(3)]
+    for payload in payloads:
+        await redis_queue.push("test_flaky", payload)
+    for _ in payloads:
+        assert await redis_queue.pop("test_flaky", timeout=0.1) is not None
+
+    # The worker died before acknowledging them
+    assert await redis_queue.recover(["test_flaky"]) == 3
+    assert [await redis_queue.pop("test_flaky", timeout=0.1) for _ in payloads] == payloads
@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.crud.api_tokens import bulk_touch_tokens
+from app.db.models import ApiToken
+from app.services.last_used import LastUsedBuffer
+
+NOW = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_record_keeps_newest_time_per_token():
+    buffer = LastUsedBuffer(flush_interval=60, max_pending=100)
+    buffer.record(1, NOW)
+    buffer.record(1, NOW - timedelta(minutes=5))
+    buffer.record(2, NOW - timedelta(minutes=5))
+    buffer.record(2, NOW)
+
+    assert buffer._pending == {1: NOW, 2: NOW}
+
+
+def test_buffer_restarts_on_a_new_event_loop():
+    buffer = LastUsedBuffer(flush_interval=60, max_pending=100)
+
+    async def run() -> None:
+        buffer.start()
+        await asyncio.sleep(0.01)  # until the flusher waits
+        await buffer.stop()
+
+    asyncio.run(run())
+    asyncio.run(run())
+
+
+@pytest.mark.anyio
+async def test_flush_never_moves_last_used_back(db, api_token):
+    token_id = api_token.id
+    await bulk_touch_tokens(db, {token_id: NOW})
+    await bulk_touch_tokens(db, {token_id: NOW - timedelta(hours=1)})
+
+    assert await db.scalar(select(ApiToken.last_used_at).where(ApiToken.id == token_id)) == NOW
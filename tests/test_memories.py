@@ -0,0 +1,139 @@
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event, select, update
+
+from app.config import settings
+from app.crud.memory import content_hash, create_memory, query_memories, update_memory
+from app.db.database import async_engine
+from app.db.models import Memory
+from app.schemas.memory import MemoryCreateRequest, MemoryQueryRequest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def namespace() -> str:
+    return f"memories-{uuid.uuid4().hex[:8]}"
+
+
+async def save(db, user, namespace: str, text: str, tags=()) -> Memory:
+    request = MemoryCreateRequest(uid="u", namespace=namespace, text=text, tags=list(tags))
+    return await create_memory(db, request, user_id=user.id)
+
+
+async def search(db, user, namespace: str, query: str, **kwargs) -> list:
+    request = MemoryQueryRequest(uid="u", namespace=namespace, query=query, **kwargs)
+    rows, _, _, _ = await query_memories(db, request, user_id=user.id)
+    return [row.text for row in rows]
+
+
+def test_content_hash_ignores_case_spacing_and_unicode_form():
+    assert content_hash("Prefers  dark mode\n") == content_hash("prefers dark MODE")
+    assert content_hash("ﬁle café") == content_hash("file cafe\u0301")
+    assert content_hash("prefers dark mode") != content_hash("prefers light mode")
+
+
+@contextmanager
+def count_statements():
+    statements: list = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+async def test_search_vector_covers_text_and_tags(db, user, namespace):
+    memory = await save(db, user, namespace, "Prefers dark mode", ["interface"])
+    assert await db.scalar(select(Memory.search_vector).where(Memory.id == memory.id)) is not None
+
+    assert await search(db, user, namespace, "dark") == ["Prefers dark mode"]
+    assert await search(db, user, namespace, "interface") == ["Prefers dark mode"]
+
+
+async def test_search_vector_follows_updates(db, user, namespace):
+    memory = await save(db, user, namespace, "Prefers dark mode")
+
+    await update_memory(db, memory.id, namespace, {"text": "Prefers light themes"}, user_id=user.id)  # type: ignore
+    assert await search(db, user, namespace, "dark") == []
+    assert await search(db, user, namespace, "light") == ["Prefers light themes"]
+
+    await update_memory(db, memory.id, namespace, {"tags": ["accessibility"]}, user_id=user.id)  # type: ignore
+    assert await search(db, user, namespace, "accessibility") == ["Prefers light themes"]
+
+
+async def test_save_is_one_statement(db, user, namespace):
+    with count_statements() as statements:
+        await save(db, user, namespace, "One round trip")
+    assert len(statements) == 1
+    assert statements[0].startswith("INSERT INTO memories")
+
+
+async def pages(db, user, namespace: str, **kwargs) -> list:
+    """Every page of a query, following next_cursor."""
+    result, cursor = [], None
+    while True:
+        request = MemoryQueryRequest(uid="u", namespace=namespace, limit=2, cursor=cursor, **kwargs)
+        rows, cursor, _, _ = await query_memories(db, request, user_id=user.id)
+        result.append([row.text for row in rows])
+        if cursor is None:
+            return result
+
+
+async def test_cursor_pages_cover_every_memory_once(db, user, namespace):
+    texts = [f"note {i}" for i in range(5)]
+    ids = [(await save(db, user, namespace, text)).id for text in texts]
+    # Ties on created_at are broken by id
+    await db.execute(update(Memory).where(Memory.id.in_(ids[1:4])).values(created_at=datetime.now(timezone.utc)))
+    await db.commit()
+
+    result = await pages(db, user, namespace)
+    assert [len(page) for page in result] == [2, 2, 1]
+    assert sorted(text for page in result for text in page) == texts
+
+
+async def test_search_cursor_pages_keep_rank_order(db, user, namespace):
+    for i in range(3):
+        await save(db, user, namespace, f"dark mode {i}" + " dark" * i)
+
+    result = await pages(db, user, namespace, query="dark")
+    assert [text for page in result for text in page] == ["dark mode 2 dark dark", "dark mode 1 dark", "dark mode 0"]
+
+
+def test_invalid_cursor_is_a_bad_request(client, ai_user):
+    params = {"uid": ai_user["uid"], "token": ai_user["token"], "cursor": "not a cursor"}
+    assert client.get("/api/v1/ai/memory/query", params=params).status_code == 400
+
+
+async def test_search_ranks_only_the_newest_matches(db, user, namespace, monkeypatch):
+    monkeypatch.setattr(settings, "search_candidate_cap", 3)
+    for i in range(5):
+        await save(db, user, namespace, f"dark mode {i}" + " dark" * (4 - i))  # older ones rank higher
+    await save(db, user, namespace, "light mode")
+
+    request = MemoryQueryRequest(uid="u", namespace=namespace, query="dark")
+    rows, _, search, _ = await query_memories(db, request, user_id=user.id)
+    assert sorted(row.text[:11] for row in rows) == ["dark mode 2", "dark mode 3", "dark mode 4"]
+    assert (search.candidate_cap, search.candidates, search.truncated) == (3, 3, True)  # type: ignore
+
+    request = MemoryQueryRequest(uid="u", namespace=namespace, query="light")
+    _, _, search, _ = await query_memories(db, request, user_id=user.id)
+    assert (search.candidates, search.truncated) == (1, False)  # type: ignore
+
+
+async def test_uncapped_search_ranks_every_match(db, user, namespace, monkeypatch):
+    monkeypatch.setattr(settings, "search_candidate_cap", 0)
+    for i in range(5):
+        await save(db, user, namespace, f"dark mode {i}")
+
+    request = MemoryQueryRequest(uid="u", namespace=namespace, query="dark")
+    rows, _, search, _ = await query_memories(db, request, user_id=user.id)
+    assert len(rows) == 5
+    assert (search.candidate_cap, search.truncated) == (None, False)  # type: ignore
@@ -0,0 +1,47 @@
+from app.crud.memory_stats import prefix_upper_bound
+
+
+def save(client, ai_user, text: str, tags: str) -> None:
+    params = {"uid": ai_user["uid"], "token": ai_user["token"], "text": text, "tags": tags}
+    assert client.get("/api/v1/ai/memory/save", params=params).status_code == 200
+
+
+def test_prefix_upper_bound():
+    assert prefix_upper_bound("work") == "worl"
+    assert prefix_upper_bound("a\ud7ff") == "a\ue000"
+    assert prefix_upper_bound("a\U0010ffff") == "b"
+    assert prefix_upper_bound("\U0010ffff") is None
+
+
+def test_stats_of_empty_namespace(client, ai_user):
+    response = client.get("/api/v1/ai/memory/stats", params={"uid": ai_user["uid"], "token": ai_user["token"]})
+    assert response.status_code == 200
+    assert response.json()["data"] == {
+        "uid": ai_user["uid"], "namespace": ai_user["uid"], "memory_count": 0, "tag_count": 0, "updated_at": None,
+    }
+
+
+def test_counts_follow_saves(client, ai_user):
+    save(client, ai_user, "first", "work,home")
+    save(client, ai_user, "second", "work,workout")
+    save(client, ai_user, "third", "work")
+
+    params = {"uid": ai_user["uid"], "token": ai_user["token"]}
+    data = client.get("/api/v1/ai/memory/stats", params=params).json()["data"]
+    assert (data["memory_count"], data["tag_count"]) == (3, 3)
+
+    tags = client.get("/api/v1/ai/memory/tags", params={**params, "limit": 2}).json()["data"]
+    assert tags == [{"tag": "work", "memory_count": 3}, {"tag": "home", "memory_count": 1}]
+
+
+def test_tag_completion(client, ai_user):
+    save(client, ai_user, "first", "work,workout,Work,walk")
+
+    params = {"uid": ai_user["uid"], "token": ai_user["token"]}
+    response = client.get("/api/v1/ai/memory/tags/complete", params={**params, "prefix": "wor"})
+    assert [tag["tag"] for tag in response.json()["data"]] == ["work", "workout"]
+
+    response = client.get("/api/v1/ai/memory/tags/complete", params={**params, "prefix": "wor", "limit": 1})
+    assert [tag["tag"] for tag in response.json()["data"]] == ["work"]
+
+    assert client.get("/api/v1/ai/memory/tags/complete", params={**params, "prefix": ""}).status_code == 422
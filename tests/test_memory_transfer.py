@@ -0,0 +1,65 @@
+import gzip
+import json
+import uuid
+
+import pytest
+
+from app.services.memory_transfer import _ndjson_lines, _StreamError
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def lines(data: bytes, size: int = 7) -> list[bytes]:
+    return [line async for line in _ndjson_lines(chunked(data, size))]
+
+
+@pytest.mark.anyio
+async def test_plain_and_gzipped_input_split_into_lines():
+    body = b'{"a": 1}\n{"b": 2}\n{"c": 3}'
+
+    assert await lines(body) == [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}']
+    assert await lines(gzip.compress(body)) == [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}']
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("size", [1, 5, 1024])
+async def test_every_gzip_member_is_read(size):
+    body = gzip.compress(b'{"a": 1}\n{"b": 2}\n') + gzip.compress(b'{"c": 3}\n') + gzip.compress(b'{"d": 4}')
+
+    assert await lines(body, size) == [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}', b'{"d": 4}']
+
+
+@pytest.mark.anyio
+async def test_truncated_gzip_is_rejected():
+    body = gzip.compress(b'{"a": 1}\n') + gzip.compress(b'{"b": 2}\n')[:-4]
+
+    with pytest.raises(_StreamError, match="Truncated"):
+        await lines(body)
+
+
+@pytest.mark.anyio
+async def test_trailing_garbage_after_gzip_is_rejected():
+    with pytest.raises(_StreamError, match="Invalid gzip"):
+        await lines(gzip.compress(b'{"a": 1}\n') + b"not gzip")
+
+
+def test_export_import_round_trip(client, web_user):
+    namespace = f"transfer-{uuid.uuid4().hex[:8]}"
+    headers = web_user["headers"]
+    exports = []
+    for uid, text in (("a", "first"), ("b", "second")):
+        response = client.post("/api/v1/memory/save", json={"uid": uid, "namespace": namespace, "text": text}, headers=headers)
+        assert response.status_code == 200
+        response = client.get("/api/v1/memory/export", params={"uid": uid, "namespace": namespace, "gzip": True}, headers=headers)
+        assert [json.loads(line)["text"] for line in gzip.decompress(response.content).splitlines()] == [text]
+        exports.append(response.content)
+
+    # Concatenated exports are one gzip file with two members
+    response = client.post("/api/v1/memory/import", params={"uid": "c"}, content=b"".join(exports), headers=headers)
+    assert response.status_code == 200, response.text
+
+    response = client.post("/api/v1/memory/query", json={"uid": "c", "namespace": namespace}, headers=headers)
+    assert sorted(memory["text"] for memory in response.json()["data"]) == ["first", "second"]
@@ -0,0 +1,106 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.crud.memory import create_memory
+from app.db.compaction import compact
+from app.db.database import engine
+from app.db.models import Memory
+from app.schemas.memory import MemoryCreateRequest
+from app.services.near_duplicates import BANDS, NearDuplicateError, clusters, lsh_bands, shingles, similarity
+
+
+@pytest.fixture
+def namespace() -> str:
+    return f"duplicates-{uuid.uuid4().hex[:8]}"
+
+
+async def save(db, user, namespace: str, text: str, tags=(), **kwargs) -> Memory:
+    request = MemoryCreateRequest(uid="u", namespace=namespace, text=text, tags=list(tags))
+    return await create_memory(db, request, user_id=user.id, **kwargs)
+
+
+def test_similarity_of_rewordings():
+    original = shingles("User prefers dark mode")
+    assert similarity(original, shingles("user prefers the dark mode")) >= settings.near_duplicate_threshold
+    assert similarity(original, shingles("Booked a flight to Lisbon")) < 0.1
+    assert similarity(original, set()) == 0.0
+
+
+def test_band_keys_are_stable_per_text():
+    bands = lsh_bands("User prefers dark mode")
+    assert len(bands) == BANDS
+    assert bands == lsh_bands("user PREFERS dark mode")
+    assert set(bands) & set(lsh_bands("user prefers the dark mode"))
+    assert lsh_bands("") == []
+
+
+def test_clusters_group_near_duplicates():
+    texts = ["User prefers dark mode", "Booked a flight to Lisbon", "user prefers the dark mode", "booked a flight to lisbon!"]
+    assert sorted(clusters(texts, settings.near_duplicate_threshold)) == [[0, 2], [1, 3]]
+    assert clusters(texts[:2], settings.near_duplicate_threshold) == []
+
+
+@pytest.mark.anyio
+async def test_same_content_is_saved_once(db, user, namespace):
+    first = await save(db, user, namespace, "User prefers dark mode", ["ui"])
+    again = await save(db, user, namespace, "  user PREFERS dark   mode", ["pref"])
+
+    assert again.id == first.id
+    assert again.tags == ["ui", "pref"]
+    assert again.text == "User prefers dark mode"
+
+
+@pytest.mark.anyio
+async def test_near_duplicate_is_merged_or_rejected(db, user, namespace):
+    first = await save(db, user, namespace, "User prefers dark mode", ["ui"])
+
+    with pytest.raises(NearDuplicateError) as raised:
+        await save(db, user, namespace, "The user prefers dark mode", on_near_duplicate="reject")
+    assert raised.value.memory_id == first.id
+
+    merged = await save(db, user, namespace, "The user prefers dark mode", ["pref"], on_near_duplicate="merge")
+    assert merged.id == first.id
+    assert merged.text == "The user prefers dark mode"
+    assert merged.tags == ["ui", "pref"]
+
+
+@pytest.mark.anyio
+async def test_merge_into_text_another_memory_has(db, user, namespace):
+    near_id = (await save(db, user, namespace, "User prefers dark mode", ["ui"])).id
+    hidden_id = (await save(db, user, namespace, "The user prefers dark mode", ["old"])).id
+    # Expired but not reaped yet, so it isn't a candidate but still holds the content hash
+    await db.execute(
+        update(Memory).where(Memory.id == hidden_id).values(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+    )
+    await db.commit()
+
+    saved = await save(db, user, namespace, "The user prefers dark mode", ["pref"], on_near_duplicate="merge")
+    assert saved.id == hidden_id
+    assert saved.expires_at is None
+    assert saved.tags == ["old", "pref"]
+
+    assert await db.scalar(select(Memory.text).where(Memory.id == near_id)) == "User prefers dark mode"
+
+
+@pytest.mark.anyio
+async def test_compaction_keeps_newest_with_all_tags(db, user, namespace):
+    older = (await save(db, user, namespace, "User prefers dark mode", ["ui"])).id
+    newer = (await save(db, user, namespace, "user prefers the dark mode", ["pref"])).id
+    other = (await save(db, user, namespace, "Booked a flight to Lisbon")).id
+
+    reported: list = []
+    with engine.connect() as conn:
+        assert compact(conn, settings.near_duplicate_threshold, namespace, report=reported.append)[:2] == (1, 1)
+    assert reported[0]["keep"]["id"] == newer and [row["id"] for row in reported[0]["duplicates"]] == [older]
+
+    with engine.connect() as conn:
+        found, duplicates, changed = compact(conn, settings.near_duplicate_threshold, namespace, merge=True)
+        conn.commit()
+    assert (found, duplicates, changed) == (1, 1, {(user.id, namespace)})
+
+    rows = (await db.execute(select(Memory.id, Memory.tags).where(Memory.namespace == namespace).order_by(Memory.id))).all()
+    assert [(row.id, row.tags) for row in rows] == [(newer, ["pref", "ui"]), (other, [])]
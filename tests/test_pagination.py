@@ -0,0 +1,22 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.utils.pagination import CREATED, RANK, InvalidCursorError, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(CREATED, created_at, 42), CREATED) == (created_at, 42)
+    assert decode_cursor(encode_cursor(RANK, 0.25, 7), RANK) == (0.25, 7)
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "W10", encode_cursor(RANK, "high", 1), encode_cursor(RANK, 0.5, "1")])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, RANK)
+
+
+def test_cursor_of_another_ordering_is_rejected():
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(encode_cursor(RANK, 0.5, 1), CREATED)
@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import text
+
+from app.db import partitioning
+from app.db.database import engine
+from app.db.partitioning import partition_count, partition_memories, unpartition_memories
+
+SCRATCH = "memories_scratch"
+
+
+@pytest.fixture
+def conn(database, monkeypatch):
+    """
+    A connection to an empty copy of memories, in a transaction that is
+    rolled back; the conversions are pointed at the copy.
+    """
+    monkeypatch.setattr(partitioning, "TABLE", SCRATCH)
+    monkeypatch.setattr(partitioning, "OLD_TABLE", f"{SCRATCH}_old")
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            conn.execute(text(f"CREATE TABLE {SCRATCH} (LIKE memories INCLUDING ALL)"))
+            conn.execute(text(
+                f"CREATE TRIGGER {SCRATCH}_search_vector BEFORE INSERT OR UPDATE OF text, tags ON {SCRATCH} "
+                "FOR EACH ROW EXECUTE FUNCTION memories_search_vector_update()"
+            ))
+            yield conn
+        finally:
+            transaction.rollback()
+
+
+def scalar(conn, sql: str, **params):
+    return conn.execute(text(sql), params).scalar_one()
+
+
+def insert(conn, namespace: str) -> int:
+    return scalar(
+        conn,
+        f"INSERT INTO {SCRATCH} (uid, namespace, text, tags) VALUES ('u', :namespace, 'dark mode', '{{ui}}') RETURNING id",
+        namespace=namespace,
+    )
+
+
+def test_partition_and_back(conn):
+    first = insert(conn, "before")
+    assert partition_count(conn) == 0
+
+    partition_memories(conn, 4)
+    assert partition_count(conn) == 4
+    assert scalar(conn, f"SELECT namespace FROM {SCRATCH} WHERE id = :id", id=first) == "before"
+    # Indexes and triggers came along, on every partition
+    indexes = scalar(conn, f"SELECT count(*) FROM pg_indexes WHERE tablename = '{SCRATCH}_p0'")
+    assert indexes == scalar(conn, "SELECT count(*) FROM pg_indexes WHERE tablename = 'memories'")
+    second = insert(conn, "after")
+    assert scalar(conn, f"SELECT search_vector @@ to_tsquery('ui') FROM {SCRATCH} WHERE id = :id", id=second)
+
+    # Queries on one namespace read one partition
+    plan = "\n".join(conn.execute(text(f"EXPLAIN SELECT * FROM {SCRATCH} WHERE namespace = 'after'")).scalars())
+    assert sum(f"{SCRATCH}_p{i} " in plan for i in range(4)) == 1
+
+    partition_memories(conn, 8)  # already partitioned
+    assert partition_count(conn) == 4
+
+    unpartition_memories(conn)
+    assert partition_count(conn) == 0
+    assert scalar(conn, f"SELECT count(*) FROM {SCRATCH}") == 2
+
+
+def test_partitions_must_be_positive(conn):
+    with pytest.raises(ValueError):
+        partition_memories(conn, 0)
@@ -0,0 +1,265 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+import pytest
+from redis.exceptions import RedisError
+
+from app.db.routing import ReadScope, replica_read
+from app.schemas.memory import MemoryQueryRequest
+from app.services import query_cache as query_cache_module
+from app.services import redis_client
+from app.services.query_cache import (
+    QueryCache, etag, etag_is_current, generation_age, new_generation, request_digest,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class BrokenRedis:
+    def __getattr__(self, name):
+        async def fail(*args, **kwargs):
+            raise RedisError("connection lost")
+        return fail
+
+
+@pytest.fixture
+def cache(redis, monkeypatch) -> QueryCache:
+    monkeypatch.setattr(redis_client, "_down_until", 0.0)
+    return QueryCache(enabled=True, maxsize=100, ttl=60, local_ttl=5)
+
+
+@pytest.fixture
+def user_id() -> int:
+    # Generations live in the shared Redis, so every test gets its own user
+    return uuid.uuid4().int % 10**9 + 10**9
+
+
+def counting_run(bodies: list, expires: Optional[datetime] = None, asked: Optional[list] = None):
+    async def run(with_expiry: bool) -> Tuple[bytes, Optional[datetime]]:
+        bodies.append(f"body {len(bodies)}".encode())
+        if asked is not None:
+            asked.append(with_expiry)
+        return bodies[-1], expires if with_expiry else None
+    return run
+
+
+def break_redis(monkeypatch) -> None:
+    monkeypatch.setattr(query_cache_module, "get_redis", BrokenRedis)
+
+
+def heal_redis(monkeypatch) -> None:
+    monkeypatch.setattr(query_cache_module, "get_redis", redis_client.get_redis)
+    monkeypatch.setattr(redis_client, "_down_until", 0.0)
+
+
+class RecordingRouter:
+    def __init__(self, events: list):
+        self.events = events
+
+    async def pin(self, *scopes):
+        self.events.append(("pin", set(scopes)))
+
+
+def test_request_digest_ignores_tag_order_and_spacing():
+    a = MemoryQueryRequest(uid="u", tags=["b", "a", "a"], query="dark   mode ")
+    b = MemoryQueryRequest(uid="u", tags=["a", "b"], query="dark mode")
+    assert request_digest(a) == request_digest(b)
+    assert request_digest(a) != request_digest(MemoryQueryRequest(uid="u", query="dark mode"))
+
+
+async def test_hit_until_namespace_is_invalidated(cache, user_id):
+    request = MemoryQueryRequest(uid="u", namespace="ns")
+    bodies: list = []
+
+    key = await cache.key(user_id, request)
+    assert (await cache.get_or_set(key, counting_run(bodies)))[0] == b"body 0"
+    assert (await cache.get_or_set(await cache.key(user_id, request), counting_run(bodies)))[0] == b"body 0"
+
+    await cache.invalidate(user_id, [("u", "other")])
+    assert await cache.key(user_id, request) == key
+
+    await cache.invalidate(user_id, [("u", "ns")])
+    new_key = await cache.key(user_id, request)
+    assert new_key != key
+    assert (await cache.get_or_set(new_key, counting_run(bodies)))[0] == b"body 1"
+
+
+async def test_other_workers_see_invalidation(cache, user_id):
+    request = MemoryQueryRequest(uid="u", namespace="ns")
+    other_worker = QueryCache(enabled=True, maxsize=100, ttl=60, local_ttl=0)
+
+    key = await other_worker.key(user_id, request)
+    await cache.invalidate(user_id, [("u", "ns")])
+    assert await other_worker.key(user_id, request) != key
+
+
+async def test_failed_invalidation_bypasses_cache_until_retried(cache, user_id, monkeypatch):
+    request = MemoryQueryRequest(uid="u", namespace="ns")
+    bodies: list = []
+    stale_key = await cache.key(user_id, request)
+    await cache.get_or_set(stale_key, counting_run(bodies))
+
+    break_redis(monkeypatch)
+    await cache.invalidate(user_id, [("u", "ns")])
+    monkeypatch.setattr(redis_client, "_down_until", 0.0)
+    assert await cache.key(user_id, request) is None
+
+    # The next lookup once Redis is back retries the invalidation
+    heal_redis(monkeypatch)
+    key = await cache.key(user_id, request)
+    assert key is not None and key != stale_key
+    assert (await cache.get_or_set(key, counting_run(bodies)))[0] == b"body 1"
+    assert not cache._dirty
+
+
+async def test_dirty_scope_is_released_once_stale_entries_expired(cache, user_id, monkeypatch):
+    break_redis(monkeypatch)
+    await cache.invalidate(user_id, [("u", "ns")])
+    scope = f"{user_id}:ns"
+    assert not await cache._repair(scope)
+
+    cache._dirty[scope] = time.monotonic() - cache.ttl
+    assert await cache._repair(scope)
+    assert scope not in cache._dirty
+
+
+async def test_cache_bypassed_while_redis_is_down(cache, user_id, monkeypatch):
+    request = MemoryQueryRequest(uid="u", namespace="ns")
+    monkeypatch.setattr(redis_client, "_down_until", time.monotonic() + 60)
+    assert await cache.key(user_id, request) is None
+
+    bodies: list = []
+    assert (await cache.get_or_set(None, counting_run(bodies)))[0] == b"body 0"
+    assert (await cache.get_or_set(None, counting_run(bodies)))[0] == b"body 1"
+
+
+async def test_expiry_is_only_asked_for_stored_or_tagged_results(cache, user_id):
+    key = await cache.key(user_id, MemoryQueryRequest(uid="u", namespace="ns"))
+    disabled = QueryCache(enabled=False, maxsize=100, ttl=60, local_ttl=5)
+    bodies: list = []
+    asked: list = []
+
+    assert (await cache.get_or_set(None, counting_run(bodies, asked=asked), tagged=True))[1] is None
+    await disabled.get_or_set(key, counting_run(bodies, asked=asked))
+    # Tags don't depend on the cache being enabled
+    assert (await disabled.get_or_set(key, counting_run(bodies, asked=asked), tagged=True))[1] == etag(key, None)
+    await cache.get_or_set(key, counting_run(bodies, asked=asked))
+    assert asked == [False, False, True, True]
+
+
+async def test_etag_changes_with_generation_and_expiry(cache, user_id):
+    request = MemoryQueryRequest(uid="u", namespace="ns")
+    key = await cache.key(user_id, request)
+    now = datetime.now(timezone.utc)
+
+    assert etag_is_current(key, etag(key, None))
+    assert etag_is_current(key, etag(key, now + timedelta(minutes=1)))
+    assert not etag_is_current(key, etag(key, now - timedelta(seconds=1)))
+    assert not etag_is_current(key, '"not-a-tag"')
+
+    await cache.invalidate(user_id, [("u", "ns")])
+    assert not etag_is_current(await cache.key(user_id, request), etag(key, None))
+
+
+async def test_cached_responses_keep_their_etag(cache, user_id):
+    key = await cache.key(user_id, MemoryQueryRequest(uid="u", namespace="ns"))
+    other_worker = QueryCache(enabled=True, maxsize=100, ttl=60, local_ttl=5)
+    expires = datetime.now(timezone.utc) + timedelta(minutes=1)
+    bodies: list = []
+
+    assert await cache.get_or_set(key, counting_run(bodies, expires), tagged=True) == (b"body 0", etag(key, expires))
+    assert await cache.get_or_set(key, counting_run(bodies), tagged=True) == (b"body 0", etag(key, expires))
+    assert await other_worker.get_or_set(key, counting_run(bodies), tagged=True) == (b"body 0", etag(key, expires))
+    assert (await cache.get_or_set(key, counting_run(bodies)))[1] is None
+
+
+async def test_within_days_queries_are_not_cached(cache, user_id):
+    assert await cache.key(user_id, MemoryQueryRequest(uid="u", within_days=3)) is None
+
+
+def test_write_pins_cover_reads_of_it():
+    uid_write = set(ReadScope(1, "u", "ns").pin_keys())
+    namespace_write = set(ReadScope(1, None, "ns").pin_keys())
+
+    assert uid_write & set(ReadScope(1, "u", "ns").read_keys())
+    assert uid_write & set(ReadScope(1, "u").read_keys())
+    assert not uid_write & set(ReadScope(1, "v", "ns").read_keys())
+    assert namespace_write & set(ReadScope(1, "v", "ns").read_keys())
+    assert not namespace_write & set(ReadScope(1, "v", "other").read_keys())
+    assert not namespace_write & set(ReadScope(2, "v", "ns").read_keys())
+
+
+def test_generation_age():
+    assert generation_age(new_generation()) < 1
+    assert generation_age(new_generation(started=time.time() - 30)) == pytest.approx(30, abs=1)
+    assert generation_age(uuid.uuid4().hex) is None
+
+
+async def test_writes_are_pinned_before_generation_is_replaced(cache, user_id, monkeypatch):
+    events: list = []
+    monkeypatch.setattr(query_cache_module, "read_router", RecordingRouter(events))
+    bump = cache._bump
+
+    async def recording_bump(scope):
+        events.append(("bump", scope))
+        return await bump(scope)
+
+    monkeypatch.setattr(cache, "_bump", recording_bump)
+    await cache.invalidate(user_id, [("u", "ns"), ("v", "ns"), (None, "other")])
+
+    assert events[0] == ("pin", {ReadScope(user_id, "u", "ns"), ReadScope(user_id, "v", "ns"), ReadScope(user_id, None, "other")})
+    assert sorted(events[1:]) == [("bump", f"{user_id}:ns"), ("bump", f"{user_id}:other")]
+
+
+async def test_young_replica_reads_are_not_cached(cache, user_id, monkeypatch):
+    request = MemoryQueryRequest(uid="u", namespace="ns")
+    bodies: list = []
+
+    def routed_run(replica: bool):
+        async def run(with_expiry: bool) -> Tuple[bytes, Optional[datetime]]:
+            replica_read.set(replica)
+            return await counting_run(bodies)(with_expiry)
+        return run
+
+    replica_run, primary_run = routed_run(True), routed_run(False)
+
+    await cache.invalidate(user_id, [("u", "ns")])
+    key = await cache.key(user_id, request)
+    assert await cache.get_or_set(key, replica_run, tagged=True) == (b"body 0", None)
+    assert (await cache.get_or_set(key, replica_run))[0] == b"body 1"
+    assert (await cache.get_or_set(key, primary_run))[0] == b"body 2"
+    assert (await cache.get_or_set(key, replica_run))[0] == b"body 2"
+
+    # Once the generation is older than the pins, replica reads are cached too
+    monkeypatch.setattr(query_cache_module.settings, "replica_pin_seconds", 0)
+    key = await cache.key(user_id, MemoryQueryRequest(uid="v", namespace="ns"))
+    assert (await cache.get_or_set(key, replica_run))[0] == b"body 3"
+    assert (await cache.get_or_set(key, replica_run))[0] == b"body 3"
+
+
+async def test_entries_expire_with_their_first_memory(cache, user_id):
+    request = MemoryQueryRequest(uid="u", namespace="ns")
+    other_worker = QueryCache(enabled=True, maxsize=100, ttl=60, local_ttl=5)
+    bodies: list = []
+    key = await cache.key(user_id, request)
+    soon = datetime.now(timezone.utc) + timedelta(seconds=0.3)
+
+    assert (await cache.get_or_set(key, counting_run(bodies, soon)))[0] == b"body 0"
+    assert (await cache.get_or_set(key, counting_run(bodies)))[0] == b"body 0"
+    assert (await other_worker.get_or_set(key, counting_run(bodies)))[0] == b"body 0"
+
+    await asyncio.sleep(0.4)
+    assert (await cache.get_or_set(key, counting_run(bodies)))[0] == b"body 1"
+    assert (await other_worker.get_or_set(key, counting_run(bodies)))[0] == b"body 1"
+
+
+async def test_expired_results_are_not_stored(cache, user_id):
+    key = await cache.key(user_id, MemoryQueryRequest(uid="u", namespace="ns"))
+    bodies: list = []
+    expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+
+    assert (await cache.get_or_set(key, counting_run(bodies, expired)))[0] == b"body 0"
+    assert (await cache.get_or_set(key, counting_run(bodies)))[0] == b"body 1"
@@ -0,0 +1,45 @@
+"""The query shapes of scripts/bench/explain_check.py, on a small seeded tenant set."""
+
+import importlib.util
+from pathlib import Path
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db.database import engine
+
+SCRIPT = Path(__file__).parent.parent / "scripts" / "bench" / "explain_check.py"
+
+
+def load_explain_check():
+    spec = importlib.util.spec_from_file_location("explain_check", SCRIPT)
+    module = importlib.util.module_from_spec(spec)  # type: ignore
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+explain_check = load_explain_check()
+
+
+@pytest.fixture(scope="module")
+def seeded(database):
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        # Seeded the same way every run, and ANALYZEd, so the planner sees the same statistics
+        user_id, namespace = explain_check.seed(conn, rows=20000, tenants=20, random_seed=0.5)
+    yield user_id, namespace
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM memories WHERE user_id = :user_id"), {"user_id": user_id})
+        conn.execute(text("DELETE FROM users WHERE id = :user_id"), {"user_id": user_id})
+
+
+@pytest.mark.parametrize("shape", list(explain_check.SHAPES))
+def test_query_shape_uses_its_index(seeded, shape):
+    user_id, namespace = seeded
+    fields, expected, sort_allowed = explain_check.SHAPES[shape]
+    with Session(engine) as session:
+        request = explain_check.build_request(session, namespace, user_id, fields)
+        plan = explain_check.explain(session, request, user_id)
+        indexes = explain_check.index_names(session, expected)
+    assert explain_check.check(plan, expected, indexes, sort_allowed) == []
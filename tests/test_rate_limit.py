@@ -0,0 +1,69 @@
+import uuid
+
+import pytest
+
+from app.config import settings
+from app.db.models import ApiToken, User
+from app.deps import token_rate_limit
+from app.services.rate_limiter import RateLimiter
+from app.services.redis_client import close_redis, get_redis
+from app.services.token_cache import snapshot_token, token_from_snapshot
+
+
+def make_token(plan, rate_limit_per_hour=None) -> ApiToken:
+    return ApiToken(
+        id=1,
+        user_id=1,
+        token_name="test",
+        token_prefix="ajm_test",
+        permissions={},
+        rate_limit_per_hour=rate_limit_per_hour,
+        is_active=True,
+        user=User(id=1, plan=plan),
+    )
+
+
+def test_token_override_wins_over_plan():
+    assert token_rate_limit(make_token("premium", rate_limit_per_hour=42)) == 42
+    assert token_rate_limit(make_token("free", rate_limit_per_hour=42)) == 42
+
+
+def test_premium_token_without_override_gets_premium_tier():
+    assert token_rate_limit(make_token("premium")) == settings.rate_limit_premium_tier
+    assert token_rate_limit(make_token("ai")) == settings.rate_limit_premium_tier
+
+
+def test_other_plans_get_free_tier():
+    assert token_rate_limit(make_token("free")) == settings.rate_limit_free_tier
+    assert token_rate_limit(make_token(None)) == settings.rate_limit_free_tier
+
+
+def test_cached_token_keeps_plan():
+    cached = token_from_snapshot(snapshot_token(make_token("premium")))
+    assert cached.user.plan == "premium"
+    assert token_rate_limit(cached) == settings.rate_limit_premium_tier
+
+
+def test_ai_token_is_limited_by_premium_tier(client, ai_user):
+    params = {"uid": ai_user["uid"], "token": ai_user["token"]}
+
+    for _ in range(2):  # from the database, then from the token cache
+        response = client.get("/api/v1/ai/memory/save", params={**params, "text": "rate limited"})
+        assert response.status_code == 200
+        assert response.headers["X-RateLimit-Limit"] == str(settings.rate_limit_premium_tier)
+
+    response = client.get("/api/v1/ai/token/validate", params={"token": ai_user["token"]})
+    assert response.json()["data"]["rate_limit_per_hour"] == settings.rate_limit_premium_tier
+
+
+@pytest.mark.anyio
+async def test_limiter_survives_redis_reconnect(redis):
+    limiter = RateLimiter(local_max_keys=100)
+    key = f"test:{uuid.uuid4().hex}"
+
+    assert (await limiter.hit(key, 2)).allowed
+    await close_redis()
+    assert (await limiter.hit(key, 2)).allowed
+    assert limiter._script.registered_client is get_redis()
+    result = await limiter.hit(key, 2)
+    assert not result.allowed and result.retry_after > 0
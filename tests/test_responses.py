@@ -0,0 +1,81 @@
+import json
+from datetime import datetime, timezone
+
+from app.api.v1.endpoints import ai_memory
+from app.schemas.memory import MemoryData, MemoryListResponse, MemorySearchInfo
+from app.services.query_cache import query_cache
+from app.utils.responses import matching_etag, render_memory_list
+
+CREATED = datetime(2025, 1, 2, 3, 4, 5, 678000, tzinfo=timezone.utc)
+
+
+def memory_row(id: int, expires_at=None) -> tuple:
+    # Shaped like query_memories rows: MemoryData fields, then the sort value
+    return (id, "uid", "ns", f"memory {id}", ["a", "b"], None, CREATED, CREATED, expires_at, CREATED)
+
+
+def test_render_matches_response_model():
+    rows = [memory_row(1), memory_row(2, expires_at=CREATED)]
+    search = MemorySearchInfo(candidate_cap=1000, candidates=2, truncated=False)
+
+    expected = MemoryListResponse(
+        data=[MemoryData(**dict(zip(MemoryData.model_fields, row))) for row in rows],
+        success=True,
+        next_cursor="abc",
+        search=search,
+    )
+
+    assert json.loads(render_memory_list(rows, "abc", search)) == expected.model_dump(mode="json")
+
+
+def test_render_empty_page():
+    assert json.loads(render_memory_list([])) == {
+        "data": [], "message": None, "success": True, "next_cursor": None, "search": None,
+    }
+
+
+
+def test_matching_etag_of_if_none_match():
+    def is_current(tag):
+        return tag == '"current"'
+
+    assert matching_etag('"current"', is_current) == '"current"'
+    assert matching_etag('W/"current"', is_current) == '"current"'
+    assert matching_etag('"other", "current"', is_current) == '"current"'
+    assert matching_etag('"other"', is_current) is None
+    assert matching_etag("*", lambda tag: True) is None
+    assert matching_etag(None, is_current) is None
+
+
+def test_unchanged_query_is_not_modified(client, ai_user):
+    params = {"uid": ai_user["uid"], "token": ai_user["token"]}
+    client.get("/api/v1/ai/memory/save", params={**params, "text": "first"})
+
+    response = client.get("/api/v1/ai/memory/query", params=params)
+    tag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    response = client.get("/api/v1/ai/memory/query", params=params, headers={"If-None-Match": tag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == tag
+    assert "X-RateLimit-Remaining" in response.headers
+
+    client.get("/api/v1/ai/memory/save", params={**params, "text": "second"})
+    response = client.get("/api/v1/ai/memory/query", params=params, headers={"If-None-Match": tag})
+    assert response.status_code == 200
+    assert [memory["text"] for memory in response.json()["data"]] == ["second", "first"]
+
+
+def test_current_etag_is_answered_without_the_query(client, ai_user, monkeypatch):
+    params = {"uid": ai_user["uid"], "token": ai_user["token"]}
+    client.get("/api/v1/ai/memory/save", params={**params, "text": "first"})
+    monkeypatch.setattr(query_cache, "enabled", False)
+    tag = client.get("/api/v1/ai/memory/query", params=params).headers["ETag"]
+
+    async def fail(*args, **kwargs):
+        raise AssertionError("the query ran")
+
+    monkeypatch.setattr(ai_memory, "query_memories", fail)
+    response = client.get("/api/v1/ai/memory/query", params=params, headers={"If-None-Match": tag})
+    assert response.status_code == 304
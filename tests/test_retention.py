@@ -0,0 +1,142 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, update
+
+from app.crud.memory import create_memory, query_memories
+from app.crud.retention_rules import delete_retention_rule, set_retention_rule
+from app.db.models import Memory
+from app.schemas.memory import MemoryCreateRequest, MemoryQueryRequest
+from app.services.retention import MemoryReaper
+
+
+@pytest.fixture
+def namespace() -> str:
+    return f"retention-{uuid.uuid4().hex[:8]}"
+
+
+async def save(db, user, namespace: str, text: str, ttl=None) -> Memory:
+    return await create_memory(db, MemoryCreateRequest(uid="u", namespace=namespace, text=text, ttl=ttl), user_id=user.id)
+
+
+async def visible(db, user, namespace: str) -> list:
+    rows, _, _, _ = await query_memories(db, MemoryQueryRequest(uid="u", namespace=namespace), user_id=user.id)
+    return sorted(row.text for row in rows)
+
+
+async def exists(db, memory_id: int) -> bool:
+    return await db.scalar(select(Memory.id).where(Memory.id == memory_id)) is not None
+
+
+async def backdate(db, memory_id: int, **columns) -> None:
+    await db.execute(update(Memory).where(Memory.id == memory_id).values(**columns))
+    await db.commit()
+
+
+@pytest.mark.anyio
+async def test_memory_disappears_when_its_ttl_passes(db, user, namespace):
+    expiring = await save(db, user, namespace, "expiring", ttl=3600)
+    await save(db, user, namespace, "forever")
+    assert expiring.expires_at is not None
+    assert await visible(db, user, namespace) == ["expiring", "forever"]
+
+    await backdate(db, expiring.id, expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+    assert await visible(db, user, namespace) == ["forever"]
+
+    assert await MemoryReaper(interval=0, batch_size=100).reap() >= 1
+    assert not await exists(db, expiring.id)
+
+
+@pytest.mark.anyio
+async def test_retention_rule_hides_and_reaps_old_memories(db, user, namespace):
+    old = await save(db, user, namespace, "old")
+    await save(db, user, namespace, "new")
+    await backdate(db, old.id, created_at=datetime.now(timezone.utc) - timedelta(days=10))
+
+    await set_retention_rule(db, user.id, namespace, max_age_days=30)
+    assert await visible(db, user, namespace) == ["new", "old"]
+
+    await set_retention_rule(db, user.id, namespace, max_age_days=5)
+    assert await visible(db, user, namespace) == ["new"]
+
+    assert await delete_retention_rule(db, user.id, namespace)
+    assert await visible(db, user, namespace) == ["new", "old"]
+
+    await set_retention_rule(db, user.id, namespace, max_age_days=5)
+    await MemoryReaper(interval=0, batch_size=100).reap()
+    assert not await exists(db, old.id)
+
+
+@pytest.mark.anyio
+async def test_saving_again_replaces_expiry(db, user, namespace):
+    memory = await save(db, user, namespace, "note", ttl=60)
+    again = await save(db, user, namespace, "note")
+
+    assert again.id == memory.id
+    assert again.expires_at is None
+
+
+def test_reaper_restarts_on_a_new_event_loop():
+    reaper = MemoryReaper(interval=60, batch_size=100)
+    passes = []
+
+    async def reap() -> int:
+        passes.append(1)
+        return 0
+
+    reaper.reap = reap  # type: ignore
+
+    async def run() -> None:
+        reaper.start()
+        await asyncio.sleep(0.05)  # until the reaper waits for the next pass
+        await reaper.stop()
+
+    for runs in (1, 2):
+        asyncio.run(run())
+        assert len(passes) == runs
+
+
+@pytest.mark.anyio
+async def test_query_reports_when_the_page_first_expires(db, user, namespace):
+    request = MemoryQueryRequest(uid="u", namespace=namespace)
+    old = await save(db, user, namespace, "old")
+    await backdate(db, old.id, created_at=datetime.now(timezone.utc) - timedelta(days=2))
+    *_, expires = await query_memories(db, request, user_id=user.id, with_expiry=True)
+    assert expires is None
+
+    await set_retention_rule(db, user.id, namespace, max_age_days=3)
+    *_, expires = await query_memories(db, request, user_id=user.id, with_expiry=True)
+    assert abs(expires - (datetime.now(timezone.utc) + timedelta(days=1))) < timedelta(minutes=1)
+
+    expiring = await save(db, user, namespace, "expiring", ttl=60)
+    *_, expires = await query_memories(db, request, user_id=user.id, with_expiry=True)
+    assert expires == expiring.expires_at
+
+    # Only the memories of the page count, not those skipped before it
+    offset_request = MemoryQueryRequest(uid="u", namespace=namespace, offset=1)
+    *_, expires = await query_memories(db, offset_request, user_id=user.id, with_expiry=True)
+    assert abs(expires - (datetime.now(timezone.utc) + timedelta(days=1))) < timedelta(minutes=1)
+
+    # Nor is it looked up unless asked for
+    *_, expires = await query_memories(db, request, user_id=user.id)
+    assert expires is None
+
+
+def test_cached_query_drops_expired_memory(client, ai_user):
+    params = {"uid": ai_user["uid"], "namespace": ai_user["namespace"], "token": ai_user["token"]}
+    assert client.get("/api/v1/ai/memory/save", params={**params, "text": "expiring", "ttl": 1}).status_code == 200
+    assert client.get("/api/v1/ai/memory/save", params={**params, "text": "forever"}).status_code == 200
+
+    response = client.get("/api/v1/ai/memory/query", params=params)
+    assert sorted(memory["text"] for memory in response.json()["data"]) == ["expiring", "forever"]
+    etag = response.headers["ETag"]
+    assert client.get("/api/v1/ai/memory/query", params=params, headers={"If-None-Match": etag}).status_code == 304
+
+    time.sleep(1.1)
+    response = client.get("/api/v1/ai/memory/query", params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [memory["text"] for memory in response.json()["data"]] == ["forever"]
+    assert response.headers["ETag"] != etag
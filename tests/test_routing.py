@@ -0,0 +1,89 @@
+import time
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from app.config import settings
+from app.db.routing import ReadRouter, ReadScope, replica_read
+from app.services import redis_client
+
+pytestmark = pytest.mark.anyio
+
+UNREACHABLE_URL = "postgresql://nobody@127.0.0.1:1/ajimemo"
+
+
+@pytest.fixture
+async def router(db):
+    # The primary stands in for a replica: it reports no lag
+    router = ReadRouter([settings.database_url], max_lag=1, check_interval=1, pin_seconds=5)
+    yield router
+    await router.close()
+
+
+@pytest.fixture
+def user_id() -> int:
+    # Pins live in the shared Redis, so every test gets its own user
+    return uuid.uuid4().int % 10**9 + 10**9
+
+
+async def where(router: ReadRouter, scope: ReadScope) -> str:
+    async def read(db):
+        await db.execute(text("SELECT 1"))
+        return "replica" if db.bind is router.replicas[0].engine else "primary"
+
+    return await router.run(scope, read)
+
+
+async def test_replicas_take_reads_once_checked(router, user_id):
+    scope = ReadScope(user_id, "u", "ns")
+    assert await where(router, scope) == "primary"
+
+    await router._check(router.replicas[0])
+    assert router.replicas[0].healthy
+    assert await where(router, scope) == "replica"
+    assert replica_read.get()
+
+
+async def test_written_scopes_read_from_primary(router, user_id):
+    await router._check(router.replicas[0])
+    await router.pin(ReadScope(user_id, "u", "ns"))
+
+    assert await where(router, ReadScope(user_id, "u", "ns")) == "primary"
+    assert not replica_read.get()
+    assert await where(router, ReadScope(user_id, "u")) == "primary"
+    assert await where(router, ReadScope(user_id, "u", "other")) == "replica"
+    assert await where(router, ReadScope(user_id, "v", "ns")) == "replica"
+
+    # Writes across a namespace, e.g. retention rules, cover every uid
+    await router.pin(ReadScope(user_id, None, "shared"))
+    assert await where(router, ReadScope(user_id, "v", "shared")) == "primary"
+
+
+async def test_pins_are_shared_by_workers(router, user_id):
+    other_worker = ReadRouter([settings.database_url], max_lag=1, check_interval=1, pin_seconds=5)
+    try:
+        await other_worker._check(other_worker.replicas[0])
+        await router.pin(ReadScope(user_id, "u", "ns"))
+        assert await where(other_worker, ReadScope(user_id, "u", "ns")) == "primary"
+    finally:
+        await other_worker.close()
+
+
+async def test_reads_stay_on_primary_while_redis_is_down(router, user_id, monkeypatch):
+    await router._check(router.replicas[0])
+    monkeypatch.setattr(redis_client, "_down_until", time.monotonic() + 60)
+    assert await where(router, ReadScope(user_id, "u", "ns")) == "primary"
+
+
+async def test_failed_replica_read_is_retried_on_primary(db, user_id):
+    router = ReadRouter([UNREACHABLE_URL], max_lag=1, check_interval=1, pin_seconds=5)
+    try:
+        await router._check(router.replicas[0])
+        assert not router.replicas[0].healthy
+
+        router.replicas[0].set_healthy(True)
+        assert await where(router, ReadScope(user_id, "u", "ns")) == "primary"
+        assert not router.replicas[0].healthy
+    finally:
+        await router.close()
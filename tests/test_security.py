@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import uuid
+
+import pytest
+
+from app.utils import security
+from app.utils.security import (
+    HashingExecutor,
+    HashingOverloadedError,
+    hash_api_token,
+    hash_password_async,
+    verify_api_token_async,
+    verify_password_async,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_async_hashing_round_trip():
+    hashed = await hash_password_async("secret-password")
+    assert await verify_password_async("secret-password", hashed)
+    assert not await verify_password_async("wrong-password", hashed)
+
+    assert await verify_api_token_async("token", hash_api_token("token"))
+
+
+async def test_hashing_runs_off_the_event_loop():
+    executor = HashingExecutor(max_workers=1, max_queue=1)
+    ticks = 0
+
+    async def tick() -> None:
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.create_task(tick())
+    await executor.run(security.hash_password, "secret-password")
+    ticker.cancel()
+    assert ticks > 1
+
+
+async def test_jobs_beyond_the_queue_are_rejected():
+    executor = HashingExecutor(max_workers=1, max_queue=1)
+    release = threading.Event()
+    running = [asyncio.create_task(executor.run(release.wait, 5)) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    assert executor.pending == 2 and executor.queued == 1
+
+    with pytest.raises(HashingOverloadedError):
+        await executor.run(release.wait, 5)
+
+    release.set()
+    assert await asyncio.gather(*running) == [True, True]
+    assert executor.pending == 0
+
+
+def test_overloaded_registration_gets_503(client, monkeypatch):
+    async def overloaded(*args):
+        raise HashingOverloadedError("Too many pending hashing jobs")
+
+    monkeypatch.setattr(security.hashing_executor, "run", overloaded)
+    email = f"busy-{uuid.uuid4().hex[:12]}@example.com"
+    response = client.post("/api/v1/auth/register", json={"email": email, "password": "secret-password"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,91 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.crud.api_tokens import create_api_token, deactivate_token
+from app.deps import validate_api_token
+from app.services.token_cache import TokenCache, snapshot_token, token_from_snapshot
+from app.utils.security import generate_api_token
+
+pytestmark = pytest.mark.anyio
+
+
+def make_cache(**kwargs) -> TokenCache:
+    return TokenCache(**{"maxsize": 100, "ttl": 60, "local_ttl": 5, "negative_ttl": 30, **kwargs})
+
+
+def digest() -> str:
+    return uuid.uuid4().hex
+
+
+async def test_hits_are_shared_through_redis(redis):
+    cache, other_worker = make_cache(), make_cache()
+    token_digest = digest()
+    snapshot = {"id": 1, "expires_at": None}
+
+    assert await cache.get(token_digest) == (False, None)
+    await cache.set(token_digest, snapshot)
+    assert await cache.get(token_digest) == (True, snapshot)
+    assert await other_worker.get(token_digest) == (True, snapshot)
+
+
+async def test_misses_are_cached(redis):
+    cache, other_worker = make_cache(), make_cache()
+    token_digest = digest()
+
+    await cache.set_missing(token_digest)
+    assert await cache.get(token_digest) == (True, None)
+    assert await other_worker.get(token_digest) == (True, None)
+
+
+async def test_eviction_reaches_other_workers(redis):
+    cache, other_worker = make_cache(), make_cache()
+    listener = asyncio.create_task(other_worker.listen())
+    try:
+        await asyncio.sleep(0.1)  # until subscribed
+        token_digest = digest()
+        await cache.set(token_digest, {"id": 1, "expires_at": None})
+        assert (await other_worker.get(token_digest))[0]
+
+        await cache.evict(token_digest)
+        await asyncio.sleep(0.1)
+        assert await other_worker.get(token_digest) == (False, None)
+    finally:
+        listener.cancel()
+
+
+async def test_tokens_are_not_cached_past_their_expiry(redis):
+    cache = make_cache()
+    expired = {"id": 1, "expires_at": (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()}
+    token_digest = digest()
+
+    await cache.set(token_digest, expired)
+    assert await cache.get(token_digest) == (False, None)
+
+
+async def test_local_cache_is_bounded(redis):
+    cache = make_cache(maxsize=2)
+    for _ in range(3):
+        await cache.set(digest(), {"id": 1, "expires_at": None})
+    assert len(cache._local) == 2
+
+
+async def test_snapshot_round_trip(api_token):
+    restored = token_from_snapshot(snapshot_token(api_token))
+    assert restored.id == api_token.id
+    assert restored.created_at == api_token.created_at
+    assert restored.user.plan == api_token.user.plan
+
+
+async def test_deactivated_token_is_rejected_right_away(db, user):
+    token = generate_api_token()
+    api_token = await create_api_token(db, user.id, "test", token)
+    assert (await validate_api_token(token, db)).id == api_token.id  # now cached
+
+    assert await deactivate_token(db, api_token.id, user.id)  # type: ignore
+    with pytest.raises(HTTPException) as raised:
+        await validate_api_token(token, db)
+    assert raised.value.status_code == 401
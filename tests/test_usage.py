@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.api.middleware import usage as usage_middleware
+from app.api.middleware.usage import UNMATCHED_ENDPOINT, UsageMiddleware
+from app.db.database import SessionLocal
+from app.db.models import ApiUsage
+from app.services.usage import UsageRecorder
+
+
+def test_records_beyond_the_queue_are_dropped():
+    recorder = UsageRecorder(max_queue=2, batch_size=10, flush_interval=60)
+    for _ in range(3):
+        recorder.record(endpoint="/x")
+
+    assert recorder.qsize() == 2
+
+
+def test_recorder_restarts_on_a_new_event_loop():
+    recorder = UsageRecorder(max_queue=10, batch_size=10, flush_interval=0.05)
+
+    async def run() -> None:
+        recorder.start()
+        await asyncio.sleep(0.01)  # until the writer waits
+        await recorder.stop()
+
+    asyncio.run(run())
+    asyncio.run(run())
+
+
+def test_routes_are_recorded_by_path_template(monkeypatch):
+    recorded: list = []
+    monkeypatch.setattr(usage_middleware.usage_recorder, "record", lambda **row: recorded.append(row["endpoint"]))
+
+    app = FastAPI()
+    app.add_middleware(UsageMiddleware)
+
+    @app.middleware("http")
+    async def authenticate(request: Request, call_next):
+        request.state.api_token = SimpleNamespace(id=1, user_id=1)
+        return await call_next(request)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {}
+
+    with TestClient(app) as client:
+        client.get("/items/1")
+        client.get("/items/2")
+        client.get("/nowhere/3")
+
+    assert recorded == ["/items/{item_id}", "/items/{item_id}", UNMATCHED_ENDPOINT]
+
+
+def test_token_requests_are_recorded(client, ai_user):
+    params = {"uid": ai_user["uid"], "token": ai_user["token"]}
+    client.get("/api/v1/ai/memory/query", params=params)
+    client.get("/api/v1/ai/memory/query", params={**params, "token": "wrong"})
+    client.__exit__(None, None, None)  # shutting down writes what is queued
+
+    with SessionLocal() as db:
+        usage = db.execute(
+            select(ApiUsage.endpoint, ApiUsage.response_status)
+            .where(ApiUsage.user_id == db.scalar(select(ApiUsage.user_id).where(ApiUsage.endpoint == "/api/v1/ai/memory/query").order_by(ApiUsage.id.desc()).limit(1)))
+        ).all()
+    assert ("/api/v1/ai/memory/query", 200) in usage